@@ -17,13 +17,16 @@
 from pdfminer.pdfinterp import PDFResourceManager, PDFPageInterpreter
 from pdfminer.converter import PDFPageAggregator
 from pdfminer.pdfpage import PDFPage
+from pdfminer.pdfparser import PDFParser
+from pdfminer.pdfdocument import PDFDocument
+from pdfminer.pdftypes import resolve1, dict_value, PDFStream
+from pdfminer.psparser import LIT
 # from pdfminer.layout import LAParams, LTTextContainer
 from pdfminer.layout import LAParams, LTTextContainer, LTContainer, LTTextBox, LTTextLine, LTChar
-
-# pip install pdfrw
-from pdfrw import PdfReader
-from pdfrw.buildxobj import pagexobj
-from pdfrw.toreportlab import makerl
+from pdfminer.pdfdevice import PDFDevice
+from pdfminer.pdffont import PDFUnicodeNotDefined
+from pdfminer.cmapdb import CMapDB
+import pdfminer
 
 # pip install reportlab
 from reportlab.pdfgen import canvas
@@ -31,53 +34,1258 @@ from reportlab.pdfbase.cidfonts import UnicodeCIDFont
 from reportlab.pdfbase import pdfmetrics
 from reportlab.pdfbase.ttfonts import TTFont
 from reportlab.lib.units import mm
+from reportlab.lib.rl_accel import fp_str
 
 # pip install pypdf
 from pypdf import PdfReader as PR2 # 名前が上とかぶるので別名を使用
 import pypdf
+from pypdf.generic import NameObject, NumberObject, NullObject, DictionaryObject, ArrayObject, DecodedStreamObject, ContentStream
+from pypdf.generic import IndirectObject, StreamObject
 
 # その他のimport
 import os,time
 import sys
+import re
+import io
+import hashlib
+import json
+import csv
+import sqlite3
+import pickle
+import tempfile
+import mmap
+from bisect import bisect_left, bisect_right
 import numpy as np
 import logging
-import glob
 import threading
-from multiprocessing import Process,Array
+from multiprocessing import Process,Array,Value,Event
 import shutil
+from PageCache import PageCache, FileDigest, CACHE_DIR
+
+kind = ""
+version = ""
+
+#@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@
+# 並列化 = False      # デバッグ時にはFalse,実行時はTrue
+並列化 = True
+
+#============================================================================
+#  浮動小数点数値を表しているかどうかを判定する関数
+#============================================================================
+def isfloat(s):  
+    try:
+        float(s)  # 文字列を実際にfloat関数で変換してみる
+    except ValueError:
+        return False
+    else:
+        return True
+    #end if
+#end def
+
+#============================================================================
+#  整数を表しているかどうかを判定する関数
+#============================================================================
+def isint(s):  
+    try:
+        int(s)  # 文字列を実際にint関数で変換してみる
+    except ValueError:
+        return False
+    else:
+        return True
+    #end if
+#end def
+
+#============================================================================
+#  日本語の計算書で使用されるCMap（pdfminerのCMapDB）の事前読込み
+#       JAPANESE_CMAPS  : 文字コードからCIDへの変換表
+#       JAPANESE_UMAPS  : CIDからUnicodeへの変換表（Registry-Ordering）
+#       CMAP_CACHE      : 読み込んだ変換表を保存するファイル
+#
+#   PreloadCMaps : 親プロセスで並列処理の前に１回だけ実行し、CMapDBのクラス変数に読み込む。
+#                  forkで起動した子プロセスはそのまま共有し、読み込んだ変換表はCMAP_CACHEにも保存する
+#   LoadCMaps    : 子プロセスの開始時に実行する。読込み済みの場合は何もせず、
+#                  spawnで起動した場合はCMAP_CACHEから読み込む（pdfminerのgzip+JSONより速い）
+#============================================================================
+JAPANESE_CMAPS = ["H", "V", "90ms-RKSJ-H", "90ms-RKSJ-V", "90msp-RKSJ-H", "90msp-RKSJ-V",
+                  "UniJIS-UCS2-H", "UniJIS-UCS2-V", "UniJIS-UCS2-HW-H", "UniJIS-UCS2-HW-V",
+                  "UniJIS-UTF16-H", "UniJIS-UTF16-V", "EUC-H", "EUC-V"]
+JAPANESE_UMAPS = ["Adobe-Japan1"]
+CMAP_CACHE = os.path.join(CACHE_DIR, "cmaps.db")
+
+CMapsLoaded = False
+
+def LoadCMaps(cachefile=CMAP_CACHE):
+    global CMapsLoaded
+    if CMapsLoaded:
+        return True
+    #end if
+    try:
+        with open(cachefile, "rb") as fp:
+            data = pickle.load(fp)
+        #end with
+    except Exception:
+        return False
+    #end try
+    if data.get("version") != pdfminer.__version__:
+        return False
+    #end if
+    CMapDB._cmap_cache.update(data["cmap"])
+    CMapDB._umap_cache.update(data["umap"])
+    CMapsLoaded = True
+    return True
+#end def
+
+def PreloadCMaps(cachefile=CMAP_CACHE):
+    global CMapsLoaded
+    if LoadCMaps(cachefile):
+        return
+    #end if
+    for name in JAPANESE_CMAPS:
+        try:
+            CMapDB.get_cmap(name)
+        except CMapDB.CMapNotFound:
+            pass
+        #end try
+    #next
+    for name in JAPANESE_UMAPS:
+        try:
+            CMapDB.get_unicode_map(name, False)
+        except CMapDB.CMapNotFound:
+            pass
+        #end try
+    #next
+    CMapsLoaded = True
+
+    data = {"version": pdfminer.__version__,
+            "cmap": {name: CMapDB._cmap_cache[name] for name in JAPANESE_CMAPS if name in CMapDB._cmap_cache},
+            "umap": {name: CMapDB._umap_cache[name] for name in JAPANESE_UMAPS if name in CMapDB._umap_cache}}
+    # 複数の計算書のスレッドが同時に保存する場合があるので、一時ファイルはmkstempで作成
+    tmp = None
+    try:
+        if not os.path.isdir(os.path.dirname(cachefile)):
+            os.makedirs(os.path.dirname(cachefile), exist_ok=True)
+        #end if
+        fd, tmp = tempfile.mkstemp(suffix=".tmp", dir=os.path.dirname(cachefile))
+        with os.fdopen(fd, "wb") as fp:
+            pickle.dump(data, fp, protocol=pickle.HIGHEST_PROTOCOL)
+        #end with
+        os.replace(tmp, cachefile)
+    except Exception:
+        logging.exception(sys.exc_info())#エラーをlog.txtに書き込む
+        if tmp is not None and os.path.exists(tmp):
+            os.remove(tmp)
+        #end if
+    #end try
+#end def
+
+#============================================================================
+#  処理するページを各プロセスに配るクラス
+#       pages   : 処理するページ番号のリスト
+#       chunk   : １回に配るページ数
+#       capacity : 共有の配列の大きさ（WorkerPoolで複数の計算書に使用する場合の最大ページ数）
+#
+#   ページ番号は共有の配列に詰めて保存し、次に配る位置（cursor）だけをロックして進めるので、
+#   １回の取得はページ数に関係なく一定の時間で、同じページを２つのプロセスに配ることはない。
+#   プロセスの起動時に引数として渡す（forkでもspawnでも同じオブジェクトを共有する）
+#============================================================================
+class PageDispatcher:
+
+    def __init__(self, pages, chunk=1, capacity=0):
+        self.chunk = max(1, chunk)
+        self.capacity = max(1, len(pages), capacity)
+        self.pages = Array('i', self.capacity, lock=False)
+        self.count = Value('i', 0, lock=False)
+        self.cursor = Value('i', 0)
+        self.Reset(pages)
+    #end def
+
+    def __len__(self):
+        return self.count.value
+    #end def
+
+    #============================================================================
+    #  配るページを入れ替える関数（並列処理を行っていない時に親プロセスで実行する）
+    #============================================================================
+    def Reset(self, pages):
+        if len(pages) > self.capacity:
+            raise ValueError("ページ数が多すぎます : {} > {}".format(len(pages), self.capacity))
+        #end if
+        self.pages[:len(pages)] = list(pages)
+        self.count.value = len(pages)
+        self.cursor.value = 0
+    #end def
+
+    #============================================================================
+    #  次に処理するページ番号のリストを取得する関数（すべて配り終わった場合は空のリスト）
+    #============================================================================
+    def Next(self):
+        with self.cursor.get_lock():
+            st = self.cursor.value
+            N = self.count.value
+            if st >= N:
+                return []
+            #end if
+            ed = min(st + self.chunk, N)
+            self.cursor.value = ed
+        #end with
+        return self.pages[st:ed]
+    #end def
+#end class
+
+#============================================================================
+#  計算プログラムの種類とバージョンを後から各プロセスに知らせるクラス
+#       shared  : Trueの場合はプロセス間で共有（プロセスの起動時に引数として渡す）、
+#                 Falseの場合は同じプロセスのスレッド間だけで共有
+#       size    : 種類とバージョンの文字列（UTF-8）の最大バイト数
+#
+#   ページの抽出は種類に関係なく行えるので、表紙の読取りを待たずにワーカーを起動し、
+#   ワーカーは種類が必要になった時（最初のページの判定）にGet()で待つ
+#============================================================================
+class ProgramKind:
+
+    def __init__(self, shared=True, size=256):
+        if shared:
+            self.data = Array('c', size, lock=False)
+            self.event = Event()
+        else:
+            self.data = bytearray(size)
+            self.event = threading.Event()
+        #end if
+    #end def
+
+    #============================================================================
+    #  種類とバージョンを設定する関数（表紙を読み取った親プロセスで実行する）
+    #============================================================================
+    def Set(self, kind, version):
+        b = "{}\n{}".format(kind, version).encode("utf-8")[:len(self.data)]
+        self.data[:len(b)] = b
+        if len(b) < len(self.data):
+            self.data[len(b)] = 0
+        #end if
+        self.event.set()
+    #end def
+
+    #============================================================================
+    #  種類とバージョンを取得する関数（設定されるまで待つ）
+    #============================================================================
+    def Get(self):
+        self.event.wait()
+        b = bytes(self.data).split(b"\0", 1)[0]
+        t = b.decode("utf-8", "ignore").split("\n", 1)
+        return t[0], (t[1] if len(t) > 1 else "")
+    #end def
+
+    #============================================================================
+    #  次の計算書のために未設定に戻す関数
+    #============================================================================
+    def Clear(self):
+        self.event.clear()
+    #end def
+#end class
+
+#============================================================================
+#  ページの処理時間の見込み（内容のストリームとフォームXObjectのバイト数の合計）
+#       数値を多く描画したページ（検定比図等）ほど大きくなる。画像はpdfminerの処理時間に
+#       ほとんど影響しないので含めない（圧縮されたストリームは圧縮後のバイト数）
+#============================================================================
+LITERAL_FORM = LIT("Form")
+
+def PageCost(page):
+    cost = 0
+    for stream in page.contents:
+        stream = resolve1(stream)
+        if isinstance(stream, PDFStream):
+            cost += len(stream.get_rawdata() or b"")
+        #end if
+    #next
+    try:
+        xobjects = dict_value(resolve1(page.resources).get("XObject", {}))
+    except Exception:
+        xobjects = {}
+    #end try
+    for xobj in xobjects.values():
+        xobj = resolve1(xobj)
+        if isinstance(xobj, PDFStream) and xobj.get("Subtype") is LITERAL_FORM:
+            cost += len(xobj.get_rawdata() or b"")
+        #end if
+    #next
+    return cost
+#end def
+
+#============================================================================
+#  各ページのオブジェクト番号・用紙サイズ・回転角度・処理時間の見込みの一覧を作成する関数
+#       親プロセスで１回だけ実行し、各プロセスにはページ情報として渡す
+#       戻り値 : [(オブジェクト番号, [幅, 高さ], 回転角度, PageCost), ...]（ページ番号-1の順）
+#============================================================================
+def PageTable(filename):
+    PageInfo = []
+    with open(filename, "rb") as fp:
+        parser = PDFParser(fp)
+        document = PDFDocument(parser)
+        for page in PDFPage.create_pages(document):
+            x0, y0, x1, y1 = page.mediabox
+            rotate = resolve1(page.attrs.get("Rotate", 0))
+            PageInfo.append((page.pageid, [float(x1 - x0), float(y1 - y0)], rotate, PageCost(page)))
+        #next
+    #end with
+    return PageInfo
+#end def
+
+#============================================================================
+#  オブジェクト番号からページ（PDFPage）を作成する関数
+#       ページツリーの全体は読まずに、/Parentをたどって継承される属性（Resources等）だけを読む
+#============================================================================
+def GetPage(document, objid):
+    attrs = dict_value(document.getobj(objid)).copy()
+    node = attrs.get("Parent")
+    visited = set()
+    while node is not None:
+        key = getattr(node, "objid", None)
+        if key is not None:
+            if key in visited:
+                break
+            #end if
+            visited.add(key)
+        #end if
+        parent = dict_value(node)
+        for k in PDFPage.INHERITABLE_ATTRS:
+            if k not in attrs and k in parent:
+                attrs[k] = parent[k]
+            #end if
+        #next
+        node = parent.get("Parent")
+    #end while
+    return PDFPage(document, objid, attrs, None)
+#end def
+
+#============================================================================
+#  検出結果の文字（検出個数、壁の検定比、表紙の見出し）に使用するフォント
+#       LABEL_CHARS : 使用する文字（この文字だけのサブセットを１回だけ作成する）
+#============================================================================
+LABEL_CHARS = "検索個数定比（以上）の結果 =0123456789.-"
+LabelFontData = None
+
+#============================================================================
+#  検出結果の文字のフォントと文字のコードを取得する関数（プロセス毎に１回だけ作成）
+#       ReportLabでLABEL_CHARSの文字を１文字ずつ描いたページを作成し、IPAexゴシックのサブセットと
+#       各文字のコードを読み取る
+#       戻り値  : フォント（pypdfの間接参照）、{文字: コードのバイト列}
+#============================================================================
+def LabelFont():
+    global LabelFontData
+    if LabelFontData is None:
+        buf = io.BytesIO()
+        cc = canvas.Canvas(buf)
+        cc.setFont("ipaexg", 12)
+        for ch in LABEL_CHARS:
+            cc.drawString(0, 0, ch)
+        #next
+        cc.showPage()
+        cc.save()
+        page = PR2(io.BytesIO(buf.getvalue())).pages[0]
+        codes = {}
+        fontname = None
+        for operands, operator in ContentStream(page.get_contents(), page.pdf).operations:
+            if operator == b"Tf":
+                fontname = operands[0]
+            elif operator == b"Tj":
+                s = operands[0]
+                code = s.get_original_bytes() if hasattr(s, "get_original_bytes") else bytes(s)
+                codes[LABEL_CHARS[len(codes)]] = code
+            #end if
+        #next
+        LabelFontData = (page["/Resources"]["/Font"].get_object().raw_get(fontname), codes)
+    #end if
+    return LabelFontData
+#end def
+
+#============================================================================
+#  検出結果のページを作成し、１つの結果ファイルに保存するクラス
+#       pdf_file    : 計算書のファイル名（最初のページを作成する時に開き、Close()で閉じる）
+#
+#   検出が終わったページから届いた順に１つのPdfWriterのページ番号の順になる位置に追加し、Writeで
+#   まとめて保存する（ページ毎の結果ファイルの作成・読込みと結合は行わない）
+#   元のページのオブジェクトはそのまま複製し（内容のストリームは変換しない）、検出個数と四角形だけを
+#   描いた小さいストリームを内容の最後に追加する。四角形は回転前の座標なので、回転したページ（/Rotate）も
+#   元のページの/Rotateのままで正しい位置に表示される
+#============================================================================
+class ResultRenderer:
+
+    def __init__(self, pdf_file):
+        self.pdf_file = pdf_file
+        self.fp = None
+        self.pdf = None
+        self.writer = pypdf.PdfWriter()
+        self.order = []             # 追加したページの順番（昇順、表紙は0）
+    #end def
+
+    #============================================================================
+    #  検出個数と四角形を描く内容のストリームを作成する関数
+    #       fontname : ページのリソースに追加したLabelFontの名前
+    #       title    : 検出個数の代わりに印字する見出し（表紙）
+    #============================================================================
+    def Overlay(self, ResultData, PaperSize, fontname, title=None):
+        codes = LabelFont()[1]
+        pageSizeY = float(PaperSize[1])
+
+        def Text(x, y, size, t):
+            code = b"".join(codes[c] for c in t if c in codes)
+            return "BT /{} {} Tf 1 0 0 1 {} Tm <{}> Tj ET".format(fontname, size, fp_str(x, y), code.hex())
+        #end def
+
+        # ページの左肩に検出個数を印字（表紙は見出しを印字）
+        ops = ["1 w", "1 0 0 rg", "1 0 0 RG"]
+        if title is None:
+            pn = len(ResultData)
+            ops.append(Text(20 * mm, pageSizeY - 15 * mm, 12, "検索個数 = {}".format(pn)))
+        else:
+            ops.append(Text(20 * mm, pageSizeY - 40 * mm, 20, title))
+        #end if
+
+        # 該当する座標に四角形を描画（"壁の検定表"の場合は、四角形の右肩に数値を印字）
+        for R1 in ResultData:
+            a = R1[0]
+            origin = R1[1]
+            flag = R1[2]
+            ops.append(fp_str(origin[0], origin[1], origin[2], origin[3]) + " re S")
+            if flag:
+                ops.append(Text(origin[0]+origin[2], origin[1]+origin[3], 7, " {:.2f}".format(a)))
+            #end if
+        #next
+        return "\n".join(ops).encode("ascii")
+    #end def
+
+    #============================================================================
+    #  pypdfのPdfWriterに追加したページに検出結果を描き加える関数
+    #       writer  : ページを追加したPdfWriter
+    #       page    : writer.add_pageで追加したページ
+    #
+    #   元の内容の前に"q"、後に"Q"と検出結果のストリームを追加し、元の内容のグラフィックス状態が
+    #   検出結果に影響しないようにする。フォントは元のページのフォントと名前が重ならないようにする
+    #============================================================================
+    def Stamp(self, writer, page, ResultData, PaperSize, title=None):
+        font = LabelFont()[0]
+
+        # リソースは他のページと共有している場合があるので、複製してからフォントを追加する
+        resources = DictionaryObject(page["/Resources"].get_object()) if "/Resources" in page else DictionaryObject()
+        fonts = DictionaryObject(resources["/Font"].get_object()) if "/Font" in resources else DictionaryObject()
+        fontname = "CTLabel"
+        while NameObject("/" + fontname) in fonts:
+            fontname += "X"
+        #end while
+        fonts[NameObject("/" + fontname)] = font.clone(writer)
+        resources[NameObject("/Font")] = fonts
+        page[NameObject("/Resources")] = resources
+
+        # 検出結果の座標は用紙の左下が原点（MediaBoxの原点がずれている場合は移動する）
+        x0 = float(page.mediabox.left)
+        y0 = float(page.mediabox.bottom)
+        head = DecodedStreamObject()
+        head.set_data(b"q\n")
+        tail = DecodedStreamObject()
+        tail.set_data("Q\nq 1 0 0 1 {} cm\n".format(fp_str(x0, y0)).encode("ascii") +
+                      self.Overlay(ResultData, PaperSize, fontname, title) + b"\nQ\n")
+
+        contents = page.get("/Contents")
+        obj = contents.get_object() if contents is not None else None
+        if obj is None:
+            items = []
+        elif isinstance(obj, ArrayObject):
+            items = list(obj)
+        else:
+            items = [contents]
+        #end if
+        page[NameObject("/Contents")] = ArrayObject([writer._add_object(head)] + items +
+                                                     [writer._add_object(tail.flate_encode())])
+    #end def
+
+    #============================================================================
+    #  １ページの結果を作成して結果ファイルに追加する関数
+    #       pageN       : ページ番号
+    #       ResultData  : 閾値以上の数値（SelectResultsの結果）
+    #       PaperSize   : 回転前の用紙サイズ [幅, 高さ]
+    #       order       : 結果ファイルの中の順番（Noneの場合はページ番号、表紙は0）
+    #       title       : 検出個数の代わりに印字する見出し（表紙）
+    #============================================================================
+    def Render(self, pageN, ResultData, PaperSize, order=None, title=None):
+        self.Open()
+        if order is None:
+            order = pageN
+        #end if
+        pos = bisect_right(self.order, order)
+        page = self.writer.insert_page(self.pdf.pages[pageN - 1], pos)
+        self.order.insert(pos, order)
+        self.Stamp(self.writer, page, ResultData, PaperSize, title)
+    #end def
+
+    #============================================================================
+    #  表紙に見出しを印字して結果の最初のページにする関数
+    #============================================================================
+    def Cover(self, limit):
+        self.Open()
+        box = self.pdf.pages[0].mediabox
+        self.Render(1, [], [float(box.width), float(box.height)], order=0,
+                    title="検定比（{}以上）の検索結果".format(limit))
+    #end def
+
+    #============================================================================
+    #  計算書のファイルを開く関数（最初のページを作成する時に１回だけ開く）
+    #============================================================================
+    def Open(self):
+        if self.pdf is None:
+            self.fp = open(self.pdf_file, "rb")
+            self.pdf = PR2(self.fp)
+        #end if
+    #end def
+
+    #============================================================================
+    #  結果ファイルを保存する関数（同じ内容のフォント・XObjectなどは１つにまとめる）
+    #============================================================================
+    def Write(self, outfile):
+        DedupObjects(self.writer)
+        with open(outfile, "wb") as fp:
+            self.writer.write(fp)
+        #end with
+    #end def
+
+    #============================================================================
+    #  計算書のファイルを閉じる関数
+    #============================================================================
+    def Close(self):
+        if self.fp is not None:
+            self.fp.close()
+            self.fp = None
+            self.pdf = None
+        #end if
+    #end def
+#end class
+
+#============================================================================
+#  計算書全体に検出結果を描き加えた結果ファイルを作成するクラス（PDFの増分更新）
+#       pdf_file    : 計算書のファイル名
+#
+#   元の計算書のバイト列をそのまま複写し、その後ろに検出結果を描き加えたページ、追加したオブジェクト
+#   （検出結果のストリームとフォント）と新しい相互参照表を追加する。書き込むオブジェクトの量は検出した
+#   ページの数だけで決まり、元のページの内容は読み込まない
+#============================================================================
+class UpdateRenderer(ResultRenderer):
+
+    def __init__(self, pdf_file):
+        ResultRenderer.__init__(self, pdf_file)
+        self.fp = open(pdf_file, "rb")
+        self.pdf = PR2(self.fp)
+        if self.pdf.is_encrypted:
+            self.Close()
+            raise ValueError("暗号化された計算書は増分更新で結果を作成できません: {}".format(pdf_file))
+        #end if
+
+        # 追加するオブジェクトの番号が元の計算書の/Size以降になるように、PdfWriterの番号を進めておく
+        # （元のオブジェクトへの参照は元の番号のまま書き込まれる）
+        self.size = int(self.pdf.trailer["/Size"])
+        self.writer = pypdf.PdfWriter()
+        while len(self.writer._objects) < self.size - 1:
+            self.writer._objects.append(NullObject())
+        #end while
+        self.first = len(self.writer._objects)
+        self.pages = {}             # 検出結果を描き加えたページ {ページ番号: ページ}
+    #end def
+
+    #============================================================================
+    #  １ページに検出結果を描き加える関数（結果はWriteでまとめて書き込む）
+    #       order   : 使用しない（ページの順番は元の計算書のまま）
+    #============================================================================
+    def Render(self, pageN, ResultData, PaperSize, order=None, title=None):
+        page = self.pdf.pages[pageN - 1]
+        self.Stamp(self.writer, page, ResultData, PaperSize, title)
+        self.pages[pageN] = page
+    #end def
+
+    #============================================================================
+    #  元の計算書を複写し、増分更新を追加した結果ファイルを保存する関数
+    #       元の計算書が相互参照ストリーム（PDF 1.5）の場合は相互参照ストリーム、それ以外は相互参照表で追加する
+    #============================================================================
+    def Write(self, outfile):
+        # 元の計算書の最後の相互参照の位置（/Prevに設定する）
+        self.fp.seek(0, 2)
+        end = self.fp.tell()
+        self.fp.seek(max(0, end - 1024))
+        tail = self.fp.read()
+        prev = int(re.findall(rb"startxref\s+(\d+)", tail)[-1])
+        self.fp.seek(prev)
+        xrefstream = self.fp.read(4) != b"xref"
+
+        # 追加するオブジェクトとページ
+        buf = io.BytesIO()
+        if not tail.endswith((b"\n", b"\r")):
+            buf.write(b"\n")
+        #end if
+        objects = [(i + 1, 0, self.writer._objects[i]) for i in range(self.first, len(self.writer._objects))]
+        for pageN in sorted(self.pages):
+            ref = self.pages[pageN].indirect_reference
+            objects.append((ref.idnum, ref.generation, self.pages[pageN]))
+        #next
+        offsets = {}
+        for num, gen, obj in objects:
+            offsets[num] = (end + buf.tell(), gen)
+            buf.write("{} {} obj\n".format(num, gen).encode("ascii"))
+            obj.write_to_stream(buf)
+            buf.write(b"\nendobj\n")
+        #next
+
+        # 新しいトレーラー（元のトレーラーの/Root・/Info・/IDを引き継ぐ）
+        size = max(self.size, len(self.writer._objects) + 1)
+        trailer = DictionaryObject()
+        for key in ("/Root", "/Info", "/ID"):
+            if key in self.pdf.trailer:
+                trailer[NameObject(key)] = self.pdf.trailer.raw_get(key)
+            #end if
+        #next
+        trailer[NameObject("/Prev")] = NumberObject(prev)
+
+        startxref = end + buf.tell()
+        if xrefstream:
+            offsets[size] = (startxref, 0)
+            size += 1
+            nums = sorted(offsets)
+            w = max(4, (startxref.bit_length() + 7) // 8)
+            data = b"".join(b"\x01" + offsets[n][0].to_bytes(w, "big") + offsets[n][1].to_bytes(2, "big") for n in nums)
+            xref = DecodedStreamObject()
+            xref.set_data(data)
+            xref = xref.flate_encode()
+            xref.update(trailer)
+            xref[NameObject("/Type")] = NameObject("/XRef")
+            xref[NameObject("/Size")] = NumberObject(size)
+            xref[NameObject("/Index")] = ArrayObject(NumberObject(v) for v in XrefRanges(nums))
+            xref[NameObject("/W")] = ArrayObject([NumberObject(1), NumberObject(w), NumberObject(2)])
+            buf.write("{} 0 obj\n".format(size - 1).encode("ascii"))
+            xref.write_to_stream(buf)
+            buf.write(b"\nendobj\n")
+        else:
+            nums = sorted(offsets)
+            buf.write(b"xref\n")
+            ranges = XrefRanges(nums)
+            k = 0
+            for i in range(0, len(ranges), 2):
+                buf.write("{} {}\n".format(ranges[i], ranges[i + 1]).encode("ascii"))
+                for n in nums[k:k + ranges[i + 1]]:
+                    buf.write("{:010d} {:05d} n\r\n".format(offsets[n][0], offsets[n][1]).encode("ascii"))
+                #next
+                k += ranges[i + 1]
+            #next
+            trailer[NameObject("/Size")] = NumberObject(size)
+            buf.write(b"trailer\n")
+            trailer.write_to_stream(buf)
+            buf.write(b"\n")
+        #end if
+        buf.write("startxref\n{}\n%%EOF\n".format(startxref).encode("ascii"))
+
+        # 元の計算書を複写して（OSの複写機能を使用）、増分更新を追加する
+        # （ハードリンクは追加した内容が元の計算書にも書き込まれるので使用しない）
+        shutil.copyfile(self.pdf_file, outfile)
+        with open(outfile, "r+b") as fp:
+            fp.seek(end)
+            fp.write(buf.getvalue())
+            fp.truncate()
+        #end with
+    #end def
+#end class
+
+#============================================================================
+#  相互参照の番号のリストを連続する範囲 [開始番号, 個数, ...] に変換する関数
+#============================================================================
+def XrefRanges(nums):
+    ranges = []
+    for n in nums:
+        if len(ranges) > 0 and ranges[-2] + ranges[-1] == n:
+            ranges[-1] += 1
+        else:
+            ranges += [n, 1]
+        #end if
+    #next
+    return ranges
+#end def
+
+#============================================================================
+#  同じ内容のオブジェクトを１つにまとめる関数（結果ファイルを保存する前に実行）
+#       writer  : 結果のページを追加したPdfWriter
+#       戻り値  : まとめたオブジェクトの数
+#
+#   計算書の中で別々のオブジェクトになっている同じ内容のフォント・XObject・ストリームなどへの参照を
+#   最初のオブジェクトへの参照に置き換え、残りは空（null）にする（PdfWriterは番号を詰めないので残す）
+#   参照先をまとめると参照元も同じ内容になる（フォントファイル → フォント）ので、まとめるものが
+#   無くなるまで繰り返す。ページ・注釈など文書の構造のオブジェクト（/Parent・/Pを持つもの）はまとめない
+#============================================================================
+DEDUP_SKIP = ("/Page", "/Pages", "/Catalog", "/Annot", "/StructElem", "/StructTreeRoot", "/Outlines", "/Sig")
+
+def DedupObjects(writer):
+    objects = writer._objects
+    same = {}           # まとめたオブジェクト {番号: 残すオブジェクトの番号}
+    digests = {}        # ストリームのデータのダイジェスト（繰り返しの度に計算しない）
+    kinds = {}          # オブジェクトのクラスの種類（pypdfのクラスのisinstanceは遅いのでクラス毎に１回だけ判定）
+
+    def Kind(obj):
+        cls = type(obj)
+        k = kinds.get(cls)
+        if k is None:
+            if issubclass(cls, IndirectObject):
+                k = "R"
+            elif issubclass(cls, StreamObject):
+                k = "S"
+            elif issubclass(cls, DictionaryObject):
+                k = "D"
+            elif issubclass(cls, ArrayObject):
+                k = "A"
+            elif issubclass(cls, NullObject):
+                k = "N"
+            elif issubclass(cls, (str, int, float, bytes)):
+                k = "V"         # 名前・数値・文字列（値で比較できる）
+            else:
+                k = ""
+            #end if
+            kinds[cls] = k
+        #end if
+        return k
+    #end def
+
+    def Key(obj):
+        k = Kind(obj)
+        if k == "R":
+            return ("R", same.get(obj.idnum, obj.idnum))
+        elif k == "D" or k == "S":
+            items = tuple(sorted((name, Key(v)) for name, v in obj.items() if name != "/Length"))
+            if k == "S":
+                if id(obj) not in digests:
+                    digests[id(obj)] = hashlib.sha1(obj._data).digest()
+                #end if
+                return ("S", items, digests[id(obj)])
+            #end if
+            return ("D", items)
+        elif k == "A":
+            return ("A", tuple(Key(v) for v in obj))
+        elif k == "V":
+            return (type(obj).__name__, obj)
+        else:
+            buf = io.BytesIO()
+            obj.write_to_stream(buf)
+            return buf.getvalue()
+        #end if
+    #end def
+
+    while True:
+        first = {}
+        n = 0
+        for i, obj in enumerate(objects):
+            num = i + 1
+            k = Kind(obj)
+            if obj is None or num in same or k == "N":
+                continue
+            #end if
+            if (k == "D" or k == "S") and (obj.get("/Type") in DEDUP_SKIP or "/Parent" in obj or "/P" in obj):
+                continue
+            #end if
+            k = first.setdefault(Key(obj), num)
+            if k != num:
+                same[num] = k
+                n += 1
+            #end if
+        #next
+        if n == 0:
+            break
+        #end if
+    #end while
+    if len(same) == 0:
+        return 0
+    #end if
+
+    def Resolve(num):
+        while num in same:
+            num = same[num]
+        #end while
+        return IndirectObject(num, 0, writer)
+    #end def
+
+    def Remap(obj):
+        k = Kind(obj)
+        if k == "D" or k == "S":
+            for name, v in list(obj.items()):
+                if Kind(v) == "R":
+                    if v.idnum in same:
+                        obj[name] = Resolve(v.idnum)
+                    #end if
+                else:
+                    Remap(v)
+                #end if
+            #next
+        elif k == "A":
+            for i, v in enumerate(obj):
+                if Kind(v) == "R":
+                    if v.idnum in same:
+                        obj[i] = Resolve(v.idnum)
+                    #end if
+                else:
+                    Remap(v)
+                #end if
+            #next
+        #end if
+    #end def
+
+    for obj in objects:
+        Remap(obj)
+    #next
+    for num in same:
+        objects[num - 1] = NullObject()
+    #next
+    return len(same)
+#end def
+
+#============================================================================
+#  検出結果をPDFを作成せずに一覧（JSON・CSV・SQLite）で保存するクラス
+#       pdf_file    : 計算書のファイル名（一覧に記録する）
+#       fmt         : 一覧の形式（"json", "csv", "sqlite"）
+#
+#   ResultRendererと同じようにCover・Write・Closeで使用し、ページの結果はAddで追加する
+#   １件の内容 : ページ番号、部材の種類（柱・梁・壁・杭・ブレース・検定比図）、構造種別、検定比、
+#                四角形（回転前の座標の x, y, 幅, 高さ）
+#============================================================================
+RECORD_FORMATS = {"json": ".json", "csv": ".csv", "sqlite": ".sqlite"}
+RECORD_FIELDS = ("page", "member", "B_kind", "ratio", "x", "y", "width", "height")
+
+class ResultRecords:
+
+    def __init__(self, pdf_file, fmt="json"):
+        if fmt not in RECORD_FORMATS:
+            raise ValueError("fmt must be one of {}".format(", ".join(RECORD_FORMATS)))
+        #end if
+        self.pdf_file = pdf_file
+        self.fmt = fmt
+        self.limit = None
+        self.records = []
+    #end def
+
+    #============================================================================
+    #  １ページの結果を追加する関数
+    #       mode    : ページの種類（"柱の検定表"など）
+    #       B_kind  : 構造種別
+    #============================================================================
+    def Add(self, pageN, mode, B_kind, ResultData):
+        member = mode.replace("の検定表", "")
+        for R1 in ResultData:
+            origin = R1[1]
+            self.records.append((pageN, member, B_kind, float(R1[0]),
+                                 float(origin[0]), float(origin[1]), float(origin[2]), float(origin[3])))
+        #next
+    #end def
+
+    #============================================================================
+    #  表紙の結果（一覧には閾値だけを記録する）
+    #============================================================================
+    def Cover(self, limit):
+        self.limit = limit
+    #end def
+
+    #============================================================================
+    #  一覧を保存する関数（ページ番号の順）
+    #       SQLiteの場合は同じ計算書の前回の結果を削除してから追加する（複数の計算書を１つのファイルに保存可）
+    #============================================================================
+    def Write(self, outfile):
+        records = sorted(self.records, key=lambda R: R[0])
+        name = os.path.basename(self.pdf_file)
+        if self.fmt == "json":
+            data = {"file": name, "limit": self.limit, "records": [dict(zip(RECORD_FIELDS, R)) for R in records]}
+            with open(outfile, "w", encoding="utf-8") as fp:
+                json.dump(data, fp, indent=1, ensure_ascii=False)
+            #end with
+        elif self.fmt == "csv":
+            # Excelで開けるようにBOM付きのUTF-8で保存
+            with open(outfile, "w", encoding="utf-8-sig", newline="") as fp:
+                writer = csv.writer(fp)
+                writer.writerow(RECORD_FIELDS)
+                writer.writerows(records)
+            #end with
+        else:
+            con = sqlite3.connect(outfile)
+            try:
+                with con:
+                    con.execute("CREATE TABLE IF NOT EXISTS results (file TEXT, limit_value REAL, page INTEGER, member TEXT,"
+                                " B_kind TEXT, ratio REAL, x REAL, y REAL, width REAL, height REAL)")
+                    con.execute("DELETE FROM results WHERE file = ?", (name,))
+                    con.executemany("INSERT INTO results VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                                    [(name, self.limit) + R for R in records])
+                #end with
+            finally:
+                con.close()
+            #end try
+        #end if
+    #end def
+
+    def Close(self):
+        pass
+    #end def
+#end class
+
+#============================================================================
+#  ページの事前判定に使用するキーワード
+#       HEAD_WORDS  : ページ毎のキーワード索引に記録する見出しの文字
+#       PRE_WORDS   : このいずれかを含むページだけをレイアウト解析に回す
+#                     （SS7およびその他の計算書の見出しをすべて含む短い文字を使用）
+#============================================================================
+HEAD_WORDS = ["柱の断面検定表", "梁の断面検定表", "壁の断面検定表", "ブレースの断面検定表",
+              "断面算定表", "杭基礎", "検定比図", "検定表"]
+PRE_WORDS = ["検定表", "断面算定表", "検定比図"]
+
+#============================================================================
+#  ページの抽出処理のバージョン
+#       PageExtract、MakeCharRecords、事前判定の方法を変更した場合は値を変えて、
+#       古いキャッシュ（PageCache）の結果を使用しないようにする
+#       SS7、OtherSheetの数値の検出方法を変更した場合も、候補の索引（CandidateIndex）のために値を変える
+#============================================================================
+EXTRACT_VERSION = "3.00-2"
+
+#============================================================================
+#  検定比の候補（SS7・OtherSheetのResultData）から閾値以上の数値だけを選択する関数
+#============================================================================
+def SelectResults(Candidates, limit):
+    ResultData = [R for R in Candidates if R[0] >= limit]
+    for R in ResultData:
+        print('val={:.2f}'.format(R[0]))
+    #next
+    return ResultData
+#end def
+
+#============================================================================
+#  文字表示の演算子だけを文字列に変換するデバイス（事前判定用）
+#       LTCharなどのレイアウトデータは作成せず、図形や画像の演算子は無視する
+#============================================================================
+class KeywordDevice(PDFDevice):
+
+    def __init__(self, rsrcmgr):
+        PDFDevice.__init__(self, rsrcmgr)
+        self.texts = []
+    #end def
+
+    def render_string(self, textstate, seq, ncs, graphicstate):
+        font = textstate.font
+        if font is None:
+            return
+        #end if
+        for obj in seq:
+            if isinstance(obj, bytes):
+                for cid in font.decode(obj):
+                    try:
+                        self.texts.append(font.to_unichr(cid))
+                    except PDFUnicodeNotDefined:
+                        pass
+                    #end try
+                #next
+            #end if
+        #next
+    #end def
+
+    def get_text(self):
+        # 取得した文字列を戻して初期化（空白と改行は除去）
+        text = "".join("".join(self.texts).split())
+        self.texts = []
+        return text
+    #end def
+#end class
+
+#============================================================================
+#  抽出した文字データの構造化配列の型（１文字あたり１レコード）
+#       char    : 文字（通常は１文字、ページ内の最大の長さに合わせる）
+#       x0, x1, y0, y1 : 文字の座標
+#       rot     : 文字の回転の向き（0:回転なし、1:正の回転、-1:負の回転）
+#                 LTCharの行列（matrix）のうち２番目の要素の符号だけを保持する
+#============================================================================
+def CharDtype(w=1):
+    return np.dtype([("char", "U{}".format(max(w, 1))),
+                     ("x0", "f8"), ("x1", "f8"), ("y0", "f8"), ("y1", "f8"), ("rot", "i1")])
+#end def
+
+#============================================================================
+#  LTCharのリストを文字データの構造化配列に変換する関数
+#============================================================================
+def MakeCharRecords(LTChars):
+    texts = [lt.get_text() for lt in LTChars]
+    w = max(map(len, texts), default=1)
+    records = np.fromiter(
+        ((t, lt.x0, lt.x1, lt.y0, lt.y1, (lt.matrix[1] > 0.0) - (lt.matrix[1] < 0.0))
+            for t, lt in zip(texts, LTChars)),
+        dtype=CharDtype(w), count=len(texts))
+    return records
+#end def
+
+#============================================================================
+#  検定比などの数値のトークンを検出する正規表現
+#       NUM_PATTERN : float()で変換できる10進数の表記（符号・指数を含む）
+#       RatioRE     : 空白で区切られた１個のトークン全体に一致する正規表現を戻す関数
+#           label   : トークンの先頭に付いている見出しの文字（「検定比」など、任意）
+#           plain   : Trueの場合は数値だけ、Falseの場合は次の表記も一致させる
+#                       (  : 数値の左のカッコ（任意）
+#                       )  : 数値の右のカッコ（任意）
+#                       C,T,組 : 数値の後ろの記号（任意）
+#       コンパイルした正規表現はlabelとplainの組み合わせ毎に１回だけ作成する
+#============================================================================
+NUM_PATTERN = r"[+-]?(?:\d+(?:\.\d*)?|\.\d+)(?:[eE][+-]?\d+)?"
+NUM_RE = re.compile(r"\s*(" + NUM_PATTERN + r")\s*")
+_RatioRE = {}
+
+def RatioRE(label="", plain=False):
+    key = (label, plain)
+    if key not in _RatioRE:
+        head = "(?:{})?".format(re.escape(label)) if label != "" else ""
+        if plain:
+            pattern = r"(?<!\S){}(?P<num>{})(?!\S)".format(head, NUM_PATTERN)
+        else:
+            pattern = r"(?<!\S){}(?P<lb>\()?(?P<num>{})(?P<rb>\))?(?P<sfx>[CT組])?(?!\S)".format(head, NUM_PATTERN)
+        #end if
+        _RatioRE[key] = re.compile(pattern)
+    #end if
+    return _RatioRE[key]
+#end def
+
+#============================================================================
+#  文字列全体が１個の数値の場合はその値、それ以外はdefaultを戻す関数
+#       （isfloatとfloatの組み合わせの代わりに使用する）
+#============================================================================
+def ScanNumber(s, default=None):
+    m = NUM_RE.fullmatch(s)
+    if m is None:
+        return default
+    #end if
+    return float(m.group(1))
+#end def
+
+#============================================================================
+#  １行分の文字データ（CharTableで並べ替えた構造化配列のスライス＝コピーではなくビュー）
+#       text    : 行の文字列
+#       chars   : 各文字
+#       x0, x1, y0, y1 : 各文字の座標
+#       rot     : 各文字の回転の向き（0:回転なし、1:正の回転、-1:負の回転）
+#       dx      : 各文字と直前の文字の間隔（行の最初の文字は-inf）
+#       single  : すべての文字が１文字の場合はTrue（textの位置と文字の番号が一致する）
+#============================================================================
+class CharLine:
+    __slots__ = ("text", "chars", "x0", "x1", "y0", "y1", "rot", "dx", "single")
+
+    def __init__(self, records, st, ed, single=False, dx=None):
+        r = records[st:ed]
+        self.chars = r["char"]
+        self.x0 = r["x0"]
+        self.x1 = r["x1"]
+        self.y0 = r["y0"]
+        self.y1 = r["y1"]
+        self.rot = r["rot"]
+        self.text = "".join(self.chars)
+        self.single = single
+        if dx is None:
+            self.dx = np.empty(ed - st)
+            self.dx[1:] = self.x0[1:] - self.x1[:-1]
+        else:
+            self.dx = dx[st:ed]
+        #end if
+        if ed > st:
+            self.dx[0] = -np.inf
+        #end if
+    #end def
+
+    def __len__(self):
+        return len(self.chars)
+    #end def
+
+    #============================================================================
+    #  文字の間隔がgapより大きい位置に空白を挿入した文字列を戻す関数
+    #============================================================================
+    def Spaced(self, gap):
+        n = len(self.chars)
+        if n == 0:
+            return ""
+        #end if
+        sp = np.zeros(n, dtype=bool)
+        sp[1:] = self.x0[1:] > self.x1[:-1] + gap
+        return "".join(" " + c if f else c for c, f in zip(self.chars, sp))
+    #end def
+
+    #============================================================================
+    #  行を１回だけ走査して検定比の数値のトークンを順番に戻すジェネレーター
+    #       label   : トークンの先頭に付いている見出しの文字（RatioREを参照）
+    #       gap     : 文字の間隔がgapより大きい位置を空白とみなす（Noneの場合は行の文字列のまま）
+    #       mask    : 走査する文字を選択するブール配列（Noneの場合はすべての文字）
+    #       skip    : 最初のトークンがこの文字の場合は何も戻さない（「Super」の行など）
+    #       minlen  : 数値の表記の最小の文字数
+    #       plain   : Trueの場合はカッコや記号の付いていない数値だけを検出する
+    #   戻り値 : (数値, 開始位置, 終了位置, 左カッコの有無, 後ろの記号の有無)
+    #           開始位置・終了位置は数値部分の文字の番号（CharLineのx0などの添字、終了位置は含まない）
+    #============================================================================
+    def ScanRatio(self, label="", gap=None, mask=None, skip=None, minlen=4, plain=False):
+        if mask is None:
+            idx = None
+            chars = self.chars
+        else:
+            idx = np.flatnonzero(mask)
+            chars = self.chars[idx]
+        #end if
+        n = len(chars)
+        if n == 0:
+            return
+        #end if
+
+        # 空白を挿入する文字の番号（直前の文字との間隔がgapより大きい文字）
+        if gap is None:
+            brk = []
+        elif idx is None:
+            brk = np.flatnonzero(self.dx > gap).tolist()
+        else:
+            brk = (np.flatnonzero(self.x0[idx[1:]] - self.x1[idx[:-1]] > gap) + 1).tolist()
+        #end if
+
+        # 走査する文字列と、文字列の位置から文字の番号への変換
+        if self.single:
+            text = self.text if idx is None else "".join(chars)
+            if len(brk) > 0:
+                text = " ".join(text[a:b] for a, b in zip([0] + brk, brk + [n]))
+            #end if
+            spaces = [b + j for j, b in enumerate(brk)]     # 挿入した空白の文字列の位置
+            def CharIndex(p):
+                return p - bisect_left(spaces, p)
+            #end def
+        else:
+            flags = set(brk)
+            parts = []
+            starts = []     # 各文字の文字列の開始位置
+            p = 0
+            for k, c in enumerate(chars):
+                if k in flags:
+                    parts.append(" ")
+                    p += 1
+                #end if
+                starts.append(p)
+                parts.append(c)
+                p += len(c)
+            #next
+            text = "".join(parts)
+            def CharIndex(p):
+                return bisect_right(starts, p) - 1
+            #end def
+        #end if
 
-kind = ""
-version = ""
+        if skip is not None:
+            w = text.split(None, 1)
+            if len(w) > 0 and w[0] == skip:
+                return
+            #end if
+        #end if
 
-#@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@
-# 並列化 = False      # デバッグ時にはFalse,実行時はTrue
-並列化 = True
+        for m in RatioRE(label, plain).finditer(text):
+            num = m.group("num")
+            if len(num) < minlen:
+                continue
+            #end if
+            k0 = CharIndex(m.start("num"))
+            k1 = CharIndex(m.end("num") - 1) + 1
+            if idx is not None:
+                k0 = int(idx[k0])
+                k1 = int(idx[k1 - 1]) + 1
+            #end if
+            if plain:
+                yield float(num), k0, k1, False, False
+            else:
+                yield float(num), k0, k1, m.group("lb") is not None, m.group("sfx") is not None
+            #end if
+        #next
+    #end def
+#end class
 
 #============================================================================
-#  浮動小数点数値を表しているかどうかを判定する関数
+#  １ページ分の文字データ（構造化配列）から行を組み立てるクラス
+#       行の組み立ては並べ替えと区切り位置の検出だけで行い、
+#       各行は並べ替えた構造化配列のビュー（CharLine）として戻す
 #============================================================================
-def isfloat(s):  
-    try:
-        float(s)  # 文字列を実際にfloat関数で変換してみる
-    except ValueError:
-        return False
-    else:
-        return True
-    #end if
-#end def
+class CharTable:
+
+    def __init__(self, records):
+        self.records = records
+        self.chars = records["char"]
+        self.x0 = records["x0"]
+        self.y0 = records["y0"]
+        self.rot = records["rot"]
+        # すべての文字が１文字の場合は行の文字列の位置と文字の番号が一致する
+        self.single = self.chars.dtype.itemsize == np.dtype("U1").itemsize and bool(np.all(self.chars != ""))
+    #end def
 
-#============================================================================
-#  整数を表しているかどうかを判定する関数
-#============================================================================
-def isint(s):  
-    try:
-        int(s)  # 文字列を実際にint関数で変換してみる
-    except ValueError:
-        return False
-    else:
-        return True
-    #end if
-#end def
+    #============================================================================
+    #  空白以外の文字が連続する範囲（開始位置, 終了位置）を戻す関数
+    #============================================================================
+    def _Words(self, idx, offset):
+        if len(idx) == 0:
+            return []
+        #end if
+        word = np.concatenate(([False], self.chars[idx] != " ", [False])).astype(np.int8)
+        d = np.diff(word)
+        st = np.flatnonzero(d == 1)
+        ed = np.flatnonzero(d == -1)
+        return [(offset + a, offset + b) for a, b in zip(st, ed)]
+    #end def
+
+    #============================================================================
+    #  指定した順番に列配列を並べ替え、各範囲をCharLineとして戻す関数
+    #============================================================================
+    def _Lines(self, order, ranges):
+        records = self.records[order]
+        # 並べ替えた順番で直前の文字との間隔（各行の最初の文字はCharLineで-infにする）
+        dx = np.empty(len(records))
+        dx[1:] = records["x0"][1:] - records["x1"][:-1]
+        CharLines = []
+        CharData = []
+        for st, ed in ranges:
+            line = CharLine(records, st, ed, self.single, dx)
+            CharLines.append([line.text])
+            CharData.append(line)
+        #next
+        return CharLines, CharData
+    #end def
+
+    #============================================================================
+    #  検定比表用の行の組み立て（MakeCharと同じ結果）
+    #       回転していない文字 : Y座標の整数値の降順・X座標の昇順に並べ、minN文字以上の行のみ
+    #       回転している文字   : 正の回転、負の回転の順に空白で区切る
+    #============================================================================
+    def MakeLines(self, minN=4):
+        u = np.flatnonzero(self.rot == 0)
+        iy = self.y0[u].astype(np.int64)
+        # 同じ座標の文字は元の処理（降順の並べ替え）と同じく後の文字を先にする
+        s1 = np.lexsort((-u, self.x0[u], -iy))
+        order1 = u[s1]
+        iy = iy[s1]
+        br = np.flatnonzero(iy[1:] != iy[:-1]) + 1
+        st = np.concatenate(([0], br))
+        ed = np.concatenate((br, [len(order1)]))
+        ranges = [(a, b) for a, b in zip(st, ed) if b - a >= max(minN, 1)]
+
+        order2 = np.concatenate((np.flatnonzero(self.rot > 0), np.flatnonzero(self.rot < 0)))
+        ranges += self._Words(order2, len(order1))
+
+        return self._Lines(np.concatenate((order1, order2)), ranges)
+    #end def
+
+    #============================================================================
+    #  検定比図用の行の組み立て（MakeChar2と同じ結果）
+    #       回転していない文字 : 内容ストリームの順番でY座標が同じ間を１行
+    #       回転している文字   : 内容ストリームの順番で空白で区切る
+    #============================================================================
+    def MakeLines2(self):
+        order1 = np.flatnonzero(self.rot == 0)
+        y = self.y0[order1]
+        br = np.flatnonzero(y[1:] != y[:-1]) + 1
+        st = np.concatenate(([0], br))
+        ed = np.concatenate((br, [len(order1)]))
+        ranges = [(a, b) for a, b in zip(st, ed) if b > a]
+
+        order2 = np.flatnonzero(self.rot != 0)
+        ranges += self._Words(order2, len(order1))
+
+        return self._Lines(np.concatenate((order1, order2)), ranges)
+    #end def
+#end class
 
 #============================================================================
 #
@@ -100,9 +1308,14 @@ class CheckTool():
         IPAEXG_TTF = "./Fonts/ipaexg.ttf"
         self.fontname2 = 'ipaexg'
         
-        # フォント登録
-        pdfmetrics.registerFont(TTFont(self.fontname1, GEN_SHIN_GOTHIC_MEDIUM_TTF))
-        pdfmetrics.registerFont(TTFont(self.fontname2, IPAEXG_TTF))
+        # フォント登録（登録済みの場合は読み込まない：プロセス毎に１回だけ）
+        registered = pdfmetrics.getRegisteredFontNames()
+        if self.fontname1 not in registered:
+            pdfmetrics.registerFont(TTFont(self.fontname1, GEN_SHIN_GOTHIC_MEDIUM_TTF))
+        #end if
+        if self.fontname2 not in registered:
+            pdfmetrics.registerFont(TTFont(self.fontname2, IPAEXG_TTF))
+        #end if
     #end def
     #*********************************************************************************
 
@@ -112,150 +1325,11 @@ class CheckTool():
     #==================================================================================
 
     def CoverCheck(self, page, interpreter, device):
-        global kind, version
-
-        interpreter.process_page(page)
-        # １文字ずつのレイアウトデータを取得
-        layout = device.get_result()
-
-        # CharData5 = []
-        CharData = []
-        for lt in layout:
-            if isinstance(lt, LTChar):  # レイアウトデータうち、LTCharのみを取得
-                char1 = lt.get_text()   # レイアウトデータに含まれる全文字を取得
-                m1 = lt.matrix
-                if m1[1] == 0.0 :  # 回転していない文字のみを抽出
-                    CharData.append([char1, lt.x0, lt.x1, lt.y0, lt.y1,lt.matrix])
-                #end if
-            #end if
-        #next
-
-        # その際、CharData2をY座標の高さ順に並び替えるためのリスト「CY」を作成
-        CharData2=[]
-        CY = []
-        for cdata in CharData:
-            char2 = cdata[0]
-            x0 = cdata[1]
-            x1 = cdata[2]
-            y0 = cdata[3]
-            y1 = cdata[4]
-            CharData2.append(cdata)
-            CY.append(int(y0))
-        #next
-        
-        # リスト「CY」から降順の並び替えインデックッスを取得
-        y=np.argsort(np.array(CY))[::-1]
-        t1 = []
-            
-        if len(CharData2) > 0:  # リストが空でない場合に処理を行う
-            CharData3 = []
-            # インデックスを用いて並べ替えた「CharData3」を作成
-            for i in range(len(y)):
-                CharData3.append(CharData2[y[i]])
-            #next
-
-            # 同じ高さのY座標毎にデータをまとめる２次元のリストを作成
-            CharData4 = []
-            i = 0
-            for f in CharData3:
-                if i==0 :   # 最初の文字のY座標を基準値に採用し、仮のリストを初期化
-                    Fline = []
-                    Fline.append(f)
-                    gy = int(f[3])
-                else:
-                    if int(f[3])== gy:   # 同じY座標の場合は、リストに文字を追加
-                        Fline.append(f)
-                    else:           # Y座標が異なる場合は、リストを「CharData4」を保存し、仮のリストを初期化
-                        if len(Fline) >= 4:
-                            CharData4.append(Fline)
-                        gy = int(f[3])
-                        Fline = []
-                        Fline.append(f)
-                    #end if
-                #end if
-                i += 1
-            #next
-
-            # 仮のリストが残っている場合は、リストを「CharData4」を保存
-            if len(Fline) >= 4:
-                CharData4.append(Fline)
-            #end if
-
-            # 次にX座標の順番にデータを並び替える（昇順）
-            CharData5 = []
-            for F1 in CharData4:    # Y座標が同じデータを抜き出す。                        
-                CX = []         # 各データのX座標のデータリストを作成
-                for F2 in F1:
-                    CX.append(F2[1])
-                #next
-                
-                # リスト「CX」から降順の並び替えインデックッスを取得
-                x=np.argsort(np.array(CX))
-                
-                # インデックスを用いて並べ替えた「F3」を作成
-                F3 = []
-                t2 = ""
-                for i in range(len(x)):
-                    F3.append(F1[x[i]])
-                    t3 = F1[x[i]][0]
-                    t2 += t3
-                #next
-                # t1 += t2 + "\n"
-                t1.append([t2])
-                # print(t2,len(F3))
-                CharData5.append(F3)
-            #next
-        #end if
 
-        CharData2 = []
-        for lt in layout:
-            if isinstance(lt, LTChar):  # レイアウトデータうち、LTCharのみを取得
-                char1 = lt.get_text()   # レイアウトデータに含まれる全文字を取得
-                if lt.matrix[1] > 0.0 : # 正の回転している文字のみを抽出
-                    CharData2.append([char1, lt.x0, lt.x1, lt.y0, lt.y1,lt.matrix])
-                #end if
-            #end if
-        #next
-        for lt in layout:
-            if isinstance(lt, LTChar):  # レイアウトデータうち、LTCharのみを取得
-                char1 = lt.get_text()   # レイアウトデータに含まれる全文字を取得
-                if lt.matrix[1] < 0.0 : # 正の回転している文字のみを抽出
-                    CharData2.append([char1, lt.x0, lt.x1, lt.y0, lt.y1,lt.matrix])
-                #end if
-            #end if
-        #next
-
-        fline = []
-        Sflag = False
-        tt2 = ""
-
-        fline = []
-        Sflag = False
-        tt2 = ""
-        for F1 in CharData2:
-            if not Sflag:
-                if F1[0] != " ":
-                    fline.append(F1)
-                    tt2 += F1[0]
-                    Sflag = True
-            else:
-                if F1[0] == " ":
-                    CharData5.append(fline)
-                    t1.append([tt2])
-                    fline = []
-                    tt2 = ""
-                    Sflag = False
-                else:
-                    fline.append(F1)
-                    tt2 += F1[0]
-                #end if
-            #end if
-        #next
+        # １文字ずつのレイアウトデータを取得し、検定比表と同じ方法で行を組み立てる
+        PageTexts, PageChars = self.PageExtract(page, interpreter, device)
+        t1, CharData5 = self.MakeChar(PageChars)
 
-        if len(fline)>0:
-            CharData5.append(fline)
-            t1.append([tt2])
-        #end if
         kind ="不明"
         version = "不明"
         if len(t1)>0:
@@ -279,274 +1353,95 @@ class CheckTool():
 
 
     #==================================================================================
-    #   各ページから１文字ずつの文字と座標データを抽出し、行毎の文字配列および座標配列を戻す関数
-    #       検定比表に使用する関数
+    #   文字表示の演算子だけを読んでページのキーワード索引を作成する関数（事前判定）
+    #       interpreter0, device0 : KeywordDeviceを使用したインタープリター
+    #       戻り値はHEAD_WORDSのうちページに含まれるキーワードのリスト
     #==================================================================================
 
-    def MakeChar(self, page, interpreter, device):
+    def PagePreCheck(self, page, interpreter0, device0):
 
-        interpreter.process_page(page)
-        # １文字ずつのレイアウトデータを取得
-        layout = device.get_result()
+        interpreter0.process_page(page)
+        text = device0.get_text()
+        KeyWords = [word for word in HEAD_WORDS if word in text]
+        return KeyWords
+    #end def
+    #*********************************************************************************
 
-        CharData = []
-        for lt in layout:
-            if isinstance(lt, LTChar):  # レイアウトデータうち、LTCharのみを取得
-                char1 = lt.get_text()   # レイアウトデータに含まれる全文字を取得
-                m1 = lt.matrix
-                if m1[1] == 0.0 :  # 回転していない文字のみを抽出
-                    CharData.append([char1, lt.x0, lt.x1, lt.y0, lt.y1,lt.matrix])
-                #end if
-            #end if
-        #next
+    #==================================================================================
+    #   各ページの内容ストリームを１回だけ解釈し、文字データと見出し判定用のテキストを戻す関数
+    #       PageTexts   : レイアウト解析後の各要素の文字列（テキスト以外の要素は""）
+    #       PageChars   : １文字ずつの文字データの構造化配列（内容ストリームの順番、CharDtype）
+    #       laparams    : Noneの場合はレイアウト解析を行わない（PageTextsは空）
+    #==================================================================================
 
-        # その際、CharData2をY座標の高さ順に並び替えるためのリスト「CY」を作成
-        CharData2=[]
-        CY = []
-        for cdata in CharData:
-            char2 = cdata[0]
-            x0 = cdata[1]
-            x1 = cdata[2]
-            y0 = cdata[3]
-            y1 = cdata[4]
-            
-            CharData2.append(cdata)
-            CY.append(int(y0))
-        #next
-        
-        # リスト「CY」から降順の並び替えインデックッスを取得
-        y=np.argsort(np.array(CY))[::-1]
-
-        if len(CharData2) > 0:  # リストが空でない場合に処理を行う
-            CharData3 = []
-            # インデックスを用いて並べ替えた「CharData3」を作成
-            for i in range(len(y)):
-                CharData3.append(CharData2[y[i]])
-            #next
+    def PageExtract(self, page, interpreter, device, laparams=None):
 
-            # 同じ高さのY座標毎にデータをまとめる２次元のリストを作成
-            CharData4 = []
-            i = 0
-            for f in CharData3:
-                if i==0 :   # 最初の文字のY座標を基準値に採用し、仮のリストを初期化
-                    Fline = []
-                    Fline.append(f)
-                    gy = int(f[3])
+        interpreter.process_page(page)
+        # １文字ずつのレイアウトデータを取得（解析前なので内容ストリームの順番のまま）
+        layout = device.get_result()
+        # デバイスが保持しているレイアウトデータの参照を外し、ページの処理後に解放させる
+        device.result = None
+        device.cur_item = None
+        PageChars = MakeCharRecords([lt for lt in layout if isinstance(lt, LTChar)])
+
+        PageTexts = []
+        if laparams is not None:
+            # 同じレイアウトデータを解析してテキストボックスを作成（ページの再解釈は行わない）
+            layout.analyze(laparams)
+            for lt in layout:
+                if isinstance(lt, LTTextContainer):
+                    PageTexts.append(lt.get_text())
                 else:
-                    if int(f[3])== gy:   # 同じY座標の場合は、リストに文字を追加
-                        Fline.append(f)
-                    else:           # Y座標が異なる場合は、リストを「CharData4」を保存し、仮のリストを初期化
-                        if len(Fline) >= 4:
-                            CharData4.append(Fline)
-                        gy = int(f[3])
-                        Fline = []
-                        Fline.append(f)
-                    #end if
+                    PageTexts.append("")
                 #end if
-                i += 1
-            #next
-            # 仮のリストが残っている場合は、リストを「CharData4」を保存
-            if len(Fline) >= 4:
-                CharData4.append(Fline)
-            #end if
-
-            # 次にX座標の順番にデータを並び替える（昇順）
-            t1 = []
-            CharData5 = []
-            for F1 in CharData4:    # Y座標が同じデータを抜き出す。                        
-                CX = []         # 各データのX座標のデータリストを作成
-                for F2 in F1:
-                    CX.append(F2[1])
-                #next
-                
-                # リスト「CX」から降順の並び替えインデックッスを取得
-                x=np.argsort(np.array(CX))
-                
-                # インデックスを用いて並べ替えた「F3」を作成
-                F3 = []
-                t2 = ""
-                for i in range(len(x)):
-                    F3.append(F1[x[i]])
-                    t3 = F1[x[i]][0]
-                    t2 += t3
-                #next
-                # t1 += t2 + "\n"
-                t1.append([t2])
-                # print(t2,len(F3))
-                CharData5.append(F3)
             #next
         #end if
 
-        CharData2 = []
-        for lt in layout:
-            if isinstance(lt, LTChar):  # レイアウトデータうち、LTCharのみを取得
-                char1 = lt.get_text()   # レイアウトデータに含まれる全文字を取得
-                if lt.matrix[1] > 0.0 : # 正の回転している文字のみを抽出
-                    CharData2.append([char1, lt.x0, lt.x1, lt.y0, lt.y1,lt.matrix])
-                #end if
-            #end if
-        #nexr
-        for lt in layout:
-            if isinstance(lt, LTChar):  # レイアウトデータうち、LTCharのみを取得
-                char1 = lt.get_text()   # レイアウトデータに含まれる全文字を取得
-                if lt.matrix[1] < 0.0 : # 正の回転している文字のみを抽出
-                    CharData2.append([char1, lt.x0, lt.x1, lt.y0, lt.y1,lt.matrix])
-                #end if
-            #end iuf
-        #next
-        
-        fline = []
-        Sflag = False
-        tt2 = ""
-        
-        fline = []
-        Sflag = False
-        tt2 = ""
-        for F1 in CharData2:
-            if not Sflag:
-                if F1[0] != " ":
-                    fline.append(F1)
-                    tt2 += F1[0]
-                    Sflag = True
-                #end if
-            else:
-                if F1[0] == " ":
-                    CharData5.append(fline)
-                    t1.append([tt2])
-                    fline = []
-                    tt2 = ""
-                    Sflag = False
-                else:
-                    fline.append(F1)
-                    tt2 += F1[0]
-                #end if
-            #end if
-        #next
-
-        if len(fline)>0:
-            CharData5.append(fline)
-            t1.append([tt2])
-        #end if
-
-        return t1 , CharData5
+        return PageTexts, PageChars
     #end def
     #*********************************************************************************
 
     #==================================================================================
     #   各ページから１文字ずつの文字と座標データを抽出し、行毎の文字配列および座標配列を戻す関数
-    #       検定比図に使用する関数
+    #       検定比表に使用する関数
     #==================================================================================
 
-    def MakeChar2(self, page, interpreter, device):
+    def MakeChar(self, PageChars):
 
-        interpreter.process_page(page)
-        # １文字ずつのレイアウトデータを取得
-        layout = device.get_result()
+        # １回の並べ替えで行を組み立てる（各行はCharLine）
+        table = CharTable(PageChars)
+        t1, CharData5 = table.MakeLines(4)
 
-        CharData = []
-        CharData2 = []
-        for lt in layout:
-            if isinstance(lt, LTChar):  # レイアウトデータうち、LTCharのみを取得
-                char1 = lt.get_text()   # レイアウトデータに含まれる全文字を取得
-                m1 = lt.matrix
-                if m1[1] == 0.0 :  # 回転していない文字のみを抽出
-                    CharData.append([char1, lt.x0, lt.x1, lt.y0, lt.y1,lt.matrix])
-                else:
-                    CharData2.append([char1, lt.x0, lt.x1, lt.y0, lt.y1,lt.matrix])
-                #end if
-            #end if
-        #next
+        return t1 , CharData5
+    #end def
+    #*********************************************************************************
 
-        # n = len(CharData)
-        # text1 = ""
-        y1=CharData[0][3]
-        cdata = []
-        cline=[]
-        tline = ""
-        tbox = []
-        for c in CharData:
-            y=c[3]
-            if y == y1:
-                cline.append(c)
-                tline += c[0]
-            else:
-                cdata.append(cline)
-                tbox.append([tline])
-                # text1 += tline + "\n"
-                y1=c[3]
-                cline=[]
-                tline = ""
-                cline.append(c)
-                tline += c[0]
-            #end if
-        #next
-        if tline != "":
-            cdata.append(cline)
-            tbox.append([tline])
-            # text1 += tline + "\n"
-        #end if
+    #==================================================================================
+    #   各ページから１文字ずつの文字と座標データを抽出し、行毎の文字配列および座標配列を戻す関数
+    #       検定比図に使用する関数
+    #==================================================================================
 
-        cline=[]
-        tline = ""
-        flag = False
-        for c in CharData2:
-            if flag == False:
-                if c[0] != " ":
-                    cline.append(c)
-                    tline += c[0]
-                    flag = True
-                #end if
-            else:
-                if c[0] != " ":
-                    cline.append(c)
-                    tline += c[0]
-                    flag = True
-                else:
-                    cdata.append(cline)
-                    tbox.append([tline])
-                    cline=[]
-                    tline = ""
-                    flag = False
-                #end if
-            #end if
-        #next
-        if tline != "":
-            cdata.append(cline)
-            tbox.append([tline])
-        #end if
+    def MakeChar2(self, PageChars):
 
-        # print(text1)
-        t1 = tbox
-        CharData5 = cdata
-        
+        # Y座標の変化する位置で行を区切る（各行はCharLine）
+        table = CharTable(PageChars)
+        t1, CharData5 = table.MakeLines2()
 
         return t1 , CharData5
     #end def
     #*********************************************************************************
 
     #==================================================================================
-    #   各ページの数値を検索し、閾値を超える数値を四角で囲んだPDFファイルを作成する関数
-    #   （SS7用の関数）
+    #   見出しの文字からSS7のページの種類（mode）と構造種別（B_kind）を判定する関数
+    #       PageTexts   : PageExtractで抽出したテキストボックスの文字列
+    #       該当しない場合はmode=""を戻す
     #==================================================================================
 
-    def SS7(self, page, limit, interpreter, device,interpreter2, device2):
-        
-        #============================================================
-        # 構造計算書がSS7の場合の処理
-        #============================================================
-        pageFlag = False
-        ResultData = []
-        limit1 = limit
-        limit2 = limit
-        limit3 = limit
-        interpreter.process_page(page)
-        layout = device.get_result()
+    def SS7Mode(self, PageTexts):
         #
         #   このページに「柱の断面検定表」、「梁の断面検定表」、「壁の断面検定表」、「検定比図」の
         #   文字が含まれている場合のみ数値の検索を行う。
         #
-        QDL_Flag = False
-        検定表_Flag = False
         柱_Flag = False
         梁_Flag = False
         壁_Flag = False
@@ -554,54 +1449,45 @@ class CheckTool():
         杭_Flag = False
         検定比図_Flag = False
 
-        xd = 3      #  X座標の左右に加える余白のサイズ（ポイント）を設定
-
         mode = ""
 
-        for lt in layout:
-            # LTTextContainerの場合だけ標準出力　断面算定表(杭基礎)
-            if isinstance(lt, LTTextContainer):
-                texts = lt.get_text()
-                if "柱の断面検定表"in texts :
-                    柱_Flag = True
-                    break
-                #end if
-                if  "梁の断面検定表"in texts:
-                    梁_Flag = True
-                    break
-                #end if
-                if "壁の断面検定表"in texts :                               
-                    壁_Flag = True
-                    break
-                #end if
-                if "断面算定表"in texts and "杭基礎"in texts:
-                    杭_Flag = True
-                    break
-                #end if
-                if "ブレースの断面検定表"in texts :
-                    ブレース_Flag = True
-                    break
-                #end if
-                if "検定比図"in texts:
-                    検定比図_Flag = True
-                    break
-                #end if
+        for texts in PageTexts:
+            # テキストボックスの文字列だけを判定（テキスト以外の要素は""）　断面算定表(杭基礎)
+            if "柱の断面検定表"in texts :
+                柱_Flag = True
+                break
+            #end if
+            if  "梁の断面検定表"in texts:
+                梁_Flag = True
+                break
+            #end if
+            if "壁の断面検定表"in texts :                               
+                壁_Flag = True
+                break
+            #end if
+            if "断面算定表"in texts and "杭基礎"in texts:
+                杭_Flag = True
+                break
+            #end if
+            if "ブレースの断面検定表"in texts :
+                ブレース_Flag = True
+                break
+            #end if
+            if "検定比図"in texts:
+                検定比図_Flag = True
+                break
             #end if
         #next
 
             
         if 壁_Flag:
             i=0
-            for lt in layout:
-                # LTTextContainerの場合だけ標準出力　断面算定表(杭基礎)
-                if isinstance(lt, LTTextContainer):
-                    texts = lt.get_text()
-                    if "ブレースの断面検定表"in texts :
-                        ブレース_Flag = True
-                        壁_Flag = False
-                        break
-                    #end if
-                #enf if
+            for texts in PageTexts:
+                if "ブレースの断面検定表"in texts :
+                    ブレース_Flag = True
+                    壁_Flag = False
+                    break
+                #end if
                 i += 1
                 if i>20:
                     break
@@ -632,31 +1518,43 @@ class CheckTool():
         i = 0
         B_kind = ""
             
-        for lt in layout:
-            # LTTextContainerの場合だけ標準出力　断面算定表(杭基礎)
-            if isinstance(lt, LTTextContainer):
-                texts = lt.get_text()
-                if "RC柱"in texts or "RC梁"in texts:
-                    B_kind = "RC造"
-                    break
-                #end if
-                if "SRC柱"in texts or "SRC梁"in texts:
-                    B_kind = "SRC造"
-                    break
-                #end if
-                if "S柱"in texts or "S梁"in texts:
-                    B_kind = "S造"
-                    break
-                #end if
+        for texts in PageTexts:
+            if "RC柱"in texts or "RC梁"in texts:
+                B_kind = "RC造"
+                break
+            #end if
+            if "SRC柱"in texts or "SRC梁"in texts:
+                B_kind = "SRC造"
+                break
+            #end if
+            if "S柱"in texts or "S梁"in texts:
+                B_kind = "S造"
+                break
             #end if
         #next
 
-        if mode == "" :     # 該当しない場合はこのページの処理は飛ばす。
-            print("No Data")
-            return False,[]
-        else:
-            print(mode)
-        #end if
+        return mode, B_kind
+    #end def
+    #*********************************************************************************
+
+    #==================================================================================
+    #   各ページの数値を検索し、閾値を超える数値を四角で囲んだPDFファイルを作成する関数
+    #   （SS7用の関数）
+    #==================================================================================
+
+    def SS7(self, mode, B_kind, PageChars):
+        
+        #============================================================
+        # 構造計算書がSS7の場合の処理
+        #   mode, B_kind : SS7Modeで判定したページの種類と構造種別
+        #   PageChars    : PageExtractで１回だけ抽出したページの文字データ
+        #   閾値に関係なく、1.0以下の検定比をすべて候補（ResultData）として戻す
+        #   （閾値による選択はSelectResultsで行う）
+        #============================================================
+        pageFlag = False
+        ResultData = []
+
+        xd = 3      #  X座標の左右に加える余白のサイズ（ポイント）を設定
 
         #=================================================================================================
         #   検定比図のチェック
@@ -664,84 +1562,58 @@ class CheckTool():
         
         if mode == "検定比図" :
 
-            CharLines , CharData = self.MakeChar2(page, interpreter2,device2)
+            CharLines , CharData = self.MakeChar2(PageChars)
 
             if len(CharLines) > 0:
                 i = -1
                 for line in CharLines:
-                    i += 1
-                    t3 = line[0]
-                    CharLine = CharData[i] # １行文のデータを読み込む
-                    
-                    # line = CharLines[i][0]
-                    line2 = ""
-                    xx= CharData[i][0][2]
-                    for Char in CharData[i]:
-                        if Char[1]>xx+3:
-                            line2 += " "
-                        line2 += Char[0]
-                        xx = Char[2]
-                    #next
-                    items = line2.split()
-                    # print(line)
-                    # print(items)
-                    st = 0
-                    # t4 = t3.split()            # 文字列を空白で分割
-                    t4 = items
-
-                    if len(t4)>0 and t4[0] != "Super":    # 文字列配列が１個以上ある場合に処理
-                        for t5 in t4:
-                            t6 = t5.replace("(","").replace(")","").replace(" ","").replace("C","").replace("T","").replace("組","")     # 「検定比」と数値が一緒の場合は除去
-                            # print(t6)
-                            nn = t3.find(t6,st)   # 数値の文字位置を検索
-                            ln = len(t6)
-
-                            # カッコがある場合は左右１文字ずつ追加
-                            if "(" in t5:
-                                xn1 = 1
-                                xn2 = 1
-                            elif "C" in t5 or "T" in t5 or "組" in t5:
-                                xn1 = 0
-                                xn2 = 1
-                            else:
-                                xn1 = 0
-                                xn2 = 0
-
-                            if isfloat(t6) and len(t6)>=4:
-                                a = float(t6)
-                                if a>=limit1 and a<=1.0:
-                                    # 数値がlimit以上の場合はデータに登録
-                                    xxx0 = CharLine[nn-xn1][1]
-                                    xxx1 = CharLine[nn+ln+xn2-1][2]
-                                    if CharLine[nn][5][1] > 0.0:
-                                        yyy0 = CharLine[nn][3] - 1.0
-                                        yyy1 = CharLine[nn+ln+xn1-1][4] + 1.0
-                                    elif CharLine[nn][5][1] < 0.0:
-                                        yyy0 = CharLine[nn+ln+xn1-1][3] - 2.0
-                                        yyy1 = CharLine[nn][4] + 2.0
-                                    else:
-                                        yyy0 = CharLine[nn][3]
-                                        yyy1 = CharLine[nn][4]
-                                    #end if
-
-                                    if ln <=4 :
-                                        xxx0 -= xd
-                                        xxx1 += xd
-                                    #end if
-                                    width3 = xxx1 - xxx0
-                                    height3 = yyy1 - yyy0
-                                    ResultData.append([a,[xxx0, yyy0, width3, height3],False])
-                                    flag = True
-                                    pageFlag = True
-                                    val = a
-                                    print('val={:.2f}'.format(val))
-                                #end if
+                    i += 1
+                    t3 = line[0]
+                    CharLine = CharData[i] # １行文のデータを読み込む
+                    
+                    # 文字の間隔が3ポイントより大きい位置を空白とみなして数値のトークンを検出
+                    # （最初のトークンが「Super」の行は除外）
+                    for a, nn, n1, bracket, suffix in CharLine.ScanRatio(gap=3, skip="Super"):
+                        ln = n1 - nn
+
+                        # カッコがある場合は左右１文字ずつ追加
+                        if bracket:
+                            xn1 = 1
+                            xn2 = 1
+                        elif suffix:
+                            xn1 = 0
+                            xn2 = 1
+                        else:
+                            xn1 = 0
+                            xn2 = 0
+                        #end if
+
+                        if a<=1.0:
+                            # 数値が1.0以下の場合は候補として登録
+                            xxx0 = CharLine.x0[nn-xn1]
+                            xxx1 = CharLine.x1[nn+ln+xn2-1]
+                            if CharLine.rot[nn] > 0:
+                                yyy0 = CharLine.y0[nn] - 1.0
+                                yyy1 = CharLine.y1[nn+ln+xn1-1] + 1.0
+                            elif CharLine.rot[nn] < 0:
+                                yyy0 = CharLine.y0[nn+ln+xn1-1] - 2.0
+                                yyy1 = CharLine.y1[nn] + 2.0
+                            else:
+                                yyy0 = CharLine.y0[nn]
+                                yyy1 = CharLine.y1[nn]
                             #end if
 
-                            # 数値を検索を開始するを文字数分移動
-                            st = nn + ln 
-                        #next
-                    #end if
+                            if ln <=4 :
+                                xxx0 -= xd
+                                xxx1 += xd
+                            #end if
+                            width3 = xxx1 - xxx0
+                            height3 = yyy1 - yyy0
+                            ResultData.append([a,[xxx0, yyy0, width3, height3],False])
+                            flag = True
+                            pageFlag = True
+                        #end if
+                    #next
                 #next
             #end if
                 
@@ -751,7 +1623,7 @@ class CheckTool():
                         
         elif mode == "柱の検定表" : 
 
-            CharLines , CharData = self.MakeChar(page, interpreter2,device2)
+            CharLines , CharData = self.MakeChar(PageChars)
             
             if B_kind == "RC造" or B_kind == "SRC造" or B_kind == "":
                 # =======================================================
@@ -769,29 +1641,21 @@ class CheckTool():
                                 kmode = True
                                 # 「検定比」の下にある数値だけを検出するためのX座標を取得
                                 n = t3.index("検定比")
-                                c1 = CharData[i][n]
-                                zx0 = c1[1]
-                                c2 = CharData[i][n+2]
-                                zx1 = c2[2]
-                                # print(c1[0],c2[0], zx0, zx1)
+                                zx0 = CharData[i].x0[n]
+                                zx1 = CharData[i].x1[n+2]
                         else:
                             CharLine = CharData[i] # １行文のデータを読み込む
-                            t4 = ""
-                        
-                            for char in CharLine:
-                                # kmodeの時には「検定比」の下にある数値だけを検出する。
-                                if char[1]>=zx0 and char[2]<=zx1:
-                                    t4 += char[0]
-                            # t4=t4.replace("検定比","")
-                            if isfloat(t4) and len(t4)>=4: # 切り取った文字が数値の場合の処理
-                                a = float(t4)
-                                if a>=limit1 and a<=1.0:
-                                    # 数値がlimit以上の場合はデータに登録
-                                    nn = t3.index(t4)   # 数値の文字位置を検索
-                                    xxx0 = CharLine[nn][1]
-                                    xxx1 = CharLine[nn+3][2]
-                                    yyy0 = CharLine[nn][3]
-                                    yyy1 = CharLine[nn][4]
+                            # kmodeの時には「検定比」の下にある数値だけを検出する。
+                            mask = (CharLine.x0>=zx0) & (CharLine.x1<=zx1)
+                            R = list(CharLine.ScanRatio(mask=mask, plain=True))
+                            if len(R) == 1 and len("".join(CharLine.chars[mask]).split()) == 1: # 切り取った文字が数値だけの場合の処理
+                                a, nn = R[0][0], R[0][1]
+                                if a<=1.0:
+                                    # 数値が1.0以下の場合は候補として登録
+                                    xxx0 = CharLine.x0[nn]
+                                    xxx1 = CharLine.x1[nn+3]
+                                    yyy0 = CharLine.y0[nn]
+                                    yyy1 = CharLine.y1[nn]
                                     xxx0 -= xd
                                     xxx1 += xd
                                     width3 = xxx1 - xxx0
@@ -799,8 +1663,6 @@ class CheckTool():
                                     ResultData.append([a,[xxx0, yyy0, width3, height3],False])
                                     flag = True
                                     pageFlag = True
-                                    val = a
-                                    print('val={:.2f}'.format(val))
 
                     i = -1
                     for line in CharLines:
@@ -808,44 +1670,25 @@ class CheckTool():
                         t3 = line[0]
                         # print(t3)
                         CharLine = CharData[i] # １行文のデータを読み込む
-                        t4 = ""
-                    
-                        for char in CharLine:
-                            # kmodeの時には「検定比」の下にある数値だけを検出する。
-                            if char[1]>zx1:
-                                t4 += char[0]
-                        if "検定比" in t4:
-                            st = 0
-                            n = t3.find("検定比",st)
-                            w0 = t4.split()
-                            if len(w0)>=1:
-                                st = n + 3
-                                for w1 in w0:
-                                    w2 = w1.replace("検定比","")
-                                    if isfloat(w2) and len(w2)>=4: # 切り取った文字が数値の場合の処理
-                                        a = float(w2)
-                                        if a>=limit1 and a<=1.0:
-                                            # 数値がlimit以上の場合はデータに登録
-                                            n = t3.find(w2,st)   # 数値の文字位置を検索
-                                            xxx0 = CharLine[n][1]
-                                            xxx1 = CharLine[n+3][2]
-                                            yyy0 = CharLine[n][3]
-                                            yyy1 = CharLine[n][4]
-                                            xxx0 -= xd
-                                            xxx1 += xd
-                                            width3 = xxx1 - xxx0
-                                            height3 = yyy1 - yyy0
-                                            ResultData.append([a,[xxx0, yyy0, width3, height3],False])
-                                            flag = True
-                                            pageFlag = True
-                                            val = a
-                                            print('val={:.2f}'.format(val))
-                                        #end if
-                                    #end if
-                                    
-                                    st = t3.find(w1,st)+ len(w1)
-                                #next
-                            #end if
+                        # 「検定比」の列より右側にある文字だけを検出する。
+                        mask = CharLine.x0>zx1
+                        if "検定比" in "".join(CharLine.chars[mask]):
+                            for a, n, n1, bracket, suffix in CharLine.ScanRatio(label="検定比", mask=mask, plain=True):
+                                if a<=1.0:
+                                    # 数値が1.0以下の場合は候補として登録
+                                    xxx0 = CharLine.x0[n]
+                                    xxx1 = CharLine.x1[n+3]
+                                    yyy0 = CharLine.y0[n]
+                                    yyy1 = CharLine.y1[n]
+                                    xxx0 -= xd
+                                    xxx1 += xd
+                                    width3 = xxx1 - xxx0
+                                    height3 = yyy1 - yyy0
+                                    ResultData.append([a,[xxx0, yyy0, width3, height3],False])
+                                    flag = True
+                                    pageFlag = True
+                                #end if
+                            #next
                         #end if
                     #next
                 #end if
@@ -878,53 +1721,36 @@ class CheckTool():
                                 kmode = True
                                 # fwordより右側にある数値だけを検出するためのX座標を取得
                                 n = t3.index(fword)
-                                c1 = CharData[i][n]
-                                zx0 = c1[1]
+                                zx0 = CharData[i].x0[n]
                             #end if
                         else:
                             if kmode :
                                 
                                 CharLine = CharData[i] # １行文のデータを読み込む
-                                t4 = ""
-                            
-                                for char in CharLine:
-                                    # kmodeの時には「検定比」の下にある数値だけを検出する。
-                                    if char[1]>=zx0 :
-                                        t4 += char[0]
-                                        
+                                # kmodeの時にはfwordより右側にある数値だけを検出する。
+                                mask = CharLine.x0>=zx0
+                                t4 = "".join(CharLine.chars[mask])
+
                                 t4 = t4.replace(fword,"") 
                                 if t4 == "": # 
                                     kmode = False
                                 else:
-                                    st = 0
-                                    w0 = t4.split()
-                                    if len(w0)>=1:
-                                        for w1 in w0:
-                                            w2 = w1.replace(" ","")
-                                            if isfloat(w2) and len(w2)>=4: # 切り取った文字が数値の場合の処理
-                                                a = float(w2)
-                                                if a>=limit1 and a<=1.0:
-                                                    # 数値がlimit以上の場合はデータに登録
-                                                    n = t3.find(w2,st)   # 数値の文字位置を検索
-                                                    xxx0 = CharLine[n][1]
-                                                    xxx1 = CharLine[n+3][2]
-                                                    yyy0 = CharLine[n][3]
-                                                    yyy1 = CharLine[n][4]
-                                                    xxx0 -= xd
-                                                    xxx1 += xd
-                                                    width3 = xxx1 - xxx0
-                                                    height3 = yyy1 - yyy0
-                                                    ResultData.append([a,[xxx0, yyy0, width3, height3],False])
-                                                    flag = True
-                                                    pageFlag = True
-                                                    val = a
-                                                    print('val={:.2f}'.format(val))
-                                                #end if
-                                            #end if
-                                            
-                                            st = t3.find(w1,st)+ len(w1)
-                                        #next
-                                    #end if
+                                    for a, n, n1, bracket, suffix in CharLine.ScanRatio(label=fword, mask=mask, plain=True):
+                                        if a<=1.0:
+                                            # 数値が1.0以下の場合は候補として登録
+                                            xxx0 = CharLine.x0[n]
+                                            xxx1 = CharLine.x1[n+3]
+                                            yyy0 = CharLine.y0[n]
+                                            yyy1 = CharLine.y1[n]
+                                            xxx0 -= xd
+                                            xxx1 += xd
+                                            width3 = xxx1 - xxx0
+                                            height3 = yyy1 - yyy0
+                                            ResultData.append([a,[xxx0, yyy0, width3, height3],False])
+                                            flag = True
+                                            pageFlag = True
+                                        #end if
+                                    #next
                                 #end if
                             #end if
                         #end if
@@ -939,7 +1765,7 @@ class CheckTool():
                             
         elif mode == "梁の検定表" : 
 
-            CharLines , CharData = self.MakeChar(page, interpreter2,device2)
+            CharLines , CharData = self.MakeChar(PageChars)
             if B_kind == "RC造" or B_kind == "SRC造" or B_kind == "":
                 # =======================================================
                 #   RC造およびSRC造の梁の検定表
@@ -956,38 +1782,23 @@ class CheckTool():
                         
                         if "検定比" in t3 : # 「検定比」が現れた場合の処理
                             # print(t3)
-                            st = 0
-                            t4 = t3.split()            # 文字列を空白で分割
-                            if len(t4)>0:    # 文字列配列が１個以上ある場合に処理
-                                for t5 in t4:
-                                    t6 = t5.replace("検定比","")    # 「検定比」と数値が一緒の場合は除去
-                                    nn = t3.find(t6,st)   # 数値の文字位置を検索
-                                    ln = len(t5)
-                                    if isfloat(t6) and len(t6)>=4:
-                                        a = float(t6)
-                                        if a>=limit1 and a<=1.0:
-                                            # 数値がlimit以上の場合はデータに登録
-                                            xxx0 = CharLine[nn][1]
-                                            xxx1 = CharLine[nn+3][2]
-                                            yyy0 = CharLine[nn][3]
-                                            yyy1 = CharLine[nn][4]
-                                            xxx0 -= xd
-                                            xxx1 += xd
-                                            width3 = xxx1 - xxx0
-                                            height3 = yyy1 - yyy0
-                                            ResultData.append([a,[xxx0, yyy0, width3, height3],False])
-                                            flag = True
-                                            pageFlag = True
-                                            val = a
-                                            print('val={:.2f}'.format(val))
-                                        #end if
-                                    #end if
-
-                                    # 数値を検索を開始するを文字数分移動
-                                    st = t3.find(t5,st)+ len(t5)
-                                    # st += ln
-                                #next
-                            #end if
+                            # 「検定比」と数値が一緒のトークンも含めて数値を検出
+                            for a, nn, n1, bracket, suffix in CharLine.ScanRatio(label="検定比", plain=True):
+                                if a<=1.0:
+                                    # 数値が1.0以下の場合は候補として登録
+                                    xxx0 = CharLine.x0[nn]
+                                    xxx1 = CharLine.x1[nn+3]
+                                    yyy0 = CharLine.y0[nn]
+                                    yyy1 = CharLine.y1[nn]
+                                    xxx0 -= xd
+                                    xxx1 += xd
+                                    width3 = xxx1 - xxx0
+                                    height3 = yyy1 - yyy0
+                                    ResultData.append([a,[xxx0, yyy0, width3, height3],False])
+                                    flag = True
+                                    pageFlag = True
+                                #end if
+                            #next
                         #end if
                     #next
                 #end if
@@ -1018,51 +1829,35 @@ class CheckTool():
                                 #end i
                                 # fwordより右側にある数値だけを検出するためのX座標を取得
                                 n = t3.index(fword)  # + len(fword)
-                                c1 = CharData[i][n]
-                                zx0 = c1[1]
+                                zx0 = CharData[i].x0[n]
                             #end if
                         if kmode :
                             CharLine = CharData[i] # １行文のデータを読み込む
-                            t4 = ""
-                        
-                            for char in CharLine:
-                                # kfwordより右側にある数値だけを検出する。
-                                if char[1]>=zx0 :
-                                    t4 += char[0]
+                            # fwordより右側にある数値だけを検出する。
+                            mask = CharLine.x0>=zx0
+                            t4 = "".join(CharLine.chars[mask])
 
                             t4 = t4.replace(fword,"") 
                             #next
                             if t4 == "": # 
                                 kmode = False
                             else:
-                                st = 0
-                                w0 = t4.split()
-                                if len(w0)>=1:
-                                    for w1 in w0:
-                                        w2 = w1.replace(" ","")
-                                        if isfloat(w2) and len(w2)>=4: # 切り取った文字が数値の場合の処理
-                                            a = float(w2)
-                                            if a>=limit1 and a<=1.0:
-                                                # 数値がlimit以上の場合はデータに登録
-                                                n = t3.find(w2,st)   # 数値の文字位置を検索
-                                                xxx0 = CharLine[n][1]
-                                                xxx1 = CharLine[n+3][2]
-                                                yyy0 = CharLine[n][3]
-                                                yyy1 = CharLine[n][4]
-                                                xxx0 -= xd
-                                                xxx1 += xd
-                                                width3 = xxx1 - xxx0
-                                                height3 = yyy1 - yyy0
-                                                ResultData.append([a,[xxx0, yyy0, width3, height3],False])
-                                                flag = True
-                                                pageFlag = True
-                                                val = a
-                                                print('val={:.2f}'.format(val))
-                                            #end if
-                                        #end if
-                                        st = t3.find(w1,st)+ len(w1)
-                                    #next
-                                #end if
+                                for a, n, n1, bracket, suffix in CharLine.ScanRatio(label=fword, mask=mask, plain=True):
+                                    if a<=1.0:
+                                        # 数値が1.0以下の場合は候補として登録
+                                        xxx0 = CharLine.x0[n]
+                                        xxx1 = CharLine.x1[n+3]
+                                        yyy0 = CharLine.y0[n]
+                                        yyy1 = CharLine.y1[n]
+                                        xxx0 -= xd
+                                        xxx1 += xd
+                                        width3 = xxx1 - xxx0
+                                        height3 = yyy1 - yyy0
+                                        ResultData.append([a,[xxx0, yyy0, width3, height3],False])
+                                        flag = True
+                                        pageFlag = True
+                                    #end if
+                                #next
                             #end if
                         #end if
                     #next
@@ -1074,7 +1869,7 @@ class CheckTool():
         #=================================================================================================
 
         elif mode == "壁の検定表":
-            outtext1 , CharData1 = self.MakeChar(page, interpreter2,device2)
+            outtext1 , CharData1 = self.MakeChar(PageChars)
             
             if len(outtext1) > 0:
                 i = -1
@@ -1089,36 +1884,30 @@ class CheckTool():
                     CharLine = CharData1[i]
                     if "QDL" in t3:
                         nn = t3.find("QDL",0)   # 数値の文字位置を検索
-                        xxx0 = CharLine[nn][1]
-                        yyy1 = CharLine[nn][4]
+                        xxx0 = CharLine.x0[nn]
+                        yyy1 = CharLine.y1[nn]
                         t4 = t3[nn+3:].replace(" ","")
-                        if isfloat(t4):
-                            A1 = float(t4)
-                        else:
-                            A1 = 0.0
+                        A1 = ScanNumber(t4, 0.0)
                         
                         i += 1
                         t3 = outtext1[i][0]
                         CharLine = CharData1[i]
                         
                         nn  = t3.find("QAL",0) 
-                        yyy0 = CharLine[nn][3]
+                        yyy0 = CharLine.y0[nn]
 
                         t4 = t3[nn+3:].replace(" ","")
                         nn2 = len(t3[nn:])
                         
-                        xxx1 = CharLine[nn+nn2-1][2]
-                        yyy0 = CharLine[nn+nn2-1][3]
+                        xxx1 = CharLine.x1[nn+nn2-1]
+                        yyy0 = CharLine.y0[nn+nn2-1]
                         
-                        if isfloat(t4):
-                            A2 = float(t4)
-                        else:
-                            A2 = 10000.0
+                        A2 = ScanNumber(t4, 10000.0)
                         QDL_mode = False
                         
                         if A2 != 0.0:
                             a = abs(A1/A2)
-                            if a>=limit2 and a<=1.0:
+                            if a<=1.0:
                                 
                                 xxx0 -= xd
                                 xxx1 += xd
@@ -1132,8 +1921,6 @@ class CheckTool():
                                 ResultData.append([a,[xxx0, yyy0, width3, height3],True,points])
                                 flag = True
                                 pageFlag = True
-                                val = a
-                                print('val={:.2f}'.format(val))
 
                         i += 1
                         t3 = outtext1[i][0]
@@ -1141,13 +1928,10 @@ class CheckTool():
                         CharLine = CharData1[i]
 
                         nn = t3.find("QDS",0)   # 数値の文字位置を検索
-                        xxx0 = CharLine[nn][1]
-                        yyy1 = CharLine[nn][4]
+                        xxx0 = CharLine.x0[nn]
+                        yyy1 = CharLine.y1[nn]
                         t4 = t3[nn+3:].replace(" ","")
-                        if isfloat(t4):
-                            A1 = float(t4)
-                        else:
-                            A1 = 0.0
+                        A1 = ScanNumber(t4, 0.0)
                         QDL_mode = True
                             
                     
@@ -1156,23 +1940,20 @@ class CheckTool():
                         CharLine = CharData1[i]
                         
                         nn = t3.find("QAS",0)
-                        yyy0 = CharLine[nn][3]
+                        yyy0 = CharLine.y0[nn]
 
                         t4 = t3[nn+3:].split()[0]
                         nn2 = len(t3[nn:])
                         
-                        xxx1 = CharLine[nn+nn2-1][2]
-                        yyy0 = CharLine[nn+nn2-1][3]
+                        xxx1 = CharLine.x1[nn+nn2-1]
+                        yyy0 = CharLine.y0[nn+nn2-1]
                         
-                        if isfloat(t4):
-                            A2 = float(t4)
-                        else:
-                            A2 = 10000.0
+                        A2 = ScanNumber(t4, 10000.0)
                         QDL_mode = False
                         
                         if A2 != 0.0:
                             a = abs(A1/A2)
-                            if a>=limit2 and a<=1.0:
+                            if a<=1.0:
                                 
                                 xxx0 -= xd
                                 xxx1 += xd
@@ -1181,8 +1962,6 @@ class CheckTool():
                                 ResultData.append([a,[xxx0, yyy0, width3, height3],True])
                                 flag = True
                                 pageFlag = True
-                                val = a
-                                print('val={:.2f}'.format(val))
                             #end if
                         #end if
                     #end if
@@ -1199,7 +1978,7 @@ class CheckTool():
                         
         elif mode == "ブレースの検定表" : 
 
-            CharLines , CharData = self.MakeChar(page, interpreter2,device2)
+            CharLines , CharData = self.MakeChar(PageChars)
             
             if len(CharLines) > 0:
                     # lines =t1.splitlines()
@@ -1223,51 +2002,35 @@ class CheckTool():
                                 #end i
                                 # fwordより右側にある数値だけを検出するためのX座標を取得
                                 n = t3.index(fword)  # + len(fword)
-                                c1 = CharData[i][n]
-                                zx0 = c1[1]
+                                zx0 = CharData[i].x0[n]
                             #end if
                         if kmode :
                             CharLine = CharData[i] # １行文のデータを読み込む
-                            t4 = ""
-                        
-                            for char in CharLine:
-                                # kfwordより右側にある数値だけを検出する。
-                                if char[1]>=zx0 :
-                                    t4 += char[0]
+                            # fwordより右側にある数値だけを検出する。
+                            mask = CharLine.x0>=zx0
+                            t4 = "".join(CharLine.chars[mask])
 
                             t4 = t4.replace(fword,"") 
                             #next
                             if t4 == "": # 
                                 kmode = False
                             else:
-                                st = 0
-                                w0 = t4.split()
-                                if len(w0)>=1:
-                                    for w1 in w0:
-                                        w2 = w1.replace(" ","")
-                                        if isfloat(w2) and len(w2)>=4: # 切り取った文字が数値の場合の処理
-                                            a = float(w2)
-                                            if a>=limit1 and a<=1.0:
-                                                # 数値がlimit以上の場合はデータに登録
-                                                n = t3.find(w2,st)   # 数値の文字位置を検索
-                                                xxx0 = CharLine[n][1]
-                                                xxx1 = CharLine[n+3][2]
-                                                yyy0 = CharLine[n][3]
-                                                yyy1 = CharLine[n][4]
-                                                xxx0 -= xd
-                                                xxx1 += xd
-                                                width3 = xxx1 - xxx0
-                                                height3 = yyy1 - yyy0
-                                                ResultData.append([a,[xxx0, yyy0, width3, height3],False])
-                                                flag = True
-                                                pageFlag = True
-                                                val = a
-                                                print('val={:.2f}'.format(val))
-                                            #end if
-                                        #end if
-                                        st = t3.find(w1,st)+ len(w1)
-                                    #next
-                                #end if
+                                for a, n, n1, bracket, suffix in CharLine.ScanRatio(label=fword, mask=mask, plain=True):
+                                    if a<=1.0:
+                                        # 数値が1.0以下の場合は候補として登録
+                                        xxx0 = CharLine.x0[n]
+                                        xxx1 = CharLine.x1[n+3]
+                                        yyy0 = CharLine.y0[n]
+                                        yyy1 = CharLine.y1[n]
+                                        xxx0 -= xd
+                                        xxx1 += xd
+                                        width3 = xxx1 - xxx0
+                                        height3 = yyy1 - yyy0
+                                        ResultData.append([a,[xxx0, yyy0, width3, height3],False])
+                                        flag = True
+                                        pageFlag = True
+                                    #end if
+                                #next
                             #end if
                         #end if
     
@@ -1278,55 +2041,48 @@ class CheckTool():
     #*********************************************************************************
 
 
-    def OtherSheet(self, page, limit, interpreter, device,interpreter2, device2):
+    #==================================================================================
+    #   見出しの文字から種類が不明の計算書のページの種類（mode）を判定する関数
+    #==================================================================================
+
+    def OtherSheetMode(self, PageTexts):
+        #
+        #   このページに「断面検定表」、「検定比図」の
+        #   文字が含まれている場合のみ数値の検索を行う。（該当しない場合はmode=""を戻す）
+        #
+        mode = ""
+        for texts in PageTexts:
+            # テキストボックスの文字列だけを判定　断面算定表(杭基礎) 仕口 継手 付着
+            texts = texts.replace("\n","")                
+            if "柱の断面検定表"in texts or "梁の断面検定表"in texts or "ブレースの断面検定表"in texts or "壁の断面検定表"in texts  or "検定比図" in texts : 
+                mode = "検定比図"   # 種類が不明の計算書は検定比図と同じ方法で数値を検出する
+                break                   
+            #end if
+        #next
+        return mode
+    #end def
+    #*********************************************************************************
+
+    def OtherSheet(self, mode, PageChars):
         
         #============================================================
         # 構造計算書が不明の場合の処理
+        #   mode        : OtherSheetModeで判定したページの種類
+        #   PageChars   : PageExtractで１回だけ抽出したページの文字データ
+        #   閾値に関係なく、1.0以下の検定比をすべて候補（ResultData）として戻す
         #============================================================
         pageFlag = False
         ResultData = []
-        limit1 = limit
-        limit2 = limit
-        limit3 = limit
-        interpreter.process_page(page)
-        layout = device.get_result()
-        #
-        #   このページに「断面検定表」、「検定比図」の
-        #   文字が含まれている場合のみ数値の検索を行う。
-        #
-        
-
-        検定比_Flag = False
 
         xd = 3      #  X座標の左右に加える余白のサイズ（ポイント）を設定
 
-        mode = ""
-        
-        for lt in layout:
-            # LTTextContainerの場合だけ標準出力　断面算定表(杭基礎) 仕口 継手 付着
-            if isinstance(lt, LTTextContainer):
-                texts = lt.get_text()
-                texts = texts.replace("\n","")                
-                if "柱の断面検定表"in texts or "梁の断面検定表"in texts or "ブレースの断面検定表"in texts or "壁の断面検定表"in texts  or "検定比図" in texts : 
-                    検定比_Flag = True
-                    break                   
-            #end if
-        #next
-
-        if not 検定比_Flag  :     # 該当しない場合はこのページの処理は飛ばす。
-            print("No Data")
-            return False,[]
-        else:
-            print("")
-        #end if
-
         #=================================================================================================
         #   検定比図のチェック
         #=================================================================================================
         
-        if 検定比_Flag  :
+        if mode == "検定比図"  :
 
-            CharLines , CharData = self.MakeChar2(page, interpreter2,device2)
+            CharLines , CharData = self.MakeChar2(PageChars)
 
             if len(CharLines) > 0:
                 i = -1
@@ -1336,78 +2092,49 @@ class CheckTool():
                     t3 = line[0]
                     CharLine = CharData[i] # １行文のデータを読み込む
                     
-                    # line = CharLines[i][0]
-                    line2 = ""
-                    xx= CharData[i][0][2]
-                    for Char in CharData[i]:
-                        if Char[1]>xx+3:
-                            line2 += " "
-                        line2 += Char[0]
-                        xx = Char[2]
-                    #next
-                    items = line2.split()
-                    # print(line)
-                    # print(items)
-                    a=0
+                    # 文字の間隔が3ポイントより大きい位置を空白とみなして数値のトークンを検出
+                    # （最初のトークンが「Super」の行は除外）
+                    for a, nn, n1, bracket, suffix in CharLine.ScanRatio(gap=3, skip="Super"):
+                        ln = n1 - nn
+
+                        # カッコがある場合は左右１文字ずつ追加
+                        if bracket:
+                            xn1 = 1
+                            xn2 = 1
+                        elif suffix:
+                            xn1 = 0
+                            xn2 = 1
+                        else:
+                            xn1 = 0
+                            xn2 = 0
+                        #end if
 
-                    # if "検定比" in t3 : # 「検定比」が現れた場合の処理
-                    # print(t3)
-                    st = 0
-                    # t4 = t3.split()            # 文字列を空白で分割
-                    t4 = items
-                    if len(t4)>0 and t4[0] != "Super":    # 文字列配列が１個以上ある場合に処理
-                        for t5 in t4:
-                            t6 = t5.replace("(","").replace(")","").replace(" ","").replace("C","").replace("T","").replace("組","")     # 「検定比」と数値が一緒の場合は除去
-                            nn = t3.find(t6,st)   # 数値の文字位置を検索
-                            ln = len(t6)
-
-                            # カッコがある場合は左右１文字ずつ追加
-                            if "(" in t5:
-                                xn1 = 1
-                                xn2 = 1
-                            elif "C" in t5 or "T" in t5 or "組" in t5:
-                                xn1 = 0
-                                xn2 = 1
+                        if a<=1.0:
+                            # 数値が1.0以下の場合は候補として登録
+                            xxx0 = CharLine.x0[nn-xn1]
+                            xxx1 = CharLine.x1[nn+ln+xn2-1]
+                            if CharLine.rot[nn] > 0:
+                                yyy0 = CharLine.y0[nn] - 1.0
+                                yyy1 = CharLine.y1[nn+ln+xn1-1] + 1.0
+                            elif CharLine.rot[nn] < 0:
+                                yyy0 = CharLine.y0[nn+ln+xn1-1] - 2.0
+                                yyy1 = CharLine.y1[nn] + 2.0
                             else:
-                                xn1 = 0
-                                xn2 = 0
-
-                            if isfloat(t6) and len(t6)>=4:
-                                a = float(t6)
-                                if a>=limit1 and a<=1.0:
-                                    # 数値がlimit以上の場合はデータに登録
-                                    xxx0 = CharLine[nn-xn1][1]
-                                    xxx1 = CharLine[nn+ln+xn2-1][2]
-                                    if CharLine[nn][5][1] > 0.0:
-                                        yyy0 = CharLine[nn][3] - 1.0
-                                        yyy1 = CharLine[nn+ln+xn1-1][4] + 1.0
-                                    elif CharLine[nn][5][1] < 0.0:
-                                        yyy0 = CharLine[nn+ln+xn1-1][3] - 2.0
-                                        yyy1 = CharLine[nn][4] + 2.0
-                                    else:
-                                        yyy0 = CharLine[nn][3]
-                                        yyy1 = CharLine[nn][4]
-                                    #end if
-
-                                    if ln <=4 :
-                                        xxx0 -= xd
-                                        xxx1 += xd
-                                    #end if
-                                    width3 = xxx1 - xxx0
-                                    height3 = yyy1 - yyy0
-                                    ResultData.append([a,[xxx0, yyy0, width3, height3],False])
-                                    flag = True
-                                    pageFlag = True
-                                    val = a
-                                    print('val={:.2f}'.format(val))
-                                #end if
+                                yyy0 = CharLine.y0[nn]
+                                yyy1 = CharLine.y1[nn]
                             #end if
 
-
-                            # 数値を検索を開始するを文字数分移動
-                            st = nn + ln
-                        #next
-                    #end if
+                            if ln <=4 :
+                                xxx0 -= xd
+                                xxx1 += xd
+                            #end if
+                            width3 = xxx1 - xxx0
+                            height3 = yyy1 - yyy0
+                            ResultData.append([a,[xxx0, yyy0, width3, height3],False])
+                            flag = True
+                            pageFlag = True
+                        #end if
+                    #next
                 #next
             #end if
         # #end if
@@ -1421,89 +2148,50 @@ class CheckTool():
 
     #============================================================================
     #  表紙のチェック（外部から読み出す関数名）
+    #       renderer : 表紙の結果のページを追加するResultRenderer（Noneの場合は作成しない）
     #============================================================================
 
-    def TopPageCheckTool(self,filename, outdir,limit=0.95 ):
+    def TopPageCheckTool(self,filename, renderer,limit=0.95 ):
         global flag1, fname, dir1, dir2, dir3, dir4, dir5, folderName, paraFileName
         global ErrorFlag, ErrorMessage
-        global kind, verion
+        # kind, versionはローカル変数（複数の計算書を同時に処理するため、モジュールの変数は使用しない）
 
         if filename =="" :
             return False
         #end if
 
         pdf_file = filename
-        pdf_out_file = outdir + "/outfile0000.pdf"
 
-        # PyPDF2のツールを使用してPDFのページ情報を読み取る。
-        # PDFのページ数と各ページの用紙サイズを取得
-        try:
-            with open(pdf_file, "rb") as input:
-                reader = PR2(input)
-                self.PageMax = len(reader.pages)     # PDFのページ数
-                PaperSize = []
-                for page in reader.pages:       # 各ページの用紙サイズの読取り
-                    p_size = page.mediabox
-                    page_xmin = float(page.mediabox.lower_left[0])
-                    page_ymin = float(page.mediabox.lower_left[1])
-                    page_xmax = float(page.mediabox.upper_right[0])
-                    page_ymax = float(page.mediabox.upper_right[1])
-                    PaperSize.append([page_xmax - page_xmin , page_ymax - page_ymin])
-            #end with
-        except OSError as e:
-            print(e)
-            logging.exception(sys.exc_info())#エラーをlog.txtに書き込む
-            return False, kind, version
-        except:
-            logging.exception(sys.exc_info())#エラーをlog.txtに書き込む
-            return False, kind, version
-        #end try
-        
-        #=============================================================
-        startpage = 1
-        endpage = self.PageMax
-        
         # PDFMinerのツールの準備
         resourceManager = PDFResourceManager()
-        # PDFから単語を取得するためのデバイス
-        device = PDFPageAggregator(resourceManager, laparams=LAParams())
         # PDFから１文字ずつを取得するためのデバイス
         device2 = PDFPageAggregator(resourceManager)
 
         pageResultData = []
         pageNo = []
 
+        # 表紙（１ページ目）だけを読み込み、ページ数はページツリーの/Countから取得する
+        # （全ページの用紙サイズは読み取らない）
         try:
             with open(pdf_file, 'rb') as fp:
-                interpreter = PDFPageInterpreter(resourceManager, device)
+                parser = PDFParser(fp)
+                document = PDFDocument(parser)
+                self.PageMax = resolve1(resolve1(document.catalog["Pages"])["Count"])     # PDFのページ数
                 interpreter2 = PDFPageInterpreter(resourceManager, device2)
-                pageI = 0
-                
-                for page in PDFPage.get_pages(fp):
-                    pageI += 1
 
-                    ResultData = []
-                    print("page={}:".format(pageI), end="")
-                    if pageI == 1 :
-                        # flag1 = True
-                        pageFlag = True
-                        kind, version = self.CoverCheck(page, interpreter2, device2)
-                        print()
-                        print("プログラムの名称：{}".format(kind))
-                        print("プログラムのバージョン：{}".format(version))
-
-                        with open("./kind.txt", 'w', encoding="utf-8") as fp2:
-                            print(kind, file=fp2)
-                            print(version, file=fp2)
-                            fp2.close()
-                        #end with
-                        # break
-                    if pageFlag : 
-                        pageNo.append(pageI)
-                        pageResultData.append(ResultData)
-                        break
-                    #end if
-                #next
+                page = next(PDFPage.create_pages(document))
+
+                pageI = 1
+                ResultData = []
+                print("page={}:".format(pageI), end="")
+                kind, version = self.CoverCheck(page, interpreter2, device2)
+                print()
+                print("プログラムの名称：{}".format(kind))
+                print("プログラムのバージョン：{}".format(version))
+                # 種類とバージョンは戻り値で返す（複数の計算書を同時に処理するので、共有のファイルには書かない）
+
+                pageNo.append(pageI)
+                pageResultData.append(ResultData)
 
                 fp.close()
                 folderName = ""
@@ -1520,7 +2208,6 @@ class CheckTool():
 
 
         # 使用したデバイスをクローズ
-        device.close()
         device2.close()
 
         #============================================================================================
@@ -1530,42 +2217,10 @@ class CheckTool():
         #============================================================================================
         
         try:
-            in_path = pdf_file
-            out_path = pdf_out_file
-
-            # 保存先PDFデータを作成
-            cc = canvas.Canvas(out_path)
-            cc.setLineWidth(1)
-            # PDFを読み込む
-            pdf = PdfReader(in_path, decompress=False)
-
-            i = 0
-            for pageI in range(len(pageNo)):
-                pageN = pageNo[pageI]
-                pageSizeX = float(PaperSize[pageN-1][0])
-                pageSizeY = float(PaperSize[pageN-1][1])
-                page = pdf.pages[pageN - 1]
-                ResultData = pageResultData[pageI]
-                # PDFデータへのページデータの展開
-                pp = pagexobj(page) #ページデータをXobjへの変換
-                rl_obj = makerl(cc, pp) # ReportLabオブジェクトへの変換  
-                cc.doForm(rl_obj) # 展開
-                cc.setFillColor("red")
-                font_name = "ipaexg"
-                cc.setFont(font_name, 20)
-                cc.drawString(20 * mm,  pageSizeY - 40 * mm, "検定比（{}以上）の検索結果".format(limit))
-
-                
-                # ページデータの確定
-                cc.showPage()
-            # next
-
-            # PDFの保存
-            cc.save()
-
-            # time.sleep(1.0)
-            # # すべての処理がエラーなく終了したのでTrueを返す。
-            # return True
+            # 表紙に見出しを印字して結果の最初のページにする
+            if renderer is not None:
+                renderer.Cover(limit)
+            #end if
 
             return kind, version 
         except OSError as e:
@@ -1587,11 +2242,32 @@ class CheckTool():
 
 
 
+    #============================================================================
+    #  候補の索引（CandidateIndex）に保存する１ページ分のデータを作成する関数
+    #       entry   : ページの抽出結果（PageCacheの形式）
+    #============================================================================
+    def IndexEntry(self, entry, mode, B_kind, Candidates):
+        return {"mode": mode, "B_kind": B_kind, "PaperSize": entry["PaperSize"],
+                "Rotate": entry["Rotate"], "Candidates": Candidates}
+    #end def
+
     #============================================================================
     #  表紙以外のページのチェック（外部から読み出す関数名）
     #============================================================================
 
-    def PageCheck(self,filename, outdir, limit ,kind, version, psn, PageNumber,ProcessN):
+    #       renderer : 結果のページを追加するResultRenderer（Noneの場合は作成しない）
+    #                 ResultRecordsの場合はページを作成せずに結果を一覧に追加する
+    #       kind    : 計算プログラムの種類（ProgramKindの場合は種類が必要になった時に設定を待つ）
+    #       StageN  : 各段階で飛ばしたページ数（プロセス毎に４個ずつ）
+    #                     [事前判定で除外, 見出し判定で除外, 数値検索を実施, キャッシュを使用]
+    #       digest  : 元の計算書ファイルの内容のダイジェスト（FileDigest）
+    #                 指定した場合はページの抽出結果をPageCacheに保存し、次回以降はpdfminerを使用しない
+    #       IndexQueue : 指定した場合は各ページの検定比の候補を(ページ番号, 索引のデータ)として送る
+    #                 （CandidateIndexの形式、閾値による選択前のすべての候補）
+    #                 結果のページは作成しない（受け取った側が候補から作成する）
+    #       PageInfo : 親プロセスで作成したPageTableの一覧（Noneの場合はこのプロセスで作成する）
+
+    def PageCheck(self,filename, renderer, limit ,kind, version, psn, Pages,ProcessN, StageN, digest="", IndexQueue=None, PageInfo=None):
         global flag1, fname, dir1, dir2, dir3, dir4, dir5, folderName, paraFileName
         global ErrorFlag, ErrorMessage
         
@@ -1601,106 +2277,180 @@ class CheckTool():
 
         pdf_file = filename
 
-        # PyPDF2のツールを使用してPDFのページ情報を読み取る。
-        # PDFのページ数と各ページの用紙サイズを取得
-        PaperSize = []
-        self.PaperRotate = []                
-        try:
-            with open(pdf_file, "rb") as input:
-                reader = PR2(input)
-                PageMax = len(reader.pages)     # PDFのページ数
-                # PaperSize = []
-                # PaperRotate = []
-                for page in reader.pages:       # 各ページの用紙サイズの読取り
-                    p_size = page.mediabox
-                    rotate = page.get('/Rotate', 0)
-                    self.PaperRotate.append(rotate)
-                    page_xmin = float(page.mediabox.lower_left[0])
-                    page_ymin = float(page.mediabox.lower_left[1])
-                    page_xmax = float(page.mediabox.upper_right[0])
-                    page_ymax = float(page.mediabox.upper_right[1])
-                    PaperSize.append([page_xmax - page_xmin , page_ymax - page_ymin])
-            #end with
-        except OSError as e:
-            print(e)
-            logging.exception(sys.exc_info())#エラーをlog.txtに書き込む
-            return False
-        except:
-            logging.exception(sys.exc_info())#エラーをlog.txtに書き込む
-            return False
-        #end try
+        # 各ページのオブジェクト番号・用紙サイズ・回転角度（親プロセスから渡されない場合はここで読み取る）
+        if PageInfo is None:
+            try:
+                PageInfo = PageTable(pdf_file)
+            except OSError as e:
+                print(e)
+                logging.exception(sys.exc_info())#エラーをlog.txtに書き込む
+                return False
+            except:
+                logging.exception(sys.exc_info())#エラーをlog.txtに書き込む
+                return False
+            #end try
+        #end if
+        PaperSize = [info[1] for info in PageInfo]
+        self.PaperRotate = [info[2] for info in PageInfo]
         
         #=============================================================
         # startpage = 1
         # endpage = PageMax
         
+        # 日本語のCMapの読込み（親プロセスで読み込んだ場合は何もしない）
+        LoadCMaps()
+
         # PDFMinerのツールの準備
         resourceManager = PDFResourceManager()
-        # PDFから単語を取得するためのデバイス
-        device = PDFPageAggregator(resourceManager, laparams=LAParams())
-        # PDFから１文字ずつを取得するためのデバイス
-        device2 = PDFPageAggregator(resourceManager)
+        # PDFから１文字ずつを取得するためのデバイス（単語の取得はPageExtractで同じ結果をレイアウト解析する）
+        device = PDFPageAggregator(resourceManager)
+        laparams = LAParams()
+        # 事前判定のための文字列だけを取得するデバイス
+        device0 = KeywordDevice(resourceManager)
+        # ページ毎のキーワード索引
+        self.KeywordIndex = {}
+        # ページ毎の抽出結果のキャッシュ
+        if digest != "":
+            cache = PageCache(digest, EXTRACT_VERSION)
+        else:
+            cache = None
+        #end if
 
         pageResultData = []
         pageNo = []
         try:
-            with open(pdf_file, 'rb') as fp:
+            with open(pdf_file, 'rb') as fp, mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as mm:
                 interpreter = PDFPageInterpreter(resourceManager, device)
-                interpreter2 = PDFPageInterpreter(resourceManager, device2)
+                interpreter0 = PDFPageInterpreter(resourceManager, device0)
 
-                PageData = []
-                for page in PDFPage.get_pages(fp):
-                    PageData.append(page)
-                #next
+                # ページは処理する時にだけ読み込む（ファイルは読み取り専用のメモリーマップで他のプロセスと共有）
+                parser = PDFParser(mm)
+                document = PDFDocument(parser)
                 pageI = 0
-                # pageI2 = 0
-                # PageN2 = len(PageNumber)
-                flagPage = True
-
-                while flagPage:
-                    for i,p in enumerate(PageNumber):
-                        flagPage = False
-                        if p > 0:
-                            pageI = i + 1
-                            PageNumber[i] = 0
-                            flagPage = True
-                            page = PageData[i]
-                            ProcessN[psn] += 1
+                claimed = []
+
+                while True:
+                    # 処理するページをPageDispatcherから受け取る（すべて配り終わったら終了）
+                    if len(claimed) == 0:
+                        claimed = Pages.Next()
+                        if len(claimed) == 0:
                             break
                         #end if
-                    #next
-                    if flagPage == False:
-                        break
                     #end if
+                    pageI = claimed.pop(0)
+                    page = GetPage(document, PageInfo[pageI-1][0])
+                    # 回転したページも回転前の座標で文字を読み取る（結果のページで回転を戻す）
+                    page.rotate = 0
+                    ProcessN[psn] += 1
 
                     # outfile = outdir + "/" + "outfile{:0=4}.pdf".format(pageI)
                     ResultData = []
                     print("ps={}:page={}:".format(psn,pageI), end="")
 
+                    # キャッシュにこのページの抽出結果がある場合はpdfminerを使用しない
+                    entry = cache.Get(pageI) if cache is not None else None
+                    newEntry = entry is None
+                    if not newEntry:
+                        StageN[psn*4+3] += 1
+                        KeyWords = entry["KeyWords"]
+                    else:
+                        # 事前判定：文字表示の演算子だけを読み、見出しのキーワードがないページは飛ばす
+                        KeyWords = self.PagePreCheck(page, interpreter0, device0)
+                        x0, y0, x1, y1 = page.mediabox
+                        entry = {"KeyWords": KeyWords, "Mode": {},
+                                 "PaperSize": [x1 - x0, y1 - y0], "Rotate": self.PaperRotate[pageI-1]}
+                    #end if
+                    self.KeywordIndex[pageI] = KeyWords
+                    if not any(word in KeyWords for word in PRE_WORDS):
+                        print("No Data")
+                        StageN[psn*4] += 1
+                        if cache is not None and newEntry:
+                            cache.Put(pageI, entry)
+                        #end if
+                        if IndexQueue is not None:
+                            IndexQueue.put((pageI, self.IndexEntry(entry, "", "", [])))
+                        #end if
+                        continue
+                    #end if
+
+                    if "PageChars" in entry:
+                        PageTexts = entry["PageTexts"]
+                        PageChars = entry["PageChars"]
+                    else:
+                        # ページの解釈は１回だけ行い、見出しの判定と数値の検出で同じ結果を使用する
+                        PageTexts, PageChars = self.PageExtract(page, interpreter, device, laparams)
+                        entry["PageTexts"] = PageTexts
+                        entry["PageChars"] = PageChars
+                        newEntry = True
+                    #end if
+
+                    # 計算プログラムの種類が後から届く場合は、最初に必要になったページで待つ
+                    if isinstance(kind, ProgramKind):
+                        kind, version = kind.Get()
+                    #end if
+                    if kind in entry["Mode"]:
+                        mode, B_kind = entry["Mode"][kind]
+                    else:
+                        if kind == "SuperBuild/SS7":
+                            mode, B_kind = self.SS7Mode(PageTexts)
+                        else:
+                            mode = self.OtherSheetMode(PageTexts)
+                            B_kind = ""
+                        #end if
+                        entry["Mode"][kind] = (mode, B_kind)
+                        newEntry = True
+                    #end if
+                    if cache is not None and newEntry:
+                        cache.Put(pageI, entry)
+                    #end if
+
+                    if mode == "" :     # 該当しない場合はこのページの処理は飛ばす。
+                        print("No Data")
+                        StageN[psn*4+1] += 1
+                        if IndexQueue is not None:
+                            IndexQueue.put((pageI, self.IndexEntry(entry, "", "", [])))
+                        #end if
+                        continue
+                    else:
+                        print(mode)
+                        StageN[psn*4+2] += 1
+                    #end if
+
                     if kind == "SuperBuild/SS7":
                         #============================================================
                         # 構造計算書がSS7の場合の処理
                         #============================================================
 
-                        pageFlag, ResultData = self.SS7(page, limit, interpreter, device, interpreter2, device2)
+                        pageFlag, Candidates = self.SS7(mode, B_kind, PageChars)
 
                     # 他の種類の構造計算書を処理する場合はここに追加
                     # elif kind == "****":
-                    #     pageFlag, ResultData = self.***(page, limit, interpreter, device, interpreter2, device2)
+                    #     pageFlag, Candidates = self.***(mode, PageChars)
 
                     else:
                         #============================================================
                         # 構造計算書の種類が不明の場合はフォーマットを無視して数値のみを検出
                         #============================================================
 
-                        pageFlag, ResultData = self.OtherSheet(page, limit, interpreter, device, interpreter2, device2)
+                        pageFlag, Candidates = self.OtherSheet(mode, PageChars)
 
                         # return False
                     #end if
 
+                    # 閾値に関係なくすべての候補を索引に送り、閾値以上の数値だけを結果にする
+                    if IndexQueue is not None:
+                        IndexQueue.put((pageI, self.IndexEntry(entry, mode, B_kind, Candidates)))
+                    #end if
+                    ResultData = SelectResults(Candidates, limit)
+                    pageFlag = len(ResultData) > 0
+
                     if pageFlag : 
-                        pageNo.append(pageI)
-                        pageResultData.append(ResultData)
+                        if isinstance(renderer, ResultRecords):
+                            renderer.Add(pageI, mode, B_kind, ResultData)
+                        else:
+                            pageNo.append(pageI)
+                            pageResultData.append(ResultData)
+                        #end if
                     #end if
                 #next
 
@@ -1721,90 +2471,37 @@ class CheckTool():
 
         # 使用したデバイスをクローズ
         device.close()
-        device2.close()
-
-        #============================================================================================
-        #
-        #   数値検出結果を用いて各ページに四角形を描画する
-        #
-        #============================================================================================
-        
-        try:
-            if len(pageNo)>0:
-                in_path = pdf_file
-                # out_path = pdf_out_file
 
-                # # 保存先PDFデータを作成
-                # cc = canvas.Canvas(out_path)
-                # cc.setLineWidth(1)
-                # PDFを読み込む
-                pdf = PdfReader(in_path, decompress=False)
+        # 候補をIndexQueueで送った場合は、受け取った側（multicheck）が届いたページから順に結果を作成する
+        if IndexQueue is not None:
+            return True
+        #end if
 
-                i = 0
-                for pageI in range(len(pageNo)):
-                    pageN = pageNo[pageI]
+        # 数値検出結果を用いて各ページに四角形を描画する
+        return self.MakeResultPages(renderer, pageNo, pageResultData, PaperSize)
 
-                    out_path = outdir + "/" + "outfile{:0=4}.pdf".format(pageN)
+    #end def    
+    #*********************************************************************************
 
-                    # 保存先PDFデータを作成
-                    cc = canvas.Canvas(out_path)
-                    cc.setLineWidth(1)
-                    pageR = self.PaperRotate[pageN-1]
-                    if pageR ==0:
-                        pageSizeX = float(PaperSize[pageN-1][0])
-                        pageSizeY = float(PaperSize[pageN-1][1])
-                    else:
-                        pageSizeX = float(PaperSize[pageN-1][1])
-                        pageSizeY = float(PaperSize[pageN-1][0])
-
-                    page = pdf.pages[pageN - 1]
-                    ResultData = pageResultData[pageI]
-                    # PDFデータへのページデータの展開
-                    pp = pagexobj(page) #ページデータをXobjへの変換
-                    rl_obj = makerl(cc, pp) # ReportLabオブジェクトへの変換  
-                    cc.doForm(rl_obj) # 展開
-
-                    pn = len(ResultData)
-
-                    # ページの左肩に検出個数を印字
-                    cc.setFillColor("red")
-                    font_name = "ipaexg"
-                    cc.setFont(font_name, 12)
-                    t2 = "検索個数 = {}".format(pn)
-                    cc.drawString(20 * mm,  pageSizeY - 15 * mm, t2)
-
-                    # 該当する座標に四角形を描画
-                    for R1 in ResultData:
-                        a = R1[0]
-                        origin = R1[1]
-                        flag = R1[2]
-                        x0 = origin[0]
-                        y0 = origin[1]
-                        width = origin[2]
-                        height = origin[3]
-
-                        # 長方形の描画
-                        cc.setFillColor("white", 0.5)
-                        cc.setStrokeColorRGB(1.0, 0, 0)
-                        cc.rect(x0, y0, width, height, fill=0)
-
-                        if flag:    # "壁の検定表"の場合は、四角形の右肩に数値を印字
-                            cc.setFillColor("red")
-                            font_name = "ipaexg"
-                            cc.setFont(font_name, 7)
-                            t2 = " {:.2f}".format(a)
-                            cc.drawString(origin[0]+origin[2], origin[1]+origin[3], t2)
-                        #end if
-                    #next
+    #============================================================================================
+    #
+    #   数値検出結果を用いて各ページに四角形を描画する関数
+    #       renderer        : 結果のページを追加するResultRenderer（Noneの場合は作成しない）
+    #       pageNo          : 結果を描画するページ番号のリスト
+    #       pageResultData  : 各ページの閾値以上の数値（SelectResultsの結果）
+    #       PaperSize       : 各ページの回転前の用紙サイズ（ページ番号-1の順）
+    #
+    #   回転したページは元のページの/Rotateのまま結果ファイルに追加する
+    #============================================================================================
 
-                    # ページデータの確定
-                    cc.showPage()
-                    cc.save()
+    def MakeResultPages(self, renderer, pageNo, pageResultData, PaperSize):
+        
+        try:
+            if renderer is not None:
+                for pageI in range(len(pageNo)):
+                    pageN = pageNo[pageI]
+                    renderer.Render(pageN, pageResultData[pageI], PaperSize[pageN-1])
                 # next
-
-                # PDFの保存
-                # cc.save()
-
             #end if
 
         except OSError as e:
@@ -1838,81 +2535,33 @@ class CheckTool():
     
     def doCheck(self, filenname, outfilename, limit, startpage, endpage):
 
-        # プログラムのあるディレクトリー
-        fld = os.getcwd()
-
-        # 分割ファイルを一時保存するディレクトリー（無ければ作成）
-        dir1 = fld + "/pdf"
-        if not os.path.isdir(dir1):
-            os.mkdir(dir1)
-        #end if
-
-        # 結果ファイルを一時保存するディレクトリー（無ければ作成）
-        dir2 = fld + "/out"
-        if not os.path.isdir(dir2):
-            os.mkdir(dir2)
-        #end if
+        # 結果のページはページ毎のファイルを作成せずに１つの結果ファイルに追加する
+        renderer = ResultRenderer(filename)
 
 #       表示の読取り        
-        kind, verison = self.TopPageCheckTool(filename,dir2,limit)
+        kind, verison = self.TopPageCheckTool(filename,renderer,limit)
 
         ProcessN = [0]
-        PageNumber = list (range(1, self.PageMax + 1))
-
-        for i, p in enumerate(PageNumber):
-            if p < startpage or p > endpage:
-                PageNumber[i] = 0
-            #end if
-        #next
+        StageN = [0, 0, 0, 0]
+        Pages = PageDispatcher([p for p in range(1, self.PageMax + 1) if p >= startpage and p <= endpage])
 
-        self.PageCheck(filename,dir2,limit,kind,version,0,PageNumber,ProcessN)
+        # 計算書の内容のダイジェスト（ページの抽出結果のキャッシュのキー）
+        digest = FileDigest(filename)
 
-        # 結果フォルダーにあるファイル名の読取り
-        files = glob.glob(os.path.join(dir2, "*.pdf"))
-        # ファイルのソート
-        files.sort()
+        self.PageCheck(filename,renderer,limit,kind,version,0,Pages,ProcessN,StageN,digest)
+        print("事前判定で除外={} : 見出し判定で除外={} : 数値検索={} : キャッシュ使用={}".format(StageN[0],StageN[1],StageN[2],StageN[3]))
 
-        # 結果ファイルを順番に結合し、１つの結果ファイルを保存
-        merger = pypdf.PdfMerger()
-        file1 = dir1 + "/f1.pdf"
-        for i,file in enumerate(files):
-            if i == 0:
-                merger.append(file)
-            else:
-                n = int(file.replace(".pdf","")[-4:])
-                if self.PaperRotate[n-1] != 0:
-                    f1 = pypdf.PdfReader(open(file , 'rb'))
-                    f2 = pypdf.PdfWriter()
-                    for page in f1.pages:
-                        rotate = self.PaperRotatea[n-1]
-                        if rotate != 0:
-                            page.rotate(rotate)
-                        f2.add_page(page)
-                    with open(file1, 'wb') as f:
-                        f2.write(f)
-                    merger.append(file1)
-                else:
-                    merger.append(file)
-                #end if
-            #end if
-            if os.path.exists(file1):
-                os.remove(file1)
-            #
-        #next
-        merger.write(outfilename)
-        merger.close()
+        # キャッシュの容量を超えた古いページの抽出結果を削除
+        PageCache(digest, EXTRACT_VERSION).Trim()
 
-        # 結果ファイルを消去
-        for file in files:
-            os.remove(file)
+        # 結果ファイルを保存
+        renderer.Write(outfilename)
+        renderer.Close()
 
         # # 結果ファイルを消去
         # for file in self.fnames:
         #     os.remove(file)
 
-        if os.path.exists(file1):
-            os.remove(file1)
-
         return True
     #end def
     #*********************************************************************************
@@ -0,0 +1,231 @@
+
+
+#==========================================================================================
+#   構造計算書の数値検査プログラムのページ抽出結果のキャッシュ
+#
+#           一般財団法人日本建築総合試験所
+#
+#==========================================================================================
+"""
+同じ計算書を閾値や開始・終了ページを変えて再実行する場合に、pdfminerによるページの解釈を省略するため、
+ページ毎の抽出結果（行の文字列、文字の座標、ページの判定、用紙サイズ・回転）をディスクに保存する。
+また、閾値に関係なく検出した検定比の候補を計算書毎の索引（CandidateIndex）として保存する。
+
+    キー      : 抽出処理のバージョン、計算書ファイルの内容のダイジェスト、ページ番号
+    保存場所  : プログラムのあるディレクトリーの「cache」フォルダー（１ページ１ファイル）
+    容量制限  : ページの抽出結果と索引の合計サイズがmaxsizeを超えた場合は最後に使用した日時が古いものから削除
+
+"""
+#
+import os
+import sys
+import hashlib
+import pickle
+import tempfile
+import logging
+
+CACHE_DIR = "./cache"                   # キャッシュを保存するフォルダー
+CACHE_SIZE = 512 * 1024 * 1024          # キャッシュの合計サイズの上限（バイト）
+
+#============================================================================
+#  ファイルの内容のダイジェスト（SHA-1）を計算する関数
+#============================================================================
+def FileDigest(filename, blocksize=1 << 20):
+    h = hashlib.sha1()
+    with open(filename, "rb") as fp:
+        while True:
+            data = fp.read(blocksize)
+            if not data:
+                break
+            #end if
+            h.update(data)
+        #end while
+    #end with
+    return h.hexdigest()
+#end def
+
+#============================================================================
+#  ページ毎の抽出結果のキャッシュのクラス
+#       digest      : 計算書ファイルの内容のダイジェスト（FileDigest）
+#       version     : 抽出処理のバージョン（抽出方法を変更した場合は古い結果を使用しない）
+#       cachedir    : キャッシュを保存するフォルダー
+#       maxsize     : キャッシュの合計サイズの上限（バイト）
+#
+#   保存するデータ（辞書）
+#       KeyWords    : 事前判定で見つかった見出しのキーワード
+#       PageTexts   : レイアウト解析した行の文字列（事前判定で除外したページは無し）
+#       PageChars   : 文字データの構造化配列（事前判定で除外したページは無し）
+#       Mode        : 計算プログラムの種類毎のページの判定 {kind: (mode, B_kind)}
+#       PaperSize   : 用紙サイズ [幅, 高さ]
+#       Rotate      : 用紙の回転角度
+#============================================================================
+class PageCache:
+
+    def __init__(self, digest, version, cachedir=CACHE_DIR, maxsize=CACHE_SIZE):
+        self.digest = digest
+        self.version = version
+        self.cachedir = cachedir
+        self.maxsize = maxsize
+        if not os.path.isdir(self.cachedir):
+            os.makedirs(self.cachedir, exist_ok=True)
+        #end if
+    #end def
+
+    #============================================================================
+    #  ページのキャッシュファイルのパス
+    #============================================================================
+    def _Path(self, pageI):
+        key = "{}:{}:{}".format(self.version, self.digest, pageI)
+        return os.path.join(self.cachedir, hashlib.sha1(key.encode("utf-8")).hexdigest() + ".pkl")
+    #end def
+
+    #============================================================================
+    #  ページの抽出結果を読み込む関数（無い場合や読めない場合はNone）
+    #============================================================================
+    def Get(self, pageI):
+        path = self._Path(pageI)
+        try:
+            with open(path, "rb") as fp:
+                entry = pickle.load(fp)
+            #end with
+        except FileNotFoundError:
+            return None
+        except Exception:
+            logging.exception(sys.exc_info())#エラーをlog.txtに書き込む
+            return None
+        #end try
+        try:
+            os.utime(path)      # 最後に使用した日時を更新
+        except OSError:
+            pass
+        #end try
+        return entry
+    #end def
+
+    #============================================================================
+    #  ページの抽出結果を保存する関数
+    #       他のプロセスが読み込み中でも壊れないように一時ファイルに書いてから置き換える
+    #       （同じ計算書を複数のスレッドで同時に処理する場合があるので、一時ファイルはmkstempで作成）
+    #============================================================================
+    def Put(self, pageI, entry):
+        path = self._Path(pageI)
+        tmp = None
+        try:
+            fd, tmp = tempfile.mkstemp(suffix=".tmp", dir=self.cachedir)
+            with os.fdopen(fd, "wb") as fp:
+                pickle.dump(entry, fp, protocol=pickle.HIGHEST_PROTOCOL)
+            #end with
+            os.replace(tmp, path)
+        except Exception:
+            logging.exception(sys.exc_info())#エラーをlog.txtに書き込む
+            if tmp is not None and os.path.exists(tmp):
+                os.remove(tmp)
+            #end if
+        #end try
+    #end def
+
+    #============================================================================
+    #  キャッシュの合計サイズがmaxsizeを超えた場合に古いものから削除する関数
+    #       ページの抽出結果（.pkl）と候補の索引（.idx）を合わせて、最後に使用した日時が古いものから削除する
+    #       （並列処理の終了後に親プロセスで１回だけ実行する）
+    #============================================================================
+    def Trim(self):
+        files = []
+        total = 0
+        for entry in os.scandir(self.cachedir):
+            if entry.is_file() and entry.name.endswith((".pkl", ".idx")):
+                st = entry.stat()
+                files.append((st.st_mtime, st.st_size, entry.path))
+                total += st.st_size
+            #end if
+        #next
+        if total <= self.maxsize:
+            return 0
+        #end if
+        files.sort()
+        n = 0
+        for mtime, size, path in files:
+            if total <= self.maxsize:
+                break
+            #end if
+            try:
+                os.remove(path)
+                total -= size
+                n += 1
+            except OSError:
+                pass
+            #end try
+        #next
+        return n
+    #end def
+#end class
+
+#============================================================================
+#  計算書毎の検定比の候補の索引のクラス
+#       閾値に関係なく検出したすべての候補をページ毎に保存し、閾値を変えて再実行する場合は
+#       ページの抽出と数値の検出を行わずに、索引から閾値以上の数値を選択して結果を作成する
+#
+#       digest      : 計算書ファイルの内容のダイジェスト（FileDigest）
+#       version     : 抽出処理のバージョン
+#       kind        : 計算プログラムの種類（Saveで保存する。種類が異なる索引は呼出し側で使用しない）
+#
+#   保存するデータ（ページ番号をキーとする辞書）
+#       mode, B_kind : ページの種類と構造種別（対象外のページは""）
+#       PaperSize   : 用紙サイズ [幅, 高さ]
+#       Rotate      : 用紙の回転角度
+#       Candidates  : 検定比の候補（SS7・OtherSheetのResultDataと同じ形式）
+#============================================================================
+class CandidateIndex:
+
+    def __init__(self, digest, version, kind, cachedir=CACHE_DIR):
+        self.kind = kind
+        if not os.path.isdir(cachedir):
+            os.makedirs(cachedir, exist_ok=True)
+        #end if
+        key = "{}:{}:index".format(version, digest)
+        self.path = os.path.join(cachedir, hashlib.sha1(key.encode("utf-8")).hexdigest() + ".idx")
+    #end def
+
+    #============================================================================
+    #  索引を読み込む関数（種類は確認せずに返し、呼出し側で確認する）
+    #       戻り値  : 索引の種類とページの辞書（無い場合や読めない場合は(None, {})）
+    #       （表紙の読取りと並行して、索引にないページの処理を先に始めるため）
+    #============================================================================
+    def Peek(self):
+        try:
+            with open(self.path, "rb") as fp:
+                data = pickle.load(fp)
+            #end with
+        except FileNotFoundError:
+            return None, {}
+        except Exception:
+            logging.exception(sys.exc_info())#エラーをlog.txtに書き込む
+            return None, {}
+        #end try
+        try:
+            os.utime(self.path)     # 最後に使用した日時を更新（PageCache.Trimで古いものから削除するため）
+        except OSError:
+            pass
+        #end try
+        return data.get("kind"), data["pages"]
+    #end def
+
+    #============================================================================
+    #  索引を保存する関数
+    #============================================================================
+    def Save(self, pages):
+        tmp = None
+        try:
+            fd, tmp = tempfile.mkstemp(suffix=".tmp", dir=os.path.dirname(self.path))
+            with os.fdopen(fd, "wb") as fp:
+                pickle.dump({"kind": self.kind, "pages": pages}, fp, protocol=pickle.HIGHEST_PROTOCOL)
+            #end with
+            os.replace(tmp, self.path)
+        except Exception:
+            logging.exception(sys.exc_info())#エラーをlog.txtに書き込む
+            if tmp is not None and os.path.exists(tmp):
+                os.remove(tmp)
+            #end if
+        #end try
+    #end def
+#end class
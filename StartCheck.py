@@ -25,9 +25,10 @@ import shutil
 from tkinter import filedialog
 from tkinter import messagebox
 # from CheckTool import CheckTool
-from multicheck import multicheck
+from multicheck import multicheck, WorkerPool, WorkerSlots, PoolSize
 import logging
 import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
 # グリーバル変数の定義
@@ -48,7 +49,14 @@ systemLogFile = "system.log"
 # kind = ""
 # version = ""
 
-BUNKATU = 4         # 並列の分割数（4 〜 10）
+BUNKATU = 0         # 並列の分割数（0の場合はCPUの数・空きメモリー・ページ数から自動で決める。para.jsonの「並列数」で変更可）
+BACKEND = "process" # ページの処理の方法（"process"：待機中のワーカーのプロセス、"thread"：スレッド、"serial"：並列処理なし）
+OUTPUT = "pages"    # 結果ファイルの内容（"pages"：検出したページだけ、"book"：計算書全体。para.jsonの「計算書全体を出力」で変更可）
+                    # （"json", "csv", "sqlite"：PDFを作成せずに検出結果の一覧だけを保存）
+LogLock = threading.Lock()  # ログファイルへの書込みの排他制御（複数の計算書を同時に処理するため）
+Running = {}        # 処理中の計算書（表示ウインドウに表示する）{ファイル名: (フォルダー名, multicheck)}
+ErrorFolders = []   # エラーフォルダーに移動するデータフォルダー名のリスト（RunCheckで追加し、mainで移動）
+RunLock = threading.Lock()  # Runningの排他制御
 
 #============================================================================
 #  作業フォルダーの設定データ（init.json）読込
@@ -100,7 +108,7 @@ def CreateFolfer():
                     fp.close()
                 #end with
 
-                para = {"数値の閾値": 0.95, "開始ページ": 2, "終了ページ": 0}
+                para = {"数値の閾値": 0.95, "開始ページ": 2, "終了ページ": 0, "並列数": 0, "計算書全体を出力": False}
                 with open(dir4+'/'+paraFileName, 'w', encoding="utf-8") as fp:
                     json.dump(para, fp, indent=4, ensure_ascii=False)
                     fp.close()
@@ -148,7 +156,7 @@ def CreateFolfer():
             json_open.close()
 
             if not os.path.isfile(dir4+'/'+paraFileName):
-                para = {"数値の閾値": 0.95, "開始ページ": 2, "終了ページ": 0}
+                para = {"数値の閾値": 0.95, "開始ページ": 2, "終了ページ": 0, "並列数": 0, "計算書全体を出力": False}
                 with open(dir4+'/'+paraFileName, 'w') as fp:
                     json.dump(para, fp, indent=4, ensure_ascii=False)
                     fp.close()
@@ -196,6 +204,10 @@ def RunCheck():
     global flag1, fname, dir1, dir2, dir3, dir4, dir5, folderName, paraFileName
     global ErrorFlag, ErrorMessage, runLogFile, systemLogFile
     
+    pool = None     # すべての計算書で共有するワーカーのプロセス
+    slots = None    # すべての計算書で共有するワーカーの枠
+    executor = None # 計算書を同時に処理するスレッド
+    current = None  # 処理中のデータフォルダー名（予期しないエラーの場合にエラーフォルダーに移動する）
     try:
 
         # CT = CheckTool()    # チェックツールのインスタンスを作成
@@ -212,11 +224,24 @@ def RunCheck():
         # edpage = 250
         if len(folders) > 0:
             AddLog("処理の開始")
+            # ワーカーのプロセスを１回だけ起動し、すべてのフォルダー・計算書の処理で使用する
+            # （CPUが１個の場合とBACKENDが"process"以外の場合はWorkerPoolを使用しない）
+            budget = PoolSize(BUNKATU) if BACKEND != "serial" else 1
+            slots = WorkerSlots(budget)
+            if budget > 1 and BACKEND == "process":
+                pool = WorkerPool(slots=slots)
+            #end if
+            # 複数の計算書を同時に処理する（同時に処理する計算書の数もページの並列処理も
+            # ワーカーの枠（slots）の中で行う。WorkerPoolを使用できない計算書や「並列数」を
+            # 指定したフォルダーの計算書も、この枠を超えてワーカーを起動しない）
+            executor = ThreadPoolExecutor(max_workers=budget)
+
+            jobs = []       # フォルダー毎の[フォルダー名, パス, 閾値, [(ファイル名, 処理結果)]]
             for folder in folders:      # フォルダー毎に処理を実行
                 if not "検出結果" in folder:  # フォルダー名に"検出結果"が含まれる場合は結果フォルダなので無視する。
                     folderName = folder     # 表示ウィンドウに表示させるフォルダー名
+                    current = folder
                     path1 = inputRCPath + "/" + folder
-                    path2 = outputRCPath
 
                     # データフォルダー内にあるPDFファイルをすべて検出
                     files = glob.glob(os.path.join(path1, "*.pdf"))
@@ -232,103 +257,194 @@ def RunCheck():
                             limit1 = json_load['数値の閾値']
                             stpage = json_load['開始ページ']
                             edpage = json_load['終了ページ']
+                            bunkatu = json_load.get('並列数', BUNKATU)     # 古いパラメータファイルには無い
+                            output = "book" if json_load.get('計算書全体を出力', False) else OUTPUT
                             json_open.close()
                         else:                           # パラメータファイルがない場合はデフォルト値を設定
                             limit1 = 0.95
                             stpage = 2
                             edpage = 0   # 全ページ
+                            bunkatu = BUNKATU   # 自動
+                            output = OUTPUT
                         #end if
 
+                        futures = []
                         for file in files:
                             
                             if not "検出結果" in file:  # ファイル名に"検出結果"が含まれる場合は結果ファイルなので無視する。
-
-                                fname = os.path.basename(file)  # 表示ウインドウに表示するファイル名を設定
-                                MCT = multicheck(file,limit=limit1,stpage=stpage,edpage=edpage,bunkatu=BUNKATU)
-                                message = folderName + "/" + fname + ":数値の検出開始"
-                                AddLog(message)
-                                if MCT.doCheck():
-                                # if CT.CheckTool(file, limit=limit1, stpage=stpage, edpage=edpage):
-                                    outfolder = folder + '[検出結果(閾値={:.2f}'.format(limit1)+')]'
-                                    # 検査がエラーなく終了した場合の処理
-                                    # 処理後フォルダーに同じ名称のデータフォルダーがある場合は、上書きせずに、
-                                    # データフォルダー名に'(n)'を追加して移動
-                                    message = folderName + "/" + fname + ":数値の検出処理OK"
-                                    AddLog(message)
-                                    # フォルダー名の最後の3文字が (n) の場合は何番目であるか
-                                    t1 = outfolder[len(outfolder)-3:]
-                                    if t1[0] == "(" and t1[len(t1)-1] == ")" :
-                                        num = int(t1.replace("(","").replace(")",""))
-                                        numflag = True
-                                    else:
-                                        num = 0
-                                        numflag = False
-                                    #end if
-                                    
-                                    if not os.path.isdir(path2 + "/" + outfolder):
-                                        new_path = shutil.move(path1, path2 + "/" + outfolder)
-                                    else:
-                                        while True:
-                                            # 同じ名前にならないよう繰り返す
-                                            num += 1
-                                            if numflag :
-                                                newFolder = path2 + "/" + outfolder[:len(outfolder)-3] + "({})".format(num)
-                                            else:
-                                                newFolder = path2 + "/" + outfolder + "({})".format(num)
-                                            #end if
-                                            if not os.path.isdir(newFolder):
-                                                new_path = shutil.move(path1, newFolder)
-                                                break
-                                            #end if
-                                        #end while
-                                    #end if
-
-                                    message = folderName + "/" + fname + ":フォルダの移動処理OK"
-                                    AddLog(message)
-                                #end if
+                                futures.append((file, executor.submit(CheckFile, folder, file, limit1, stpage, edpage, bunkatu, pool, output, slots)))
                             #end if
 
                         #next
+                        jobs.append([folder, path1, limit1, futures])
                         folderName = ""            
                     else:
+                        # 表示ウインドウはすべての計算書の処理が終わってから閉じる（flag1は最後に設定する）
                         ErrorMessage += folderName + "にPDFファイルがありません\n"
                         ErrorFlag = True
-                        flag1 = False
+                        ErrorFolders.append(folder)
                     #end if
+                    current = None
                 #end if
             #next
 
+            # フォルダー内のすべての計算書の処理が終わったフォルダーを処理後フォルダーに移動
+            # （計算書の処理は他のフォルダーの計算書と並行して続ける）
+            path2 = outputRCPath
+            # 計算書の処理でエラーが発生した場合は、そのフォルダーだけをエラーフォルダーに移動し、
+            # 他のフォルダーの処理と移動を続ける
+            for folder, path1, limit1, futures in jobs:
+                folderName = folder
+                current = folder
+                done = len(futures) > 0
+                failed = False
+                for file, future in futures:
+                    name = os.path.basename(file)
+                    try:
+                        name, ok = future.result()
+                    except:
+                        logging.exception(sys.exc_info())#エラーをlog.txtに書き込む
+                        AddLog(folder + "/" + name + ":数値の検出処理でエラーが発生しました")
+                        ErrorMessage += folder + "/" + name + "の処理でエラーが発生しました\n"
+                        ErrorFlag = True
+                        ok = False
+                        failed = True
+                    #end try
+                    if not ok:
+                        done = False
+                    #end if
+                #next
+                if failed:
+                    ErrorFolders.append(folder)
+                elif done:
+                    outfolder = folder + '[検出結果(閾値={:.2f}'.format(limit1)+')]'
+                    # 検査がエラーなく終了した場合の処理
+                    # 処理後フォルダーに同じ名称のデータフォルダーがある場合は、上書きせずに、
+                    # データフォルダー名に'(n)'を追加して移動
+                    # フォルダー名の最後の3文字が (n) の場合は何番目であるか
+                    t1 = outfolder[len(outfolder)-3:]
+                    if t1[0] == "(" and t1[len(t1)-1] == ")" :
+                        num = int(t1.replace("(","").replace(")",""))
+                        numflag = True
+                    else:
+                        num = 0
+                        numflag = False
+                    #end if
+                    
+                    if not os.path.isdir(path2 + "/" + outfolder):
+                        new_path = shutil.move(path1, path2 + "/" + outfolder)
+                    else:
+                        while True:
+                            # 同じ名前にならないよう繰り返す
+                            num += 1
+                            if numflag :
+                                newFolder = path2 + "/" + outfolder[:len(outfolder)-3] + "({})".format(num)
+                            else:
+                                newFolder = path2 + "/" + outfolder + "({})".format(num)
+                            #end if
+                            if not os.path.isdir(newFolder):
+                                new_path = shutil.move(path1, newFolder)
+                                break
+                            #end if
+                        #end while
+                    #end if
+
+                    message = folderName + "/" + name + ":フォルダの移動処理OK"
+                    AddLog(message)
+                #end if
+                folderName = ""
+                current = None
+            #next
+
             AddLog("処理の終了")    
         #end if
     
         t1 = time.time() - time_sta
         print("time = {} sec".format(t1))
-        flag1 = False
 
     except OSError as e:
         print(e)
         logging.exception(sys.exc_info())#エラーをlog.txtに書き込む
         ErrorMessage += "システムエラー\n"
         ErrorFlag = True
-        flag1 = False
+        if current is not None:
+            ErrorFolders.append(current)
+        #end if
     except json.JSONDecodeError as jde:
         print(sys.exc_info())
         logging.exception(sys.exc_info())#エラーをlog.txtに書き込む　json.decoder.JSONDecodeError
         ErrorMessage += "パラメータファイルの読込エラー\n"
         ErrorFlag = True
-        flag1 = False
+        if current is not None:
+            ErrorFolders.append(current)
+        #end if
         
     except:
         print("")
         logging.exception(sys.exc_info())#エラーをlog.txtに書き込む
         ErrorMessage += "原因不明のエラー\n"
         ErrorFlag = True
-        flag1 = False
+        if current is not None:
+            ErrorFolders.append(current)
+        #end if
+    finally:
+        # エラーの場合はまだ開始していない計算書の処理を取り消し、処理中の計算書の終了を待つ
+        # 表示ウインドウを閉じる（エラーの場合はフォルダーをエラーフォルダーに移動する）のは
+        # 処理中の計算書がすべて終わってから
+        try:
+            if executor is not None:
+                executor.shutdown(wait=True, cancel_futures=True)
+            #end if
+            if pool is not None:
+                pool.Close()
+            #end if
+        finally:
+            flag1 = False
+        #end try
     #end try
     #*********************************************************************************
 
+#============================================================================
+#  １つの計算書の数値の検出を行う関数（RunCheckのスレッドで実行）
+#       folder      : データフォルダー名
+#       file        : 計算書のファイル名
+#       output      : 結果ファイルの内容（"pages"：検出したページだけ、"book"：計算書全体、"json"・"csv"・"sqlite"：一覧）
+#       slots       : すべての計算書で共有するワーカーの枠（WorkerSlots）
+#       戻り値      : 計算書のファイル名、エラーなく終了した場合はTrue
+#                     （複数の計算書を同時に処理するので、ファイル名はグローバル変数ではなく戻り値で返す）
+#
+#   処理中の計算書はRunningに登録し、表示ウインドウは計算書毎のプログラム名とバージョンを表示する
+#============================================================================
+
+def CheckFile(folder, file, limit1, stpage, edpage, bunkatu, pool, output=OUTPUT, slots=None):
+
+    name = os.path.basename(file)
+    MCT = multicheck(file,limit=limit1,stpage=stpage,edpage=edpage,bunkatu=bunkatu,pool=pool,backend=BACKEND,output=output,slots=slots)
+    message = folder + "/" + name + ":数値の検出開始"
+    AddLog(message)
+    with RunLock:
+        Running[file] = (folder, MCT)
+    #end with
+    try:
+        if MCT.doCheck():
+            message = folder + "/" + name + ":数値の検出処理OK"
+            AddLog(message)
+            return name, True
+        #end if
+    finally:
+        with RunLock:
+            del Running[file]
+        #end with
+    #end try
+    return name, False
+#end def
+#*********************************************************************************
+
+
 #============================================================================
 #  ログファイルにメッセージを記録する関数
+#       （複数のスレッドから呼ばれるのでLogLockで排他制御）
+#       （計算書の処理中に呼ばれるので、エラーの場合も表示ウインドウは閉じない。flag1はRunCheckの終了時に設定）
 #============================================================================
 
 def AddLog(Message1):
@@ -339,37 +455,78 @@ def AddLog(Message1):
         now = datetime.now()
         Message = now.strftime('%Y/%m/%d %H:%M:%S')+ ":" +Message1
         try:
-            if os.path.isfile(dir3+'/'+runLogFile):
-                with open(dir3+'/'+runLogFile, 'a', encoding="utf-8") as fp:
-                    print(Message, file=fp)
-                    fp.close()
-                #end with
-            else:
-                with open(dir3+'/'+runLogFile, 'w', encoding="utf-8") as fp:
-                    print(Message, file=fp)
-                    fp.close()
-                #end with
-            #end if
+            with LogLock:
+                if os.path.isfile(dir3+'/'+runLogFile):
+                    with open(dir3+'/'+runLogFile, 'a', encoding="utf-8") as fp:
+                        print(Message, file=fp)
+                        fp.close()
+                    #end with
+                else:
+                    with open(dir3+'/'+runLogFile, 'w', encoding="utf-8") as fp:
+                        print(Message, file=fp)
+                        fp.close()
+                    #end with
+                #end if
+            #end with
 
         except OSError as e:
             print(e)
             logging.exception(sys.exc_info())#エラーをlog.txtに書き込む
             ErrorMessage += "システムエラー\n"
             ErrorFlag = True
-            flag1 = False
             
         except:
             print("")
             logging.exception(sys.exc_info())#エラーをlog.txtに書き込む
             ErrorMessage += "原因不明のエラー\n"
             ErrorFlag = True
-            flag1 = False
         #end try
     #end if
 #end def
 #*********************************************************************************
 
 
+#============================================================================
+#  データフォルダーをエラーフォルダーに移動する関数
+#       folder  : 処理前フォルダーにあるデータフォルダー名
+#       エラーフォルダーに同じ名称のフォルダーがある場合は、上書きせずに、フォルダー名に'(n)'を追加して移動
+#============================================================================
+
+def MoveErrorFolder(folder):
+    path1 = dir1 + "/" + folder
+    path2 = dir5
+
+    # フォルダー名の最後の3文字が (n) の場合は何番目であるか
+    t1 = folder[len(folder)-3:]
+    if len(t1) == 3 and t1[0] == "(" and t1[len(t1)-1] == ")" :
+        num = int(t1.replace("(","").replace(")",""))
+        numflag = True
+    else:
+        num = 0
+        numflag = False
+    #end if
+
+    if not os.path.isdir(path2 + "/" + folder):
+        new_path = shutil.move(path1, path2 )
+    else:
+        while True:
+            # 同じ名前にならないよう繰り返す
+            num += 1
+            if numflag :
+                newFolder = path2 + "/" + folder[:len(folder)-3] + "({})".format(num)
+            else:
+                newFolder = path2 + "/" + folder + "({})".format(num)
+            #end if
+            if not os.path.isdir(newFolder):
+                new_path = shutil.move(path1, newFolder)
+                break
+            #end if
+        #end while
+    #end if
+#end def
+#*********************************************************************************
+
+
 #============================================================================
 #  プログラムのメインルーチン（外部から読み出す関数名）
 #============================================================================
@@ -424,32 +581,31 @@ def main():
 
         root.geometry(str(lw)+"x"+str(lh)+"+"+str(int(ww/2-lw/2))+"+"+str(int(wh/2-lh/2)) )
 
-        thread1 = threading.Thread(target=RunCheck)
-        thread1.start()
+        # RunCheckが終了時にflag1をFalseにするので、スレッドを起動する前に設定する
         flag1 = True
         ErrorFlag = False
         ErrorMessage = ""
+        del ErrorFolders[:]
+        thread1 = threading.Thread(target=RunCheck)
+        thread1.start()
         # i = 0
-        kind = ""
-        version = ""
         count = 0
         while flag1:
             root.update()
             count += 1
             
-            if count % 5 == 0 :
-                if os.path.isfile('./kind.txt'):
-                    with open('./kind.txt') as f:
-                        kind = f.readline()
-                        version = f.readline()
-                        f.close()
-                        # root.update()
-                    #end with
-                #end if
+            # 処理中の計算書毎にフォルダー名・ファイル名・プログラム名・バージョンを表示
+            with RunLock:
+                docs = list(Running.items())
+            #end with
+            t1 = ""
+            for file, (folder, MCT) in docs:
+                t1 += '\nフォルダー名：' + folder + '\nファイル名：' + os.path.basename(file)
+                t1 += '\nプログラム名：' + MCT.kind + '　バージョン：' + MCT.version
+            #next
+            if t1 == "":
+                t1 = '\nフォルダー名：' + folderName + '\nファイル名：\nプログラム名：'
             #end if
-
-            t1 = '\nフォルダー名：' + folderName + '\nファイル名：' + fname
-            t1 += '\nプログラム名：' + kind + 'バージョン：' + version
             Static3["text"] = t1
             Static4["text"] = "\n経過時間：{:7.0f}秒".format(time.time() - time_sta)
             
@@ -457,37 +613,15 @@ def main():
         #end while
         
         if ErrorFlag:
-            # 何らかのエラーで処理を中止した場合はフォルダをエラーフォルダに移動しメッセージを表示
+            # エラーが発生したフォルダ（RunCheckがErrorFoldersに追加）をエラーフォルダに移動しメッセージを表示
             AddLog(ErrorMessage)
-            path1 = dir1 + "/" + folderName 
-            path2 = dir5 
-            
-            # フォルダー名の最後の3文字が (n) の場合は何番目であるか
-            t1 = folderName[len(folderName)-3:]
-            if t1[0] == "(" and t1[len(t1)-1] == ")" :
-                num = int(t1.replace("(","").replace(")",""))
-                numflag = True
-            else:
-                num = 0
-                numflag = False
-
-            if not os.path.isdir(path2 + "/" + folderName):
-                new_path = shutil.move(path1, path2 )
-            else:
-                while True:
-                    # 同じ名前にならないよう繰り返す
-                    num += 1
-                    if numflag :
-                        newFolder = path2 + "/" + folderName[:len(folderName)-3] + "({})".format(num)
-                    else:
-                        newFolder = path2 + "/" + folderName + "({})".format(num)
-                    #end if
-                    if not os.path.isdir(newFolder):
-                        new_path = shutil.move(path1, newFolder)
-                        break
-                    #end if
-                #end while
-            #end if
+            for folder in dict.fromkeys(ErrorFolders):
+                try:
+                    MoveErrorFolder(folder)
+                except:
+                    logging.exception(sys.exc_info())#エラーをlog.txtに書き込む
+                #end try
+            #next
 
             # messagebox.showerror('エラー', ErrorMessage)
         #end if
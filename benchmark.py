@@ -0,0 +1,736 @@
+
+
+#==========================================================================================
+#   構造計算書の数値検査プログラムの処理時間の計測（マイクロベンチマーク）
+#
+#           一般財団法人日本建築総合試験所
+#
+#==========================================================================================
+"""
+CheckToolの各処理の速度を、実際の計算書を使用せずに合成したデータで計測するプログラムである。
+
+    python benchmark.py [計算書.pdf]
+
+"""
+#
+import os
+import sys
+import time
+import random
+import tempfile
+import contextlib
+import io
+import numpy as np
+
+from reportlab.pdfgen import canvas
+from reportlab.pdfbase.cidfonts import UnicodeCIDFont
+from reportlab.pdfbase import pdfmetrics
+from pypdf import PdfReader as PR2
+import pypdf
+
+from CheckTool import CheckTool, CharDtype, CharLine, isfloat
+
+#============================================================================
+#  検定比図の行に現れるトークンの例（数値、カッコ・記号付きの数値、部材名など）
+#============================================================================
+TOKENS = ["0.95", "0.98", "(0.97)", "(1.20)", "1.20C", "0.50T", "0.93組", "0.20",
+          "X1", "C10", "G1", "検定比", "-", "Super", "12.5", "(0.99"]
+
+#============================================================================
+#  合成した１行分の文字データ（CharLine）のリストを作成する関数
+#       N       : 行数
+#       seed    : 乱数の種
+#       space   : Trueの場合はトークンの間に空白の文字を入れる（検定表の行）
+#       トークン内の文字間隔は0.5ポイント、トークンの間は5ポイント（空白の判定は3ポイント）
+#============================================================================
+def MakeLines(N=20000, seed=1, space=False):
+    rnd = random.Random(seed)
+    lines = []
+    for i in range(N):
+        chars = []
+        x = 50.0
+        for j in range(rnd.randint(4, 16)):
+            for c in rnd.choice(TOKENS):
+                chars.append((c, x, x + 5.5, 500.0, 510.0, 0))
+                x += 6.0
+            #next
+            if space:
+                chars.append((" ", x - 0.5, x + 4.0, 500.0, 510.0, 0))
+            #end if
+            x += 4.5
+        #next
+        records = np.array(chars, dtype=CharDtype(1))
+        lines.append(CharLine(records, 0, len(records), True))
+    #next
+    return lines
+#end def
+
+#============================================================================
+#  従来の方法（replaceで記号を除去し、isfloatで判定し、findで位置を再検索）
+#============================================================================
+def OldScan(CharLine):
+    R = []
+    t3 = CharLine.text
+    t4 = CharLine.Spaced(3).split()
+    st = 0
+    if len(t4)>0 and t4[0] != "Super":
+        for t5 in t4:
+            t6 = t5.replace("(","").replace(")","").replace(" ","").replace("C","").replace("T","").replace("組","")
+            nn = t3.find(t6,st)
+            ln = len(t6)
+            if isfloat(t6) and len(t6)>=4:
+                R.append((float(t6), nn, nn + ln, "(" in t5, "C" in t5 or "T" in t5 or "組" in t5))
+            #end if
+            st = nn + ln
+        #next
+    #end if
+    return R
+#end def
+
+#============================================================================
+#  新しい方法（CharLine.ScanRatioで１回だけ走査）
+#============================================================================
+def NewScan(CharLine):
+    return list(CharLine.ScanRatio(gap=3, skip="Super"))
+#end def
+
+#============================================================================
+#  従来の方法（梁の検定表：「検定比」を除去し、isfloatで判定し、findで位置を再検索）
+#============================================================================
+def OldScan2(CharLine):
+    R = []
+    t3 = CharLine.text
+    st = 0
+    for t5 in t3.split():
+        t6 = t5.replace("検定比","")
+        nn = t3.find(t6,st)
+        if isfloat(t6) and len(t6)>=4:
+            R.append((float(t6), nn, nn + len(t6), False, False))
+        #end if
+        st = t3.find(t5,st)+ len(t5)
+    #next
+    return R
+#end def
+
+#============================================================================
+#  新しい方法（梁の検定表：CharLine.ScanRatioで「検定比」の付いた数値も検出）
+#============================================================================
+def NewScan2(CharLine):
+    return list(CharLine.ScanRatio(label="検定比", plain=True))
+#end def
+
+#============================================================================
+#  検定比の数値の検出の計測
+#============================================================================
+def BenchScan(N=20000, repeat=5):
+    Compare(MakeLines(N), "検定比図", OldScan, NewScan, repeat)
+    Compare(MakeLines(N, space=True), "梁の検定表", OldScan2, NewScan2, repeat)
+#end def
+
+#============================================================================
+#  従来の方法と新しい方法の結果の比較と処理時間の計測
+#============================================================================
+def Compare(lines, title, OldFunc, NewFunc, repeat=5):
+    N = len(lines)
+    print("[{}]".format(title))
+
+    # 結果の比較（数値とカッコ・記号の判定は一致、位置は従来の方法が別の位置を見つけた場合だけ異なる）
+    same = 0
+    moved = 0
+    for line in lines:
+        R1 = OldFunc(line)
+        R2 = NewFunc(line)
+        if [(r[0],) + r[3:] for r in R1] == [(r[0],) + r[3:] for r in R2]:
+            same += 1
+        #end if
+        moved += sum(1 for r1, r2 in zip(R1, R2) if r1[1] != r2[1])
+    #next
+    print("lines={} : 数値・記号が一致={} : 位置が異なる数値={}".format(N, same, moved))
+
+    for name, func in (("isfloat+find", OldFunc), ("ScanRatio", NewFunc)):
+        best = None
+        for k in range(repeat):
+            t0 = time.perf_counter()
+            for line in lines:
+                func(line)
+            #next
+            t = time.perf_counter() - t0
+            best = t if best is None else min(best, t)
+        #next
+        print("{:14s} : {:.3f} sec ({:.2f} us/line)".format(name, best, best / N * 1e6))
+    #next
+#end def
+
+#============================================================================
+#  合成した計算書（表紙＋本文のページ）のPDFファイルを作成する関数
+#============================================================================
+def MakeBook(filename, N):
+    pdfmetrics.registerFont(UnicodeCIDFont("HeiseiKakuGo-W5"))
+    cc = canvas.Canvas(filename)
+    cc.setFont("HeiseiKakuGo-W5", 12)
+    cc.drawString(100, 700, "プログラムの名称：SuperBuild/SS7")
+    cc.drawString(100, 680, "プログラムのバージョン：1.1.1.18")
+    cc.showPage()
+    for i in range(N - 1):
+        cc.setFont("HeiseiKakuGo-W5", 10)
+        cc.drawString(100, 700, "page {}".format(i + 2))
+        cc.showPage()
+    #next
+    cc.save()
+#end def
+
+#============================================================================
+#  表紙の読取り（TopPageCheckTool）の計測
+#       ページ数が異なる計算書で処理時間がほとんど変わらないことを確認する
+#       比較のため、従来の方法（pypdfで全ページの用紙サイズを読み取る）の時間も表示する
+#============================================================================
+def BenchCover(pages=(10, 100, 1000), repeat=3):
+    CT = CheckTool()
+    with tempfile.TemporaryDirectory() as tmp:
+        for N in pages:
+            filename = os.path.join(tmp, "book{}.pdf".format(N))
+            MakeBook(filename, N)
+            best = None
+            for k in range(repeat):
+                t0 = time.perf_counter()
+                with contextlib.redirect_stdout(io.StringIO()):
+                    CT.TopPageCheckTool(filename, None, 0.95)
+                #end with
+                t = time.perf_counter() - t0
+                best = t if best is None else min(best, t)
+            #next
+            t0 = time.perf_counter()
+            with open(filename, "rb") as input:
+                reader = PR2(input)
+                PaperSize = [[float(page.mediabox.width), float(page.mediabox.height)] for page in reader.pages]
+            #end with
+            t1 = time.perf_counter() - t0
+            print("pages={:5d} : TopPageCheckTool={:.3f} sec : (全ページの用紙サイズの読取り={:.3f} sec)".format(N, best, t1))
+        #next
+    #end with
+#end def
+
+
+#============================================================================
+#  子プロセスで日本語のCMapを準備する時間を計測する関数（結果はqueueで親プロセスに送る）
+#       how = "cold"  : pdfminerのgzip+JSONのファイルから読み込む（従来の方法）
+#             "cache" : PreloadCMapsで保存したファイルから読み込む（spawnの場合）
+#             "fork"  : 親プロセスで読み込んだ変換表をそのまま使用する（forkの場合）
+#============================================================================
+def CMapWorker(how, cachefile, queue):
+    import CheckTool as CTM
+    from pdfminer.cmapdb import CMapDB
+    t0 = time.perf_counter()
+    if how == "cache":
+        CTM.LoadCMaps(cachefile)
+    #end if
+    for name in CTM.JAPANESE_CMAPS:
+        try:
+            CMapDB.get_cmap(name)
+        except CMapDB.CMapNotFound:
+            pass
+        #end try
+    #next
+    for name in CTM.JAPANESE_UMAPS:
+        CMapDB.get_unicode_map(name, False)
+    #next
+    queue.put(time.perf_counter() - t0)
+#end def
+
+#============================================================================
+#  日本語のCMapの準備（ワーカーの起動時の処理）の計測
+#============================================================================
+def BenchCMap(workers=4):
+    import multiprocessing as mp
+    import CheckTool as CTM
+    with tempfile.TemporaryDirectory() as tmp:
+        cachefile = os.path.join(tmp, "cmaps.db")
+        for how, method in (("cold", "spawn"), ("cache", "spawn"), ("fork", "fork")):
+            ctx = mp.get_context(method)
+            if how == "fork":
+                t0 = time.perf_counter()
+                CTM.PreloadCMaps(cachefile)
+                print("PreloadCMaps（親プロセスで１回） : {:.4f} sec".format(time.perf_counter() - t0))
+            #end if
+            queue = ctx.Queue()
+            procs = [ctx.Process(target=CMapWorker, args=(how, cachefile, queue)) for i in range(workers)]
+            for p in procs:
+                p.start()
+            #next
+            T = [queue.get() for p in procs]
+            for p in procs:
+                p.join()
+            #next
+            print("{:5s}({:5s}) : ワーカー毎の準備時間 平均={:.4f} sec : 合計={:.4f} sec".format(how, method, sum(T) / len(T), sum(T)))
+            if how == "cold":
+                # spawnの子プロセスが読み込むファイルを作成する（親プロセスの変換表はforkの計測まで使用しない）
+                p = ctx.Process(target=CTM.PreloadCMaps, args=(cachefile,))
+                p.start()
+                p.join()
+            #end if
+        #next
+    #end with
+#end def
+
+
+#============================================================================
+#  並列処理を行うページ数の境界（multicheck.SERIAL_PAGES）の計測
+#       filename : 計算書のPDFファイル（表紙と先頭からNページを取り出して計測する）
+#
+#   並列処理の時間 = 起動時間T0 + N×t/W、このプロセスで処理する時間 = N×t として、
+#   T0とページあたりの時間tを計測し、W個のCPUで並列処理が速くなるページ数を表示する。
+#   （T0は２プロセスと１プロセスの時間の差からCPUが１個の場合でも求められるようにする）
+#============================================================================
+def BenchCrossover(filename, pages=(4, 8, 16, 32), repeat=3):
+    import uuid
+    from multicheck import multicheck, CPUCount
+    reader = PR2(filename)
+    with tempfile.TemporaryDirectory() as tmp:
+        T0 = []
+        t = []
+        for N in pages:
+            best = {}
+            for bunkatu in (1, 2):
+                for k in range(repeat):
+                    # 内容を変えてキャッシュと索引を使用しないようにする
+                    part = os.path.join(tmp, "part{}.pdf".format(N))
+                    writer = pypdf.PdfWriter()
+                    for i in range(min(N + 1, len(reader.pages))):
+                        writer.add_page(reader.pages[i])
+                    #next
+                    writer.add_metadata({"/Subject": uuid.uuid4().hex})
+                    writer.write(part)
+                    t0 = time.perf_counter()
+                    with contextlib.redirect_stdout(io.StringIO()):
+                        multicheck(part, stpage=2, edpage=0, bunkatu=bunkatu).doCheck()
+                    #end with
+                    dt = time.perf_counter() - t0
+                    best[bunkatu] = min(best.get(bunkatu, dt), dt)
+                #next
+            #next
+            print("pages={:3d} : 並列処理なし={:.3f} sec : ２プロセス={:.3f} sec".format(N, best[1], best[2]))
+            T0.append(best[2] - best[1])
+            t.append(best[1] / N)
+        #next
+    #end with
+    T0 = max(0.0, sum(T0) / len(T0))
+    t = sum(t) / len(t)
+    W = max(2, CPUCount())
+    print("起動時間T0={:.3f} sec : ページあたり={:.3f} sec : CPU={}個で並列処理が速くなるページ数={:.1f}".format(
+        T0, t, W, T0 / (t * (1.0 - 1.0 / W))))
+#end def
+
+
+#============================================================================
+#  処理時間の異なるページが混在する合成した計算書を作成する関数
+#       light   : 本文のページ（見出しのキーワードが無く、事前判定で除外される）
+#       heavy   : 検定比図のページ（最後にまとめて置く：ページ順に配ると重いページが最後に残る）
+#       labels  : 検定比図の数値の個数（ページ毎に選ぶ）
+#============================================================================
+def MakeMixedBook(filename, light=60, heavy=12, labels=(30, 60, 120), seed=1):
+    rnd = random.Random(seed)
+    pdfmetrics.registerFont(UnicodeCIDFont("HeiseiKakuGo-W5"))
+    cc = canvas.Canvas(filename)
+    cc.setFont("HeiseiKakuGo-W5", 12)
+    cc.drawString(100, 700, "プログラムの名称：SuperBuild/SS7")
+    cc.drawString(100, 680, "プログラムのバージョン：1.1.1.18")
+    cc.showPage()
+    for i in range(light):
+        cc.setFont("HeiseiKakuGo-W5", 10)
+        for k in range(20):
+            cc.drawString(60, 780 - k * 16, "本文 {} 行 {} : 設計方針と荷重の説明".format(i + 2, k))
+        #next
+        cc.showPage()
+    #next
+    for i in range(heavy):
+        cc.setFont("HeiseiKakuGo-W5", 10)
+        cc.drawString(50, 800, "検定比図")
+        cc.setFont("HeiseiKakuGo-W5", 6)
+        for k in range(rnd.choice(labels)):
+            x = 40 + (k % 15) * 35
+            y = 760 - (k // 15) * 35
+            cc.drawString(x, y, rnd.choice(["{:.2f}", "({:.2f})", "{:.2f}C"]).format(rnd.choice([0.5, 0.93, 0.96, 0.99])))
+            cc.saveState()
+            cc.translate(x + 8, y - 12)
+            cc.rotate(90)
+            cc.drawString(0, 0, "{:.2f}".format(rnd.choice([0.3, 0.97])))
+            cc.restoreState()
+        #next
+        cc.showPage()
+    #next
+    cc.save()
+#end def
+
+#============================================================================
+#  ページの配り方（ページ順と処理時間の見込みの大きい順）の比較
+#       各ページの実際の処理時間をこのプロセスで計測し、W個のプロセスで処理した場合の
+#       終了時刻（全体の時間）と、最初に空いたプロセスが待つ時間（末尾の待ち時間）を求める
+#       （CPUの数に関係なく同じ結果になるように、並列処理は計測した時間から計算する）
+#============================================================================
+def BenchSchedule(workers=(4, 8, 16), repeat=2):
+    import heapq
+    from CheckTool import PageTable, PageDispatcher
+    CT = CheckTool()
+    with tempfile.TemporaryDirectory() as tmp:
+        filename = os.path.join(tmp, "mixed.pdf")
+        MakeMixedBook(filename)
+        PageInfo = PageTable(filename)
+        with contextlib.redirect_stdout(io.StringIO()):
+            kind, version = CT.TopPageCheckTool(filename, None, 0.95)
+        #end with
+        T = {}
+        for p in range(2, len(PageInfo) + 1):
+            for k in range(repeat):
+                t0 = time.perf_counter()
+                with contextlib.redirect_stdout(io.StringIO()):
+                    CT.PageCheck(filename, None, 0.95, kind, version, 0, PageDispatcher([p]), [0], [0, 0, 0, 0], "", None, PageInfo)
+                #end with
+                t = time.perf_counter() - t0
+                T[p] = min(T.get(p, t), t)
+            #next
+        #next
+    #end with
+    pages = sorted(T)
+    cost = np.array([PageInfo[p-1][3] for p in pages], dtype=float)
+    print("pages={} : 処理時間の合計={:.2f} sec : 最大={:.2f} sec : 見込みと処理時間の相関係数={:.2f}".format(
+        len(pages), sum(T.values()), max(T.values()), np.corrcoef(cost, [T[p] for p in pages])[0, 1]))
+    orders = (("ページ順", pages), ("見込みの大きい順", sorted(pages, key=lambda p: -PageInfo[p-1][3])))
+    for W in workers:
+        for name, order in orders:
+            free = [(0.0, i) for i in range(W)]
+            for p in order:
+                t, i = heapq.heappop(free)
+                heapq.heappush(free, (t + T[p], i))
+            #next
+            finish = sorted(t for t, i in free)
+            print("W={:2d} : {:10s} : 全体={:.2f} sec : 末尾の待ち時間={:.2f} sec : (下限={:.2f} sec)".format(
+                W, name, finish[-1], finish[-1] - finish[0], max(sum(T.values()) / W, max(T.values()))))
+        #next
+    #next
+#end def
+
+
+#============================================================================
+#  図形の多いページ（検定比図）だけの合成した計算書を作成する関数
+#       pages   : ページ数
+#       lines   : １ページあたりの線分の数
+#============================================================================
+def MakeDrawingBook(filename, pages=10, lines=20000, seed=1):
+    rnd = random.Random(seed)
+    pdfmetrics.registerFont(UnicodeCIDFont("HeiseiKakuGo-W5"))
+    cc = canvas.Canvas(filename)
+    for i in range(pages):
+        cc.setFont("HeiseiKakuGo-W5", 10)
+        cc.drawString(50, 800, "検定比図")
+        cc.setLineWidth(0.2)
+        for k in range(lines):
+            x = rnd.uniform(30, 560)
+            y = rnd.uniform(30, 780)
+            cc.line(x, y, x + rnd.uniform(-20, 20), y + rnd.uniform(-20, 20))
+        #next
+        cc.showPage()
+    #next
+    cc.save()
+#end def
+
+#============================================================================
+#  ページを回転前の座標（ページの内容の座標）のままReportLabのキャンバスに展開する関数（従来の方法）
+#       回転したページ（/Rotate）は、結果のページにも同じ回転角度を設定して元の向きで表示する
+#       （検出した四角形は回転前の座標なので変換せずにそのまま描画できる）
+#       用紙サイズは元のページと同じにする（ReportLabは90度・270度の場合に幅と高さを入れ替えるので逆に指定）
+#============================================================================
+def DrawPage(cc, page):
+    from pdfrw.buildxobj import pagexobj, ViewInfo
+    from pdfrw.toreportlab import makerl
+    rotate = int(page.inheritable.Rotate or 0) % 360
+    if rotate != 0:
+        pp = pagexobj(page, ViewInfo(rotate=-rotate)) # 回転を打ち消してXobjへ変換
+    else:
+        pp = pagexobj(page) #ページデータをXobjへの変換
+    #end if
+    if rotate in (90, 270):
+        cc.setPageSize((pp.h, pp.w))
+    else:
+        cc.setPageSize((pp.w, pp.h))
+    #end if
+    cc.setPageRotation(rotate)
+    rl_obj = makerl(cc, pp) # ReportLabオブジェクトへの変換  
+    cc.doForm(rl_obj) # 展開
+    return rotate
+#end def
+
+#============================================================================
+#  従来の結果のページの作成方法（pdfrwでページ全体をフォームXObjectに変換してReportLabで描画）
+#============================================================================
+def OldRender(pdf, out_path, pageN, ResultData, PaperSize):
+    from reportlab.lib.units import mm
+    cc = canvas.Canvas(out_path)
+    cc.setLineWidth(1)
+    DrawPage(cc, pdf.pages[pageN - 1])
+    cc.setFillColor("red")
+    cc.setFont("ipaexg", 12)
+    cc.drawString(20 * mm, float(PaperSize[1]) - 15 * mm, "検索個数 = {}".format(len(ResultData)))
+    for a, origin, flag in ResultData:
+        cc.setFillColor("white", 0.5)
+        cc.setStrokeColorRGB(1.0, 0, 0)
+        cc.rect(origin[0], origin[1], origin[2], origin[3], fill=0)
+    #next
+    cc.showPage()
+    cc.save()
+    return out_path
+#end def
+
+#============================================================================
+#  結果ファイルの作成時間とファイルサイズの比較（図形の多いページ）
+#       従来の方法 : ページ全体をフォームXObjectに変換して新しいページに描画し、ページ毎のファイルを
+#                    PdfMergerで結合
+#       現在の方法 : 元のページを複製し、検出個数と四角形のストリームだけを追加して１つのPdfWriterで
+#                    保存（ResultRenderer）
+#============================================================================
+def BenchRender(pages=10, lines=(2000, 20000), boxes=20, repeat=2):
+    from pdfrw import PdfReader
+    from CheckTool import ResultRenderer
+    CheckTool()     # フォントの登録
+    with tempfile.TemporaryDirectory() as tmp:
+        for L in lines:
+            book = os.path.join(tmp, "draw{}.pdf".format(L))
+            MakeDrawingBook(book, pages, L)
+            ResultData = [(0.96, [50 + 20 * k, 400, 15, 8], False) for k in range(boxes)]
+            PaperSize = [595.2756, 841.8898]
+            result = {}
+            for name in ("old", "new"):
+                best = None
+                for k in range(repeat):
+                    outdir = tempfile.mkdtemp(dir=tmp)
+                    out = os.path.join(outdir, "result.pdf")
+                    t0 = time.perf_counter()
+                    if name == "old":
+                        pdf = PdfReader(book, decompress=False)
+                        files = [OldRender(pdf, outdir + "/outfile{:0=4}.pdf".format(n), n, ResultData, PaperSize)
+                                 for n in range(1, pages + 1)]
+                        merger = pypdf.PdfMerger()
+                        for file in files:
+                            merger.append(file)
+                        #next
+                        merger.write(out)
+                        merger.close()
+                    else:
+                        renderer = ResultRenderer(book)
+                        for n in range(1, pages + 1):
+                            renderer.Render(n, ResultData, PaperSize)
+                        #next
+                        renderer.Write(out)
+                        renderer.Close()
+                    #end if
+                    dt = time.perf_counter() - t0
+                    best = dt if best is None else min(best, dt)
+                #next
+                result[name] = (best, os.path.getsize(out))
+            #next
+            print("lines={:6d} : 計算書={:8d} bytes : 従来={:.3f} sec {:8d} bytes : 現在={:.3f} sec {:8d} bytes".format(
+                L, os.path.getsize(book), result["old"][0], result["old"][1], result["new"][0], result["new"][1]))
+        #next
+    #end with
+#end def
+
+
+#============================================================================
+#  計算書全体の結果ファイルの作成時間の比較（全体の書き直しと増分更新）
+#       pages   : 計算書のページ数のリスト
+#       hits    : 検出結果を描き加えるページ数（計算書の大きさに関係なく同じ）
+#============================================================================
+def BenchUpdate(pages=(20, 100, 400), hits=10, lines=1000, boxes=20, repeat=2):
+    from CheckTool import ResultRenderer, UpdateRenderer
+    CheckTool()     # フォントの登録
+    ResultData = [(0.96, [50 + 20 * k, 400, 15, 8], False) for k in range(boxes)]
+    PaperSize = [595.2756, 841.8898]
+    with tempfile.TemporaryDirectory() as tmp:
+        for N in pages:
+            book = os.path.join(tmp, "book{}.pdf".format(N))
+            MakeDrawingBook(book, N, lines)
+            hit = [1 + k * N // hits for k in range(hits)]
+            out = os.path.join(tmp, "out.pdf")
+            result = {}
+            for name in ("copy", "update"):
+                best = None
+                for k in range(repeat):
+                    t0 = time.perf_counter()
+                    if name == "copy":
+                        # 計算書全体をPdfWriterで書き直す
+                        renderer = ResultRenderer(book)
+                        writer = pypdf.PdfWriter(clone_from=book)
+                        for n in hit:
+                            renderer.Stamp(writer, writer.pages[n - 1], ResultData, PaperSize)
+                        #next
+                        writer.write(out)
+                    else:
+                        renderer = UpdateRenderer(book)
+                        for n in hit:
+                            renderer.Render(n, ResultData, PaperSize)
+                        #next
+                        renderer.Write(out)
+                    #end if
+                    renderer.Close()
+                    dt = time.perf_counter() - t0
+                    best = dt if best is None else min(best, dt)
+                #next
+                result[name] = (best, os.path.getsize(out))
+            #next
+            print("pages={:4d} : 計算書={:9d} bytes : 書き直し={:.3f} sec {:9d} bytes : 増分更新={:.3f} sec {:9d} bytes（追加={} bytes）".format(
+                N, os.path.getsize(book), result["copy"][0], result["copy"][1], result["update"][0], result["update"][1],
+                result["update"][1] - os.path.getsize(book)))
+        #next
+    #end with
+#end def
+
+#============================================================================
+#  ページ毎に別々のPDFを結合した計算書を作成する関数（リソースの重複の計測用）
+#       各ページが同じフォント（IPAexゴシックのサブセット）と同じ図（フォームXObject）を別々に持つ
+#============================================================================
+def MakeDuplicatedBook(filename, pages=200, lines=300, seed=1):
+    CheckTool()     # フォントの登録
+    writer = pypdf.PdfWriter()
+    for i in range(pages):
+        rnd = random.Random(seed)
+        buf = io.BytesIO()
+        cc = canvas.Canvas(buf)
+        cc.beginForm("frame")
+        cc.setLineWidth(0.2)
+        for k in range(lines):
+            x = rnd.uniform(30, 560)
+            y = rnd.uniform(30, 780)
+            cc.line(x, y, x + rnd.uniform(-20, 20), y + rnd.uniform(-20, 20))
+        #next
+        cc.endForm()
+        cc.doForm("frame")
+        cc.setFont("ipaexg", 10)
+        cc.drawString(50, 800, "検定比図 0.{:02d}".format(i % 100))
+        cc.showPage()
+        cc.save()
+        writer.append(io.BytesIO(buf.getvalue()))
+    #next
+    with open(filename, "wb") as fp:
+        writer.write(fp)
+    #end with
+#end def
+
+#============================================================================
+#  結果ファイルのリソースの重複をまとめる効果（ファイルサイズと保存時間）の比較
+#       pages   : 計算書のページ数（すべてのページに検出結果がある場合）
+#============================================================================
+def BenchDedup(pages=(50, 200), boxes=20, repeat=2):
+    from CheckTool import ResultRenderer
+    ResultData = [(0.96, [50 + 20 * k, 400, 15, 8], False) for k in range(boxes)]
+    PaperSize = [595.2756, 841.8898]
+    with tempfile.TemporaryDirectory() as tmp:
+        for N in pages:
+            book = os.path.join(tmp, "dup{}.pdf".format(N))
+            MakeDuplicatedBook(book, N)
+            out = os.path.join(tmp, "out.pdf")
+            result = {}
+            for name in ("plain", "dedup"):
+                best = None
+                for k in range(repeat):
+                    t0 = time.perf_counter()
+                    renderer = ResultRenderer(book)
+                    for n in range(1, N + 1):
+                        renderer.Render(n, ResultData, PaperSize)
+                    #next
+                    if name == "plain":
+                        with open(out, "wb") as fp:
+                            renderer.writer.write(fp)
+                        #end with
+                    else:
+                        renderer.Write(out)
+                    #end if
+                    renderer.Close()
+                    dt = time.perf_counter() - t0
+                    best = dt if best is None else min(best, dt)
+                #next
+                t0 = time.perf_counter()
+                for page in PR2(out).pages:
+                    page.extract_text()
+                #next
+                result[name] = (best, os.path.getsize(out), time.perf_counter() - t0)
+            #next
+            print("pages={:4d} : 計算書={:9d} bytes : まとめない={:.3f} sec {:9d} bytes（読込み={:.3f} sec） : まとめる={:.3f} sec {:9d} bytes（読込み={:.3f} sec）".format(
+                N, os.path.getsize(book), result["plain"][0], result["plain"][1], result["plain"][2],
+                result["dedup"][0], result["dedup"][1], result["dedup"][2]))
+        #next
+    #end with
+#end def
+
+#============================================================================
+#  ページの処理の方法（multicheckのbackend、WorkerPool）による処理時間の比較
+#       filename    : 計算書のファイル名
+#       workers     : プロセス数・スレッド数
+#   毎回内容を変えた複製を処理してキャッシュと索引を使用しないようにし、
+#   索引に保存された検定比の候補がすべての方法で同じであることを確認する
+#============================================================================
+def BenchBackend(filename, workers=4, repeat=2):
+    import uuid
+    import pickle
+    from multicheck import multicheck, WorkerPool
+    from CheckTool import EXTRACT_VERSION
+    from PageCache import CandidateIndex, FileDigest
+    reader = PR2(filename)
+    pool = WorkerPool(workers)
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            base = None
+            for backend in ("serial", "thread", "process", "pool"):
+                best = None
+                for k in range(repeat):
+                    part = os.path.join(tmp, "{}{}.pdf".format(backend, k))
+                    writer = pypdf.PdfWriter()
+                    for page in reader.pages:
+                        writer.add_page(page)
+                    #next
+                    writer.add_metadata({"/Subject": uuid.uuid4().hex})
+                    writer.write(part)
+                    if backend == "pool":
+                        M = multicheck(part, stpage=2, edpage=0, bunkatu=workers, pool=pool)
+                    else:
+                        M = multicheck(part, stpage=2, edpage=0, bunkatu=workers, backend=backend)
+                    #end if
+                    t0 = time.perf_counter()
+                    with contextlib.redirect_stdout(io.StringIO()):
+                        M.doCheck()
+                    #end with
+                    dt = time.perf_counter() - t0
+                    best = dt if best is None else min(best, dt)
+                #next
+                kind, pages = CandidateIndex(FileDigest(part), EXTRACT_VERSION, M.kind).Peek()
+                if kind != M.kind:
+                    pages = {}
+                #end if
+                # ページ毎に比較する（辞書全体のpickleは同じオブジェクトの参照の有無で変わる）
+                data = [(p, pickle.dumps(pages[p])) for p in sorted(pages)]
+                if base is None:
+                    base = data
+                #end if
+                print("backend={:8s} : {:.3f} sec : ページ数={} : serialと同じ結果={}".format(
+                    backend, best, len(pages), data == base))
+            #next
+        #end with
+    finally:
+        pool.Close()
+    #end try
+#end def
+
+
+if __name__ == '__main__':
+
+    BenchScan()
+    BenchCover()
+    BenchCMap()
+    BenchSchedule()
+    BenchRender()
+    BenchUpdate()
+    BenchDedup()
+    if len(sys.argv) > 1:
+        BenchCrossover(sys.argv[1])
+        BenchBackend(sys.argv[1])
+    #end if
+
+#*********************************************************************************
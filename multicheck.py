@@ -15,19 +15,541 @@
 """
 #
 from pypdf import PdfReader as PR2 # 名前が上とかぶるので別名を使用
-import pypdf
 
 # その他のimport
 import os,time
 import sys
 import logging
-import glob
-from multiprocessing import Process,Array
-import shutil
-from CheckTool import CheckTool
+import queue
+import threading
+from multiprocessing import Process,Array,Queue
+from CheckTool import CheckTool, EXTRACT_VERSION, SelectResults, PreloadCMaps, PageDispatcher, PageTable, ResultRenderer, UpdateRenderer, ResultRecords, RECORD_FORMATS, ProgramKind
+from PageCache import PageCache, CandidateIndex, FileDigest
+
+PAGE_CAPACITY = 100000      # WorkerPoolで処理できる計算書の最大ページ数
+SERIAL_PAGES = 8            # このページ数未満の場合は並列処理を行わない（benchmark.BenchCrossover：起動0.2秒、1ページ0.04秒）
+PAGES_PER_WORKER = 4        # １プロセスあたりの最小のページ数
+WORKER_MEMORY = 256 * 1024 * 1024   # １プロセスあたりの使用メモリーの見込み（バイト）
+RESULT_QUEUE = 64           # ワーカーから親プロセスに送る候補のキューの長さ（結果の作成が遅れた場合はワーカーが待つ）
 
-kind = ""
-version = ""
+#============================================================================
+#  このプロセスが使用できるCPUの数
+#============================================================================
+def CPUCount():
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:      # WindowsとmacOS
+        return os.cpu_count() or 1
+    #end try
+#end def
+
+#============================================================================
+#  使用できるメモリーのバイト数（取得できない場合はNone）
+#       Linuxは/proc/meminfoのMemAvailable（解放できるページキャッシュを含む）を使用し、
+#       それが無い場合だけsysconfの空きメモリー（ページキャッシュを含まない）を使用する
+#============================================================================
+def FreeMemory(meminfo="/proc/meminfo"):
+    try:
+        with open(meminfo) as fp:
+            for line in fp:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024      # kB
+                #end if
+            #next
+        #end with
+    except (OSError, ValueError, IndexError):
+        pass
+    #end try
+    try:
+        return os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+    except (AttributeError, ValueError, OSError):     # Windows等
+        return None
+    #end try
+#end def
+
+#============================================================================
+#  並列処理のプロセス数の上限（CPUの数と空きメモリーから決める）
+#       bunkatu : 指定したプロセス数（0の場合は自動）
+#============================================================================
+def PoolSize(bunkatu=0):
+    if bunkatu > 0:
+        return bunkatu
+    #end if
+    n = CPUCount()
+    mem = FreeMemory()
+    if mem is not None:
+        n = min(n, mem // WORKER_MEMORY)
+    #end if
+    return max(1, n)
+#end def
+
+#============================================================================
+#  計算書の処理に使用するプロセス数（1の場合は並列処理を行わない）
+#       pageN   : 処理するページ数
+#       bunkatu : 指定したプロセス数（para.jsonの「並列数」、0の場合は自動）
+#============================================================================
+def WorkerCount(pageN, bunkatu=0):
+    if bunkatu > 0:
+        return max(1, min(bunkatu, pageN))
+    #end if
+    if pageN < SERIAL_PAGES:
+        return 1
+    #end if
+    return max(1, min(PoolSize(), -(-pageN // PAGES_PER_WORKER)))
+#end def
+
+#============================================================================
+#  １つのワーカー（プロセス・スレッド・このプロセス）で計算書のページを処理する関数
+#       job     : CheckTool.PageCheckに渡す引数の辞書（filename, limit, kind, version, digest, PageInfo）
+#       psn     : ワーカーの番号（ProcessN、StageNの位置）
+#       Kind    : job["kind"]がNoneの場合に計算プログラムの種類を後から受け取るProgramKind
+#       CT      : 使用するCheckTool（Noneの場合は作成する）
+#       処理が終わったら（エラーの場合も）IndexQueueにNoneを送る
+#============================================================================
+def RunPageCheck(job, psn, Pages, ProcessN, StageN, IndexQueue, Kind=None, CT=None):
+    try:
+        if CT is None:
+            CT = CheckTool()
+        #end if
+        kind = job["kind"] if job["kind"] is not None else Kind
+        CT.PageCheck(job["filename"], None, job["limit"], kind, job["version"],
+                     psn, Pages, ProcessN, StageN, job["digest"], IndexQueue, job["PageInfo"])
+    except:
+        logging.exception(sys.exc_info())#エラーをlog.txtに書き込む
+    finally:
+        IndexQueue.put(None)
+    #end try
+#end def
+
+#============================================================================
+#  WorkerPoolのワーカーのプロセスの関数
+#       起動時にCheckToolを１回だけ作成し、計算書毎の処理の依頼（job）を待つ。
+#       jobの"lane"番目のPoolLaneのページを処理し、終わるたびにそのIndexQueueにNoneを送る
+#       （jobがNoneの場合は終了）
+#============================================================================
+def PoolWorker(psn, TaskQueue, Lanes):
+    CT = CheckTool()
+    while True:
+        job = TaskQueue.get()
+        if job is None:
+            break
+        #end if
+        L = Lanes[job["lane"]]
+        RunPageCheck(job, psn, L.Pages, L.ProcessN, L.StageN, L.IndexQueue, L.Kind, CT)
+    #end while
+#end def
+
+#============================================================================
+#  すべての計算書で共有するワーカーの枠（CPUの数）のクラス
+#       n   : 枠の数（同時に動かすワーカーのプロセス・スレッドの数の上限）
+#
+#   複数の計算書を同時に処理する場合は、WorkerPoolのワーカーも計算書毎に起動するワーカーも
+#   この枠を確保してから使用し（Acquire）、終わったら返す（Release）。
+#   枠の番号はWorkerPoolのワーカーの番号と同じ
+#============================================================================
+class WorkerSlots:
+
+    def __init__(self, n):
+        self.n = n
+        self.cond = threading.Condition()
+        self.Free = list(range(n))
+    #end def
+
+    #============================================================================
+    #  空いている枠を最大n個確保する関数（１個も空いていない場合は空くまで待つ）
+    #       戻り値  : 確保した枠の番号のリスト
+    #============================================================================
+    def Acquire(self, n):
+        with self.cond:
+            while len(self.Free) == 0:
+                self.cond.wait()
+            #end while
+            n = max(1, min(n, len(self.Free)))
+            ids = self.Free[:n]
+            del self.Free[:n]
+        #end with
+        return ids
+    #end def
+
+    #============================================================================
+    #  使用した枠を返す関数
+    #============================================================================
+    def Release(self, ids):
+        with self.cond:
+            self.Free.extend(ids)
+            self.cond.notify_all()
+        #end with
+    #end def
+#end class
+
+#============================================================================
+#  WorkerPoolで同時に処理する１つの計算書のための共有オブジェクトのクラス
+#       （共有メモリーはプロセスの起動時に渡す必要があるので、WorkerPoolの作成時にまとめて作る）
+#       Pages       : 処理するページを配るPageDispatcher
+#       ProcessN    : ワーカー毎の処理したページ数
+#       StageN      : ワーカー毎の各段階で飛ばしたページ数
+#       IndexQueue  : 検定比の候補を親プロセスに送るキュー
+#       Kind        : 計算プログラムの種類（表紙を読み取った後で設定する）
+#============================================================================
+class PoolLane:
+
+    def __init__(self, bunkatu, capacity):
+        self.Pages = PageDispatcher([], capacity=capacity)
+        self.ProcessN = Array('i', bunkatu)
+        self.StageN = Array('i', 4 * bunkatu)
+        self.IndexQueue = Queue(RESULT_QUEUE)
+        self.Kind = ProgramKind()
+    #end def
+
+    #============================================================================
+    #  次の計算書のためにページを設定し、カウンターを0に戻す関数
+    #============================================================================
+    def Reset(self, pages):
+        self.Pages.Reset(pages)
+        self.Kind.Clear()
+        for i in range(len(self.ProcessN)):
+            self.ProcessN[i] = 0
+        #next
+        for i in range(len(self.StageN)):
+            self.StageN[i] = 0
+        #next
+    #end def
+#end class
+
+#============================================================================
+#  複数の計算書の処理で共有するワーカーのプロセスのクラス
+#       bunkatu     : ワーカーのプロセス数（0の場合はCPUの数と空きメモリーから決める）
+#       capacity    : 処理できる計算書の最大ページ数
+#       slots       : ワーカーの枠（WorkerSlots、Noneの場合はワーカーの数の枠を作成）
+#
+#   StartCheckの一連の処理の最初に１回だけ作成し、各計算書のmulticheckに渡す。
+#   ワーカーは日本語のCMapとフォントを読み込んだ状態で待機するので、計算書毎に
+#   プロセスの起動やフォントの読込みを行わない。処理の終了時にClose()を実行する
+#
+#   ワーカーの数がすべての計算書で共有するCPUの枠（slots）になる。複数の計算書を同時に処理する場合は、
+#   各計算書が空いているワーカーを確保して使用し（Submit）、終わったら返す（Release）。
+#   WorkerPoolを使用できない計算書（ワーカーの異常終了後など）も同じ枠から計算書毎のワーカーを起動する。
+#   同時に処理する計算書は最大でワーカーの数なので、PoolLaneも同じ数だけ作る
+#============================================================================
+class WorkerPool:
+
+    def __init__(self, bunkatu=0, capacity=PAGE_CAPACITY, slots=None):
+        self.bunkatu = bunkatu = PoolSize(bunkatu) if slots is None else slots.n
+        self.capacity = capacity
+        # 日本語のCMapとフォントを親プロセスで読み込み、各プロセスで共有する
+        PreloadCMaps()
+        CheckTool()
+        self.Lanes = [PoolLane(bunkatu, capacity) for i in range(bunkatu)]
+        self.TaskQueues = [Queue() for i in range(bunkatu)]
+        self.Plist = []
+        for i in range(bunkatu):
+            P = Process(target=PoolWorker, args=(i, self.TaskQueues[i], self.Lanes))
+            P.daemon = True
+            self.Plist.append(P)
+        #next
+        for P in self.Plist:
+            P.start()
+        #next
+        # 空いているワーカー（slots）とPoolLaneの番号（複数のスレッドから使用するのでcondで排他制御）
+        self.slots = slots if slots is not None else WorkerSlots(bunkatu)
+        self.cond = threading.Condition()
+        self.FreeLanes = list(range(bunkatu))
+    #end def
+
+    #============================================================================
+    #  計算書の処理に使用できるかどうか（すべてのワーカーが動いていて、ページ数が上限以下）
+    #============================================================================
+    def Usable(self, pageN):
+        return pageN <= self.capacity and all(P.is_alive() for P in self.Plist)
+    #end def
+
+    #============================================================================
+    #  計算書の処理をワーカーに依頼する関数
+    #       空いているワーカーを最大workers個確保する（１個も空いていない場合は空くまで待つ）
+    #       job     : PoolWorkerがCheckTool.PageCheckに渡す引数の辞書
+    #       pages   : 処理するページ番号のリスト
+    #       workers : 使用するワーカーの数の上限
+    #       戻り値  : 使用するPoolLaneの番号、依頼したワーカーの番号のリスト
+    #                 （処理が終わったらRelease(lane, ids)を実行する）
+    #============================================================================
+    def Submit(self, job, pages, workers):
+        ids = self.slots.Acquire(workers)
+        with self.cond:
+            while len(self.FreeLanes) == 0:
+                self.cond.wait()
+            #end while
+            lane = self.FreeLanes.pop()
+        #end with
+        self.Lanes[lane].Reset(pages)
+        job = dict(job, lane=lane)
+        for i in ids:
+            self.TaskQueues[i].put(job)
+        #next
+        return lane, ids
+    #end def
+
+    #============================================================================
+    #  計算書の処理が終わったワーカーとPoolLaneを返す関数（laneがNoneの場合はワーカーだけ）
+    #============================================================================
+    def Release(self, lane, ids):
+        if lane is not None:
+            with self.cond:
+                self.FreeLanes.append(lane)
+                self.cond.notify_all()
+            #end with
+        #end if
+        self.slots.Release(ids)
+    #end def
+
+    #============================================================================
+    #  ワーカーを強制終了する関数（異常終了したワーカーがあった計算書の残りのワーカー）
+    #       強制終了したワーカーには、以後の計算書の処理を依頼しない（Usable()がFalseになる）
+    #============================================================================
+    def Terminate(self, ids):
+        for i in ids:
+            P = self.Plist[i]
+            if P.is_alive():
+                P.terminate()
+            #end if
+        #next
+        for i in ids:
+            self.Plist[i].join()
+        #next
+    #end def
+
+    #============================================================================
+    #  ワーカーのプロセスを終了する関数
+    #       （エラーで途中終了した計算書のワーカーがキューの空きを待っている場合は強制終了）
+    #============================================================================
+    def Close(self, timeout=10.0):
+        for Q in self.TaskQueues:
+            Q.put(None)
+        #next
+        for P in self.Plist:
+            P.join(timeout)
+            if P.is_alive():
+                P.terminate()
+                P.join()
+            #end if
+        #next
+    #end def
+#end class
+
+#============================================================================
+#  実行中の計算書の処理（各Executorが作成する）
+#       ProcessN, StageN : ワーカー毎の処理したページ数と各段階で飛ばしたページ数
+#       IndexQueue  : 各ワーカーから検定比の候補を受け取るキュー（ワーカー毎に最後にNoneが届く）
+#       Plist       : ワーカーのプロセス・スレッドのリスト（is_aliveで終了の確認に使用）
+#       ids         : ワーカーの番号のリスト
+#       Kind        : 計算プログラムの種類を後から知らせるProgramKind（jobに種類がある場合はNone）
+#       slots       : 確保したWorkerSlotsの枠の番号のリスト（Finishで返す）
+#============================================================================
+class PageRun:
+
+    def __init__(self, ProcessN, StageN, IndexQueue, Plist, ids, Kind=None, slots=()):
+        self.ProcessN = ProcessN
+        self.StageN = StageN
+        self.IndexQueue = IndexQueue
+        self.Plist = Plist
+        self.ids = ids
+        self.Kind = Kind
+        self.slots = slots
+        self.lane = None
+    #end def
+
+    #============================================================================
+    #  Noneを送っていないワーカーの数の上限（動いているワーカーの数）
+    #============================================================================
+    def Alive(self):
+        return sum(1 for P in self.Plist if P.is_alive())
+    #end def
+#end class
+
+#============================================================================
+#  計算書のページを処理する方法（Executor）のクラス
+#       Start(job, pages, workers) : ワーカーを起動してPageRunを返す
+#       Finish(run, stopped)       : ワーカーの終了を待ち（または返し）、ProcessN、StageNのリストを返す
+#       Stop(run)                  : Noneを送らずに終了したワーカーがある場合に、残りのワーカーを止める
+#                                    （結果のキューの空きを待って止まったままにならないように）
+#
+#   "process" : 計算書毎にプロセスを作成（共有メモリーのArrayで集計）
+#   "thread"  : 計算書毎にスレッドを作成（GILの無いPythonではプロセスより軽い）
+#   "serial"  : このプロセスで順番に処理
+#   WorkerPoolがある場合は、PoolExecutorでその待機中のワーカーを使用する
+#   どの方法でもPageCheckの処理は同じなので、検出結果は同じになる
+#
+#   overlap : Trueの場合は計算プログラムの種類が分かる前に起動できる（種類はPageRun.Kindで知らせる）
+#             Falseの場合（serial）はjobに種類を入れて起動する
+#   slots   : すべての計算書で共有するワーカーの枠（WorkerSlots）。ある場合はStartで空いている枠を
+#             最大workers個確保してその数のワーカーを起動し、Finishで返す
+#============================================================================
+class SerialExecutor:
+
+    name = "serial"
+    overlap = False
+
+    def __init__(self, slots=None):
+        self.slots = slots
+    #end def
+
+    def Start(self, job, pages, workers):
+        IndexQueue = queue.SimpleQueue()
+        run = PageRun([0], [0, 0, 0, 0], IndexQueue, [], [0])
+        # 起動せずにすべてのページを処理してから返す（候補とNoneはIndexQueueに入っている）
+        slots = self.slots.Acquire(1) if self.slots is not None else []
+        try:
+            RunPageCheck(job, 0, PageDispatcher(pages), run.ProcessN, run.StageN, IndexQueue)
+        finally:
+            if self.slots is not None:
+                self.slots.Release(slots)
+            #end if
+        #end try
+        return run
+    #end def
+
+    def Stop(self, run):
+        pass
+    #end def
+
+    def Finish(self, run, stopped):
+        return run.ProcessN, run.StageN
+    #end def
+#end class
+
+class ThreadExecutor:
+
+    name = "thread"
+    overlap = True
+
+    def __init__(self, slots=None):
+        self.slots = slots
+    #end def
+
+    def Start(self, job, pages, workers):
+        slots = self.slots.Acquire(workers) if self.slots is not None else []
+        if self.slots is not None:
+            workers = len(slots)
+        #end if
+        # 日本語のCMapを１回だけ読み込み、各スレッドで共有する
+        PreloadCMaps()
+        # 各スレッドは自分の番号の位置だけを更新するので、リストのままで良い
+        ProcessN = [0] * workers
+        StageN = [0] * (4 * workers)
+        IndexQueue = queue.Queue(RESULT_QUEUE)
+        Kind = ProgramKind(shared=False)
+        Pages = PageDispatcher(pages)
+        Plist = [threading.Thread(target=RunPageCheck, args=(job, i, Pages, ProcessN, StageN, IndexQueue, Kind), daemon=True)
+                 for i in range(workers)]
+        for P in Plist:
+            P.start()
+        #next
+        return PageRun(ProcessN, StageN, IndexQueue, Plist, list(range(workers)), Kind, slots)
+    #end def
+
+    def Stop(self, run):
+        # スレッドは強制終了できないので、Collectがキューを読み続けて終了を待つ
+        pass
+    #end def
+
+    def Finish(self, run, stopped):
+        for P in run.Plist:
+            P.join()
+        #next
+        if self.slots is not None:
+            self.slots.Release(run.slots)
+        #end if
+        return run.ProcessN, run.StageN
+    #end def
+#end class
+
+class ProcessExecutor:
+
+    name = "process"
+    overlap = True
+
+    def __init__(self, slots=None):
+        self.slots = slots
+    #end def
+
+    def Start(self, job, pages, workers):
+        slots = self.slots.Acquire(workers) if self.slots is not None else []
+        if self.slots is not None:
+            workers = len(slots)
+        #end if
+        # 日本語のCMapを親プロセスで１回だけ読み込み、各プロセスで共有する
+        PreloadCMaps()
+        ProcessN = Array('i', workers)
+        # 各段階で飛ばしたページ数（プロセス毎に[事前判定で除外, 見出し判定で除外, 数値検索を実施, キャッシュを使用]）
+        StageN = Array('i', 4 * workers)
+        IndexQueue = Queue(RESULT_QUEUE)
+        Kind = ProgramKind()
+        # 処理するページを各プロセスに配るオブジェクト
+        Pages = PageDispatcher(pages)
+        # プロセスにはモジュールの関数と引数だけを渡す（multicheckのオブジェクトは渡さない）
+        Plist = [Process(target=RunPageCheck, args=(job, i, Pages, ProcessN, StageN, IndexQueue, Kind))
+                 for i in range(workers)]
+        for P in Plist:
+            P.start()
+        #next
+        return PageRun(ProcessN, StageN, IndexQueue, Plist, list(range(workers)), Kind, slots)
+    #end def
+
+    def Stop(self, run):
+        # 計算書の結果は不完全になるので、残りのプロセスも強制終了する（キューはこの計算書だけで使用）
+        for P in run.Plist:
+            if P.is_alive():
+                P.terminate()
+            #end if
+        #next
+    #end def
+
+    def Finish(self, run, stopped):
+        for P in run.Plist:
+            P.join()
+        #next
+        if self.slots is not None:
+            self.slots.Release(run.slots)
+        #end if
+        return list(run.ProcessN), list(run.StageN)
+    #end def
+#end class
+
+class PoolExecutor:
+
+    name = "pool"
+    overlap = True
+
+    def __init__(self, pool):
+        self.pool = pool
+    #end def
+
+    def Start(self, job, pages, workers):
+        lane, ids = self.pool.Submit(job, pages, workers)
+        L = self.pool.Lanes[lane]
+        run = PageRun(L.ProcessN, L.StageN, L.IndexQueue, [self.pool.Plist[i] for i in ids], ids, L.Kind)
+        run.lane = lane
+        return run
+    #end def
+
+    def Stop(self, run):
+        # ワーカーが異常終了したWorkerPoolは使用しない（Usable()がFalse）ので、この計算書の残りの
+        # ワーカーも強制終了する（PoolLaneのキューの空きを待ったまま次の計算書に使用されないように）
+        self.pool.Terminate(run.ids)
+    #end def
+
+    def Finish(self, run, stopped):
+        # 使用したワーカーを他の計算書のために返す（PoolLaneのカウンターは返す前に読み取る）
+        # 途中で終了したワーカーがある場合は、PoolLaneのキューが壊れている可能性があるので返さない
+        # （強制終了したワーカーの枠は、WorkerPoolを使用しない計算書のために返す）
+        ProcessN = list(run.ProcessN)
+        StageN = list(run.StageN)
+        self.pool.Release(None if stopped else run.lane, run.ids)
+        return ProcessN, StageN
+    #end def
+#end class
+
+EXECUTORS = {"process": ProcessExecutor, "thread": ThreadExecutor, "serial": SerialExecutor}
+OUTPUTS = ("pages", "book") + tuple(RECORD_FORMATS)
 
 #============================================================================
 #  並列処理による数値チェックのクラス
@@ -41,18 +563,38 @@ class multicheck:
     #       limit       : 閾値
     #       stpage      : 処理開始ページ
     #       edpage      : 処理終了ページ
-    #       bunkatu     : 並列処理の分割数
+    #       bunkatu     : 並列処理の分割数（0の場合はCPUの数・空きメモリー・ページ数から自動で決める）
+    #       pool        : 複数の計算書で共有するWorkerPool（Noneの場合は計算書毎にbackendの方法で処理）
+    #       backend     : WorkerPoolが無い場合の処理の方法（"process", "thread", "serial"）
+    #       slots       : 複数の計算書で共有するワーカーの枠（WorkerSlots、WorkerPoolを使用しない場合も
+    #                     この枠の中でワーカーを起動する。Noneの場合は制限しない）
+    #       output      : 結果ファイルの内容（"pages"：検出したページだけ、"book"：計算書全体（増分更新）、
+    #                     "json", "csv", "sqlite"：PDFを作成せずに検出結果の一覧だけ）
     #============================================================================
-    def __init__(self,filename, limit=0.95 ,stpage=0, edpage=0, bunkatu=4):
+    def __init__(self,filename, limit=0.95 ,stpage=0, edpage=0, bunkatu=0, pool=None, backend="process", output="pages", slots=None):
+        if backend not in EXECUTORS:
+            raise ValueError("backend must be one of {}".format(", ".join(EXECUTORS)))
+        #end if
+        if output not in OUTPUTS:
+            raise ValueError("output must be one of {}".format(", ".join(OUTPUTS)))
+        #end if
         self.filename = filename
         self.limit = limit
         self.bunkatu = bunkatu
-        self.kinf =""
+        self.pool = pool
+        self.backend = backend
+        self.output = output
+        self.slots = slots if slots is not None or pool is None else pool.slots
+        self.kind = ""
         self.version = ""
         self.rotate = []
 
+        # 各プロセスは元の計算書を読み取り専用で共有する（複製や回転を戻したファイルは作らない）
+        # 回転したページ（/Rotate）は回転前の座標で数値を検出し、結果のページに同じ回転を設定する
+        self.srcfile = self.filename
+
         # 検出結果のファイル名
-        self.pdf_out_file = os.path.splitext(self.filename)[0] + '[検出結果(閾値={:.2f}'.format(limit)+')].pdf'
+        self.pdf_out_file = os.path.splitext(self.filename)[0] + '[検出結果(閾値={:.2f}'.format(limit)+')]' + RECORD_FORMATS.get(output, ".pdf")
 
         # PyPDF2のツールを使用してPDFのページ情報を読み取る。
         # PDFのページ数と各ページの用紙サイズを取得
@@ -91,204 +633,270 @@ class multicheck:
     #end def
 
     #============================================================================
-    #  計算書ファイルを分割する関数
+    #  表紙から計算プログラムの種類を検出する関数
+    #       （複数の計算書を同時に処理するので、種類とバージョンはこのインスタンスだけに保存する）
+    #============================================================================
+    def TopPageCheck(self):
+        CT = CheckTool()
+        self.kind, self.version = CT.TopPageCheckTool(self.srcfile,None,self.limit)
+    
+    #============================================================================
+    #  候補から閾値以上の数値を選択して結果のページを作成し、結果ファイルに追加する関数
+    #       pageI   : ページ番号
+    #       E       : 索引のデータ（CandidateIndexの形式）
+    #       戻り値  : 結果のページを作成した場合はTrue
     #============================================================================
-    def makepdf(self):
-
-        # プログラムのあるディレクトリー
-        fld = os.getcwd()
-
-        # 分割ファイルを一時保存するディレクトリー（無ければ作成）
-        self.dir1 = fld + "/pdf"
-        if not os.path.isdir(self.dir1):
-            os.mkdir(self.dir1)
-        #end if
 
-        # pdfフォルダー内にあるPDFファイルをすべて削除
-        files = glob.glob(os.path.join(self.dir1, "*.pdf"))
-        if len(files)>0:
-            for file in files:
-                os.remove(file)
-            #next
+    def AddResult(self, pageI, E):
+        ResultData = SelectResults(E["Candidates"], self.limit)
+        if len(ResultData) == 0:
+            return False
         #end if
+        try:
+            if isinstance(self.renderer, ResultRecords):
+                self.renderer.Add(pageI, E["mode"], E["B_kind"], ResultData)
+            else:
+                self.renderer.Render(pageI, ResultData, E["PaperSize"])
+            #end if
+        except OSError as e:
+            print(e)
+            logging.exception(sys.exc_info())#エラーをlog.txtに書き込む
+            return False
+        except:
+            logging.exception(sys.exc_info())#エラーをlog.txtに書き込む
+            return False
+        #end try
+        return True
+    #end def
 
-        # 結果ファイルを一時保存するディレクトリー（無ければ作成）
-        self.dir2 = fld + "/out"
-        if not os.path.isdir(self.dir2):
-            os.mkdir(self.dir2)
-        #end if
+    #============================================================================
+    #  候補の索引から閾値以上の数値を選択して結果のページを作成する関数
+    #       pages   : 結果を作成するページ番号のリスト（索引にあるページ）
+    #============================================================================
 
-        p_file = fld + "/pdf/inputfile.pdf"
-        # PDFファイルを回転して保存
-        # def pdf_roll(p_file, p_angle):
-        file = pypdf.PdfReader(open(self.filename , 'rb'))
-        file_output = pypdf.PdfWriter()
-        for page in file.pages: 
-        # for page_num in range(file.numPages):
-            # page = file.getPage(page_num)
-            rotate = page.get('/Rotate', 0)
-            self.rotate.append(rotate)
-            if rotate != 0:
-                page.rotate(-rotate)
-            file_output.add_page(page)
-        with open(p_file, 'wb') as f:
-            file_output.write(f)
-
-        pagen = self.endpage - self.startpage + 1
-
-        self.fnames = []
-        rg = "0:1"
-        fname = self.dir1 + "/" + "file{:0=2}.pdf".format(0)
-        self.fnames.append(fname)
-        merger = pypdf.PdfMerger()
-        # merger.append(self.filename, pages=pypdf.PageRange(rg))
-        merger.append(p_file, pages=pypdf.PageRange(rg))
-        merger.write(fname)
-        merger.close()
-
-        for i in range(self.bunkatu):  
-            fname = self.dir1 + "/" + "file{:0=2}.pdf".format(i+1)
-            self.fnames.append(fname)
-            # shutil.copyfile(self.filename, fname)
-            shutil.copyfile(p_file, fname)
+    def IndexResult(self, IndexPages, pages):
+        n = 0
+        for pageI in pages:
+            if self.AddResult(pageI, IndexPages[pageI]):
+                n += 1
+            #end if
         #next
-        os.remove(p_file)
+        return n
     #end def
 
-    
-    #============================================================================
-    #  表紙から計算プログラムの種類を検出する関数
-    #============================================================================
-    def TopPageCheck(self):
-        global kind, version
-        CT = CheckTool()
-        self.kind, self.verison = CT.TopPageCheckTool(self.fnames[0],self.dir2,self.limit)
-        kind = self.kind
-        version = self.version
-    
+
     #============================================================================
-    #  複製された計算書から数値検出する関数
+    #  ワーカーから検定比の候補を受け取り、結果のページを作成する関数（すべてのワーカーがNoneを送るまで）
+    #       Noneを送っていないワーカーが終了した場合（エラー）は、残りのワーカーを止め（executor.Stop）、
+    #       すべてのワーカーが終了するまでキューを読み続ける（候補は使用しない）。
+    #       読むのをやめると、キューの空きを待っているワーカーが終了せずにFinishが戻らない
+    #       NewPages : 受け取った候補を追加する辞書
+    #       render   : Falseの場合は結果のページを作成しない（エラーの後始末）
+    #       戻り値   : ワーカー毎のProcessN, StageNのリスト、ワーカーの番号のリスト
     #============================================================================
 
-    def PageCheck(self,fname,outdir,psn,PageNumber,ProcessN):
-        CT = CheckTool()
-        CT.PageCheck(fname,outdir,self.limit,self.kind,self.version,psn,PageNumber,ProcessN)
+    def Collect(self, executor, run, NewPages, render=True):
+        done = 0
+        stopped = False
+        while done < len(run.ids):
+            try:
+                item = run.IndexQueue.get(timeout=1.0)
+            except queue.Empty:
+                if run.Alive() < len(run.ids) - done:
+                    stopped = True
+                    logging.error("{} : ワーカーが異常終了しました（検出結果は不完全です）".format(self.filename))
+                    break
+                #end if
+                continue
+            #end try
+            if item is None:
+                done += 1
+            else:
+                NewPages[item[0]] = item[1]
+                if render:
+                    self.AddResult(item[0], item[1])
+                #end if
+            #end if
+        #end while
+        if stopped:
+            executor.Stop(run)
+            while run.Alive() > 0:
+                try:
+                    run.IndexQueue.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+                #end try
+            #end while
+        #end if
+
+        # ワーカーの終了を待つ（WorkerPoolのワーカーは次の計算書のために返す）
+        ProcessN, StageN = executor.Finish(run, stopped)
+        return ProcessN, StageN, run.ids
+    #end def
 
 
     #============================================================================
     #  処理のメインルーチン関数
-    #       計算書の分割
     #       表示の読取り
     #       分割された計算書の並列処理
     #============================================================================
     def doCheck(self):
-        global kind, version
-
-        
-#       計算書の分割        
-        self.makepdf()
 
-#       表示の読取り
-        self.TopPageCheck()
+#       元の計算書の内容のダイジェスト（ページの抽出結果のキャッシュのキー）
+        self.digest = FileDigest(self.filename)
+
+#       検定比の候補の索引の読込み（索引にあるページは数値の検出を行わずに索引から結果を作成する）
+#       索引の計算プログラムの種類は表紙を読み取った後で確認する
+        Index = CandidateIndex(self.digest, EXTRACT_VERSION, "")
+        IndexKind, IndexPages = Index.Peek()
+
+#       結果の作成（ワーカーから候補が届いたページから順に作成し、１つの結果ファイルのページ番号の順の位置に追加する）
+#       計算書全体を出力する場合は、元の計算書に増分更新として追加する
+#       一覧（JSON・CSV・SQLite）を出力する場合は、PDFを作成せずに検出結果だけを保存する
+        if self.output == "book":
+            self.renderer = UpdateRenderer(self.srcfile)
+        elif self.output in RECORD_FORMATS:
+            self.renderer = ResultRecords(self.srcfile, self.output)
+        else:
+            self.renderer = ResultRenderer(self.srcfile)
+        #end if
 
 #       分割された計算書の並列処理
-        n = len(self.fnames)    
-        # 並列処理（マルチプロセスのオブジェクトを作成）    
-        Plist = list()
-
-        # if 並列化:
-        ProcessN = Array('i', range(self.bunkatu))
-        for i in range(self.bunkatu):
-            ProcessN[i] = 0
-        #next
-        PageNumber = Array('i', range(self.PageMax))
-        for i in range(self.PageMax):
-            PageNumber[i] += 1
-        #next
-        
-        for i, p in enumerate(PageNumber):
+        # 処理するページ（索引にあるページは除く）
+        PageNumber = []
+        IndexUsed = []
+        for p in range(1, self.PageMax + 1):
             if p < self.startpage or p > self.endpage:
-                PageNumber[i] = 0
+                continue
+            elif p in IndexPages:
+                IndexUsed.append(p)
+            else:
+                PageNumber.append(p)
             #end if
         #next
 
-        # for i, p in enumerate(PageNumber):
-        #     print(i,p)
-        # #next
+        # プロセス数（ページ数が少ない場合は並列処理を行わずにこのプロセスで処理する）
+        workers = WorkerCount(len(PageNumber), self.bunkatu)
+
+        # 処理の方法（WorkerPoolがある場合はそのワーカーを使用し、無い場合はself.backendの方法）
+        # WorkerPoolのワーカーの数は同時に処理するすべての計算書で共有するCPUの枠なので、
+        # ページ数が少ない場合もこのプロセスでは処理せずに１個のワーカーで処理する
+        pool = self.pool
+        if pool is not None:
+            workers = min(workers, pool.bunkatu)
+            if len(PageNumber) == 0 or not pool.Usable(len(PageNumber)):
+                pool = None
+            #end if
+        #end if
+        # WorkerPoolを使用しない場合も、計算書毎に起動するワーカーは共有の枠（self.slots）の中で起動する
+        if pool is not None:
+            executor = PoolExecutor(pool)
+        elif workers <= 1:
+            executor = SerialExecutor(self.slots)
+        else:
+            executor = EXECUTORS[self.backend](self.slots)
+        #end if
+        if executor.name == "serial":
+            workers = 1
+        #end if
+        run = None
+
+        # 索引にないページがある場合だけ処理を行う
+        if len(PageNumber) > 0:
+            # 各ページの情報を親プロセスで１回だけ読み取り、各プロセスは担当するページだけを読み込む
+            self.PageInfo = PageTable(self.srcfile)
+            if workers > 1:
+                # 処理時間の見込みが大きいページから配る（最後に重いページが残って他のプロセスが待たないように）
+                PageNumber.sort(key=lambda p: -self.PageInfo[p-1][3])
+            #end if
+            # 計算プログラムの種類は表紙を読み取った後でrun.Kindで知らせる
+            job = {"filename": self.srcfile, "limit": self.limit, "kind": None,
+                   "version": "", "digest": self.digest, "PageInfo": self.PageInfo}
+            if executor.overlap:
+                # 表紙の読取りを待たずにワーカーを起動し、ページの抽出を始める
+                run = executor.Start(job, PageNumber, workers)
+            #end if
+        #end if
+
+#       表示の読取り（ワーカーの起動・ページの抽出と並行して行う）
+        try:
+            self.TopPageCheck()
+        except:
+            # 起動したワーカーを待たせたままにしないように、終わらせてから（結果は使用しない）エラーにする
+            if run is not None:
+                run.Kind.Set("不明", "不明")
+                self.Collect(executor, run, {}, render=False)
+            #end if
+            raise
+        #end try
+        if run is not None:
+            run.Kind.Set(self.kind, self.version)
+        elif len(PageNumber) > 0:
+            job["kind"] = self.kind
+            job["version"] = self.version
+            run = executor.Start(job, PageNumber, workers)
+        #end if
+        # 表紙の結果のページ（ワーカーに計算プログラムの種類を知らせてから作成する）
+        self.renderer.Cover(self.limit)
+
+        # 索引の種類が違う場合は索引を使用しない（索引にあったページはワーカーの処理の後でこのプロセスで処理する）
+        Index.kind = self.kind
+        Retry = []
+        if IndexKind != self.kind:
+            Retry = IndexUsed
+            IndexPages = {}
+            IndexUsed = []
+        #end if
 
-        for i in range(n-1):
-            fname = self.fnames[i+1]
-            P = Process(target=self.PageCheck, args=([fname, self.dir2 , i, PageNumber, ProcessN]))
-            Plist.append(P)
-        #next
+        # 索引にあったページは閾値以上の数値を選択して結果を作成（ワーカーの処理と並行して行う）
+        IndexN = self.IndexResult(IndexPages, IndexUsed)
+        print("索引を使用したページ={} : 結果のあるページ={}".format(len(IndexUsed), IndexN))
 
-        # 各オブジェクトをスタート
-        for P in Plist:
-            P.start()
-        #next
+        # 各ワーカーから検定比の候補を受け取り、結果のページを作成する
+        NewPages = {}
+        if run is not None:
+            ProcessN, StageN, ids = self.Collect(executor, run, NewPages)
+        else:
+            ProcessN, StageN, ids = [0], [0, 0, 0, 0], [0]
+        #end if
+        if len(Retry) > 0:
+            if len(PageNumber) == 0:
+                self.PageInfo = PageTable(self.srcfile)
+            #end if
+            job = {"filename": self.srcfile, "limit": self.limit, "kind": self.kind,
+                   "version": self.version, "digest": self.digest, "PageInfo": self.PageInfo}
+            serial = SerialExecutor(self.slots)
+            self.Collect(serial, serial.Start(job, Retry, 1), NewPages)
+        #end if
+
+        # 今回検出したページを索引に追加して保存
+        if len(NewPages) > 0:
+            IndexPages.update(NewPages)
+            Index.Save(IndexPages)
+        #end if
 
-        # 各オブジェクトをジョイン（同期）
-        for P in Plist:
-            P.join()
-        #next
-        
         # else:
         #     for i in range(n-1):
-        #         fname = self.fnames[i+1]
+        #         fname = self.srcfile
         #         self.PageCheck(fname, self.dir2 , i, self.bunkatu)
         #     #next
         # #end if
 
-        for i,p in enumerate(ProcessN):
-            print("Process No={} : N={}".format(i,ProcessN[i]))
+        for i in ids:
+            print("Process No={} : N={} : 事前判定で除外={} : 見出し判定で除外={} : 数値検索={} : キャッシュ使用={}".format(
+                i,ProcessN[i],StageN[i*4],StageN[i*4+1],StageN[i*4+2],StageN[i*4+3]))
         #next
+        print("合計 : 事前判定で除外={} : 見出し判定で除外={} : 数値検索={} : キャッシュ使用={}".format(
+            sum(StageN[0::4]),sum(StageN[1::4]),sum(StageN[2::4]),sum(StageN[3::4])))
 
+        # キャッシュの容量を超えた古いページの抽出結果を削除
+        PageCache(self.digest, EXTRACT_VERSION).Trim()
 
-        # 結果フォルダーにあるファイル名の読取り
-        files = glob.glob(os.path.join(self.dir2, "*.pdf"))
-        # ファイルのソート
-        files.sort()
-
-        # 結果ファイルを順番に結合し、１つの結果ファイルを保存
-        merger = pypdf.PdfMerger()
-        file1 = self.dir1 + "/f1.pdf"
-        for i,file in enumerate(files):
-            if i == 0:
-                merger.append(file)
-            else:
-                n = int(file.replace(".pdf","")[-4:])
-                if self.rotate[n-1] != 0:
-                    f1 = pypdf.PdfReader(open(file , 'rb'))
-                    f2 = pypdf.PdfWriter()
-                    for page in f1.pages:
-                        rotate = self.rotate[n-1]
-                        if rotate != 0:
-                            page.rotate(rotate)
-                        f2.add_page(page)
-                    with open(file1, 'wb') as f:
-                        f2.write(f)
-                    merger.append(file1)
-                else:
-                    merger.append(file)
-                #end if
-            #end if
-            if os.path.exists(file1):
-                os.remove(file1)
-            #
-        #next
-        merger.write(self.pdf_out_file)
-        merger.close()
-
-        # 分割したPDFファイルを消去
-        for file in files:
-            os.remove(file)
 
-        # 結果ファイルを消去
-        for file in self.fnames:
-            os.remove(file)
+        # 結果ファイルを保存
+        self.renderer.Write(self.pdf_out_file)
+        self.renderer.Close()
 
-        if os.path.exists(file1):
-            os.remove(file1)
 
         return True
 
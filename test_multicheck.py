@@ -0,0 +1,95 @@
+#==========================================================================================
+#   multicheckの並列処理のテスト
+#
+#       python -m pytest -q test_multicheck.py
+#
+#==========================================================================================
+"""
+ワーカーが異常終了した場合に、multicheck.Collectが止まらずに戻ることを確認する。
+ワーカーの処理（RunPageCheck）はテスト用の関数に置き換えるので、計算書やフォントは使用しない。
+（置き換えた関数をワーカーのプロセスに引き継ぐため、forkで起動できる環境だけで実行する）
+"""
+import os
+import time
+import threading
+import multiprocessing
+
+import pytest
+
+import multicheck as MC
+
+pytestmark = pytest.mark.skipif(multiprocessing.get_start_method() != "fork",
+                                reason="ワーカーのプロセスをforkで起動する環境だけで実行")
+
+HITS = 3 * MC.RESULT_QUEUE      # 残りのワーカーが送る候補の数（キューの長さより多い）
+
+#============================================================================
+#  テスト用のワーカーの処理
+#       0番のワーカーはNoneを送らずにすぐに異常終了する。
+#       他のワーカーはCollectが異常終了を検出した後で、キューの長さより多い候補を送る
+#============================================================================
+def FakePageCheck(job, psn, Pages, ProcessN, StageN, IndexQueue, Kind=None, CT=None):
+    if psn == 0:
+        os._exit(1)
+    #end if
+    time.sleep(1.5)
+    for i in range(HITS):
+        IndexQueue.put((1000 * psn + i, {}))
+    #next
+    IndexQueue.put(None)
+#end def
+
+class FakeCheckTool:
+    pass
+#end class
+
+#============================================================================
+#  Collectを別のスレッドで実行し、timeout秒以内に戻ることを確認する関数
+#============================================================================
+def CollectWithTimeout(executor, run, timeout=30.0):
+    MCT = MC.multicheck.__new__(MC.multicheck)
+    MCT.filename = "test.pdf"
+    result = []
+    T = threading.Thread(target=lambda: result.append(MCT.Collect(executor, run, {}, render=False)), daemon=True)
+    T.start()
+    T.join(timeout)
+    if T.is_alive():
+        # テストの終了を妨げないように、止まったワーカーを強制終了してから失敗にする
+        for P in run.Plist:
+            P.terminate()
+        #next
+    #end if
+    assert not T.is_alive(), "Collectが戻らない"
+    return result[0]
+#end def
+
+@pytest.fixture
+def fake_worker(monkeypatch):
+    monkeypatch.setattr(MC, "RunPageCheck", FakePageCheck)
+    monkeypatch.setattr(MC, "CheckTool", FakeCheckTool)
+    monkeypatch.setattr(MC, "PreloadCMaps", lambda: None)
+#end def
+
+def test_process_worker_death(fake_worker):
+    slots = MC.WorkerSlots(3)
+    executor = MC.ProcessExecutor(slots)
+    run = executor.Start({}, [1, 2, 3], 3)
+    CollectWithTimeout(executor, run)
+    assert run.Alive() == 0
+    assert len(slots.Free) == 3
+#end def
+
+def test_pool_worker_death(fake_worker):
+    pool = MC.WorkerPool(3)
+    try:
+        executor = MC.PoolExecutor(pool)
+        run = executor.Start({}, [1, 2, 3], 3)
+        CollectWithTimeout(executor, run)
+        # 残りのワーカーも終了し、以後の計算書には使用しない（枠はWorkerPoolを使用しない計算書のために返す）
+        assert run.Alive() == 0
+        assert not pool.Usable(1)
+        assert len(pool.slots.Free) == 3
+    finally:
+        pool.Close(timeout=1.0)
+    #end try
+#end def